@@ -63,13 +63,11 @@ attribute.  For example:
 from OCC.Core import (AIS as _AIS, Aspect as _Aspect, gp as _gp,
                  Graphic3d as _Graphic3d, Prs3d as _Prs3d,
                  Quantity as _Quantity, TopAbs as _TopAbs, V3d as _V3d)
-from OCC.Core.BRepTools import BRepTools_WireExplorer as _BRepTools_WireExplorer
 from OCC.Core.HLRAlgo import HLRAlgo_Projector as _HLRAlgo_Projector
 from OCC.Core.HLRBRep import (HLRBRep_Algo as _HLRBRep_Algo,
                          HLRBRep_HLRToShape as _HLRBRep_HLRToShape)
 # from OCC.TCollection import (TCollection_ExtendedString as
 #                                                   TCollection_ExtendedString)
-from OCC.Core.TopExp import TopExp_Explorer as _TopExp_Explorer
 
 # TODO : the following import breaks when migrating from OCC 0.16.2 to 0.17
 # from OCC.Visual3d import Visual3d_ViewOrientation as _Visual3d_ViewOrientation
@@ -702,6 +700,9 @@ class ViewQt(QtWidgets.QWidget):
                          'line_width': line_width}
         if logging:
             self.display_shapes.append(display_shape)
+        # Triangulate faces through the mesh cache, so shapes already
+        # meshed for export (or displayed before) aren't meshed again
+        _cm._warm_triangulation(s)
         aisshape = _AIS.AIS_Shape(s)
         handle_aisshape = aisshape.GetHandle()
 
@@ -715,6 +716,8 @@ class ViewQt(QtWidgets.QWidget):
 
         handle_drawer = aisshape.Attributes()
         drawer = handle_drawer.GetObject()
+        if hasattr(drawer, 'SetAutoTriangulation'):
+            drawer.SetAutoTriangulation(False)
 
         qcolor = _Quantity.Quantity_Color(color[0], color[1], color[2],
                                           _Quantity.Quantity_TOC_RGB)
@@ -815,43 +818,27 @@ class ViewQt(QtWidgets.QWidget):
 
     # Selection Functions
     def _build_hashes(self, htype):
-        if htype == 'Face':
-            ex_type = _TopAbs.TopAbs_FACE
-        elif htype == 'Wire':
-            ex_type = _TopAbs.TopAbs_WIRE
-        elif htype == 'Edge':
-            ex_type = _TopAbs.TopAbs_EDGE
-        elif htype == 'Vertex':
-            ex_type = _TopAbs.TopAbs_VERTEX
-        else:
+        if htype not in ['Face', 'Wire', 'Edge', 'Vertex']:
             print('Error: Unknown hash type', htype)
-        if (self.selected_shape.ShapeType == _TopAbs.TopAbs_WIRE and
-                    htype == 'Edge'):
-            ex = _BRepTools_WireExplorer(self.selected_shape)  # Ordered this way
-        else:
-            ex = _TopExp_Explorer(self.selected_shape, ex_type)
-        self.hashes = []
+        # Ordered this way for wire edges
+        ordered = self.selected_shape.ShapeType() == _TopAbs.TopAbs_WIRE
+        self.hashes = _cm._SubshapeIndex(self.selected_shape, htype,
+                                         ordered_edges=ordered)
         self.positions = []
-        while ex.More():
-            s1 = ex.Current()
-            # Calculate hash
-            s1_hash = s1.__hash__()
-            if s1_hash not in self.hashes:
-                self.hashes.append(s1_hash)
-                # Calculate position
-                if htype == 'Face':
-                    f = _cm.Face(s1)
-                    c = (' type ' + f.type(), f.center())
-                elif htype == 'Wire':
-                    w = _cm.Wire(s1)
-                    c = ('', w.center())
-                elif htype == 'Edge':
-                    e = _cm.Edge(s1)
-                    c = ('', e.center())
-                elif htype == 'Vertex':
-                    c = ('', _cm.Vertex(s1).center())
-                self.positions.append(c)
-            ex.Next()
+        for s1 in self.hashes:
+            # Calculate position
+            if htype == 'Face':
+                f = _cm.Face(s1)
+                c = (' type ' + f.type(), f.center())
+            elif htype == 'Wire':
+                w = _cm.Wire(s1)
+                c = ('', w.center())
+            elif htype == 'Edge':
+                e = _cm.Edge(s1)
+                c = ('', e.center())
+            elif htype == 'Vertex':
+                c = ('', _cm.Vertex(s1).center())
+            self.positions.append(c)
 
     def make_selection(self, event=None):
         """Called when a shape is selected
@@ -865,9 +852,8 @@ class ViewQt(QtWidgets.QWidget):
             if self.selection_type == 'shape':
                 self.selected_shape = self.selected
             else:
-                h = self.selected.__hash__()
                 try:
-                    index = self.hashes.index(h)
+                    index = self.hashes.index(self.selected)
                 except ValueError:
                     index = -1
                 if index == -1:
@@ -19,8 +19,15 @@ View LICENSE for details.
 """
 from __future__ import print_function
 
+from contextlib import contextmanager
 import logging
 import os
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import copy as _copy
+import threading as _threading
+import types as _types
 import pdb
 from os import path as _path
 import sys
@@ -29,11 +36,16 @@ if sys.version_info[0] < 3:
 else:
     PY3 = True
 import re as _re  # Needed for svg
+import tempfile as _tempfile
+import hashlib as _hashlib
+import json as _json
+import time as _time
 import math as _math
 if PY3 is True:
-    from urllib.request import urlopen
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
 else:
-    from urllib import urlopen
+    from urllib2 import urlopen, Request, HTTPError
 # import imp
 import importlib.util
 
@@ -42,11 +54,16 @@ import matplotlib.pyplot as plt
 # import networkx as nx
 import numpy as np
 import numpy.linalg as la
+try:
+    from scipy.spatial import cKDTree as _cKDTree
+except ImportError:  # scipy is optional; nearest() falls back to numpy
+    _cKDTree = None
 
 # from OCC.ChFi3d import *
 # from OCC.BlockFix import *
 from OCC.Core.Bnd import Bnd_Box as _Bnd_Box
 # from OCC.BOP import *
+from OCC.Core import BOPAlgo as _BOPAlgo
 from OCC.Core.BRep import (BRep_Builder as _BRep_Builder, BRep_Tool as _BRep_Tool,
                       BRep_Tool_Surface as _BRep_Tool_Surface)
 from OCC.Core import BRepAlgo as _BRepAlgo
@@ -54,18 +71,31 @@ from OCC.Core import BRepAlgoAPI as _BRepAlgoAPI
 from OCC.Core.BRepBndLib import brepbndlib_Add as _brepbndlib_Add
 from OCC.Core import BRepBuilderAPI as _BRepBuilderAPI
 from OCC.Core.BRepCheck import BRepCheck_Analyzer as _BRepCheck_Analyzer
+from OCC.Core.BRepClass import (BRepClass_FaceClassifier as
+                                _BRepClass_FaceClassifier)
+from OCC.Core.BRepExtrema import (BRepExtrema_DistShapeShape as
+                             _BRepExtrema_DistShapeShape)
 from OCC.Core.BRepFeat import BRepFeat_Gluer as _BRepFeat_Gluer
 from OCC.Core import BRepFilletAPI as _BRepFilletAPI
+from OCC.Core.BRepMesh import (BRepMesh_IncrementalMesh as
+                          _BRepMesh_IncrementalMesh)
 from OCC.Core.BRepGProp import\
     (brepgprop_VolumeProperties as _brepgprop_VolumeProperties,
      brepgprop_LinearProperties as _brepgprop_LinearProperties,
-     brepgprop_SurfaceProperties as _brepgprop_SurfaceProperties)
+     brepgprop_SurfaceProperties as _brepgprop_SurfaceProperties,
+     BRepGProp_Face as _BRepGProp_Face)
 from OCC.Core import BRepOffsetAPI as _BRepOffsetAPI
 from OCC.Core import BRepOffset as _BRepOffset
 from OCC.Core import BRepPrimAPI as _BRepPrimAPI
 from OCC.Core import BRepTools as _BRepTools
 from OCC.Core.BRepTools import (breptools_Read as _breptools_Read,
                            breptools_Write as _breptools_Write)
+try:  # Binary BREP, OCC 7.3+
+    from OCC.Core.BinTools import (bintools_Read as _bintools_Read,
+                                   bintools_Write as _bintools_Write)
+except ImportError:
+    _bintools_Read = None
+    _bintools_Write = None
 from OCC.Core.GC import (GC_MakeArcOfCircle as _GC_MakeArcOfCircle,
                     GC_MakeArcOfEllipse as _GC_MakeArcOfEllipse)
 from OCC.Core.GCPnts import (GCPnts_QuasiUniformDeflection as
@@ -75,7 +105,10 @@ from OCC.Core.Geom import Geom_BezierCurve as _Geom_BezierCurve
 from OCC.Core import GeomAbs as _GeomAbs
 from OCC.Core.GeomAdaptor import (GeomAdaptor_Curve as _GeomAdaptor_Curve,
                              GeomAdaptor_Surface as _GeomAdaptor_Surface)
-from OCC.Core.GeomAPI import GeomAPI_PointsToBSpline as _GeomAPI_PointsToBSpline
+from OCC.Core.GeomAPI import (GeomAPI_PointsToBSpline as
+                               _GeomAPI_PointsToBSpline,
+                               GeomAPI_ProjectPointOnSurf as
+                               _GeomAPI_ProjectPointOnSurf)
 from OCC.Core import gp as _gp
 from OCC.Core.GProp import GProp_GProps as _GProp_GProps
 from OCC.Core import IFSelect as _IFSelect
@@ -83,16 +116,31 @@ from OCC.Core.IGESControl import (IGESControl_Controller as _IGESControl_Control
                              IGESControl_Reader as _IGESControl_Reader,
                              IGESControl_Writer as _IGESControl_Writer)
 from OCC.Core.Interface import (
+            Interface_Static_CVal as _Interface_Static_CVal,
+            Interface_Static_IVal as _Interface_Static_IVal,
+            Interface_Static_RVal as _Interface_Static_RVal,
             Interface_Static_SetCVal as _Interface_Static_SetCVal,
             Interface_Static_SetIVal as _Interface_Static_SetIVal,
             Interface_Static_SetRVal as _Interface_Static_SetRVal)
 from OCC.Core.LocOpe import LocOpe_FindEdges as _LocOpe_FindEdges
 from OCC.Core.ShapeFix import ShapeFix_Shape as _ShapeFix_Shape
+from OCC.Core.ShapeUpgrade import (ShapeUpgrade_UnifySameDomain as
+                              _ShapeUpgrade_UnifySameDomain)
+from OCC.Core.STEPCAFControl import (STEPCAFControl_Reader as
+                                     _STEPCAFControl_Reader)
 from OCC.Core import STEPControl as _STEPControl
+from OCC.Core import StepBasic as _StepBasic
+from OCC.Core import StepRepr as _StepRepr
 from OCC.Core.StlAPI import StlAPI_Writer as _StlAPI_Writer
 from OCC.Core.TColgp import TColgp_Array1OfPnt as _TColgp_Array1OfPnt
 from OCC.Core.TColStd import TColStd_Array1OfReal as _TColStd_Array1OfReal
+from OCC.Core.TCollection import (TCollection_ExtendedString as
+                                  _TCollection_ExtendedString)
+from OCC.Core.TDF import (TDF_Label as _TDF_Label,
+                          TDF_LabelSequence as _TDF_LabelSequence)
+from OCC.Core import TDocStd as _TDocStd
 from OCC.Core import TopAbs as _TopAbs
+from OCC.Core.TopLoc import TopLoc_Location as _TopLoc_Location
 from OCC.Core.TopoDS import (topods_Edge as _TopoDS_edge,
                         topods_Face as _TopoDS_face,
                         topods_Solid as _TopoDS_solid,
@@ -104,6 +152,7 @@ from OCC.Core.TopoDS import (topods_Edge as _TopoDS_edge,
                         TopoDS_Shape as _TopoDS_Shape)
 from OCC.Core import TopoDS as _TopoDS
 from OCC.Core.TopExp import (TopExp_Explorer as _TopExp_Explorer,
+                        topexp_MapShapes as _TopExp_MapShapes,
                         topexp_MapShapesAndAncestors as
                         _TopExp_MapShapesAndAncestors)
 from OCC.Core.TopOpeBRep import (TopOpeBRep_FacesIntersector as
@@ -111,30 +160,55 @@ from OCC.Core.TopOpeBRep import (TopOpeBRep_FacesIntersector as
 from OCC.Core.TopOpeBRepTool import (TopOpeBRepTool_FuseEdges as
                                 _TopOpeBRepTool_FuseEdges)
 from OCC.Core import TopTools as _TopTools
+from OCC.Core import XCAFApp as _XCAFApp
+from OCC.Core import XCAFDoc as _XCAFDoc
 
 # Even though this might look like mixing model and display code, X3DomRenderer
 # is used to export an html/x3d representation (just like STEP, STL ...)
 from OCC.Display.WebGl.x3dom_renderer import X3DomRenderer
 
+try:
+    from ccad import __version__ as _ccad_version
+except ImportError:
+    _ccad_version = 'unknown'
+try:
+    from OCC import VERSION as _occ_version
+except ImportError:
+    _occ_version = 'unknown'
+
 logger = logging.getLogger(__name__)
 
 # Shape Functions
 
 
-def _transform(s1, matrix):
-    r"""
+def _apply_trsf(s1, m, lazy=False):
+    r"""Applies the gp_Trsf m to s1
+
+    With lazy, a rigid m is only recorded in the shape location, without
+    copying the geometry (see Shape.materialize).  Mirrors and scalings
+    can't be held in a location, so they are always copied.
 
     Parameters
     ----------
-
     s1 : Shape
-    matrix: 3 lines, 4 columns
+    m : gp_Trsf
+    lazy : bool, optional (default is False)
 
     Returns
     -------
-    transformed shape
+    The transformed shape
 
     """
+    if (lazy and not m.IsNegative() and
+            abs(m.ScaleFactor() - 1.0) < 1e-12):
+        return s1.shape.Moved(_TopLoc_Location(m))
+    trf = _BRepBuilderAPI.BRepBuilderAPI_Transform(m)
+    trf.Perform(s1.shape, True)
+    return trf.Shape()
+
+
+def _matrix_trsf(matrix):
+    r"""Returns the gp_Trsf of matrix (3 lines, 4 columns at least)"""
     m = _gp.gp_Trsf()
     # for i in range(3):
     #     for j in range(4):
@@ -151,9 +225,100 @@ def _transform(s1, matrix):
                 matrix[2][1],
                 matrix[2][2],
                 matrix[2][3])
-    trf = _BRepBuilderAPI.BRepBuilderAPI_Transform(m)
-    trf.Perform(s1.shape, True)
-    return trf.Shape()
+    return m
+
+
+def _translation_trsf(pdir):
+    r"""Returns the gp_Trsf of a translation by pdir"""
+    m = _gp.gp_Trsf()
+    m.SetTranslation(_gp.gp_Vec(pdir[0], pdir[1], pdir[2]))
+    return m
+
+
+def _rotation_trsf(pabout, pdir, angle):
+    r"""Returns the gp_Trsf of a rotation by angle about the axis through
+    pabout in direction pdir"""
+    m = _gp.gp_Trsf()
+    m.SetRotation(_gp.gp_Ax1(_gp.gp_Pnt(pabout[0], pabout[1], pabout[2]),
+                             _gp.gp_Dir(pdir[0], pdir[1], pdir[2])), angle)
+    return m
+
+
+def _mirror_trsf(pabout, pdir):
+    r"""Returns the gp_Trsf of a mirror about the plane through pabout
+    normal to pdir"""
+    m = _gp.gp_Trsf()
+    m.SetMirror(_gp.gp_Ax2(_gp.gp_Pnt(pabout[0], pabout[1], pabout[2]),
+                           _gp.gp_Dir(pdir[0], pdir[1], pdir[2])))
+    return m
+
+
+def _scale_trsf(sf):
+    r"""Returns the gp_Trsf of a uniform scaling by sf about the origin"""
+    m = _gp.gp_Trsf()
+    m.SetScale(_gp.gp_Pnt(0.0, 0.0, 0.0), sf)
+    return m
+
+
+def _chain_trsf(steps):
+    r"""Composes a sequence of transformations into a single gp_Trsf
+
+    Parameters
+    ----------
+    steps : list[tuple]
+        Applied in order.  Each step is one of ('translate', pdir),
+        ('rotate', pabout, pdir, angle), ('rotatex', angle),
+        ('rotatey', angle), ('rotatez', angle), ('mirror', pabout, pdir),
+        ('scale', sf) or ('transform', matrix)
+
+    Returns
+    -------
+    gp_Trsf
+
+    """
+    origin = (0.0, 0.0, 0.0)
+    axes = {'rotatex': (1.0, 0.0, 0.0),
+            'rotatey': (0.0, 1.0, 0.0),
+            'rotatez': (0.0, 0.0, 1.0)}
+    m = _gp.gp_Trsf()
+    for step in steps:
+        name, args = step[0], step[1:]
+        if name == 'translate':
+            t = _translation_trsf(*args)
+        elif name == 'rotate':
+            t = _rotation_trsf(*args)
+        elif name in axes:
+            t = _rotation_trsf(origin, axes[name], *args)
+        elif name == 'mirror':
+            t = _mirror_trsf(*args)
+        elif name == 'scale':
+            t = _scale_trsf(*args)
+        elif name == 'transform':
+            t = _matrix_trsf(*args)
+        else:
+            msg = 'Error: Unknown transformation %s' % str(name)
+            logger.error(msg)
+            raise ValueError(msg)
+        m.PreMultiply(t)
+    return m
+
+
+def _transform(s1, matrix, lazy=False):
+    r"""
+
+    Parameters
+    ----------
+
+    s1 : Shape
+    matrix: 3 lines, 4 columns
+    lazy : bool, optional (default is False)
+
+    Returns
+    -------
+    transformed shape
+
+    """
+    return _apply_trsf(s1, _matrix_trsf(matrix), lazy)
 
 
 def _unitary(s1, U):
@@ -191,24 +356,21 @@ def _unitary(s1, U):
     return s2.shape
 
 
-def _translate(s1, pdir):
+def _translate(s1, pdir, lazy=False):
     r"""Translate s1 in pdir
 
     Parameters
     ----------
     s1
     pdir
+    lazy : bool, optional (default is False)
 
     Returns
     -------
     The translated shape
 
     """
-    m = _gp.gp_Trsf()
-    m.SetTranslation(_gp.gp_Vec(pdir[0], pdir[1], pdir[2]))
-    trf = _BRepBuilderAPI.BRepBuilderAPI_Transform(m)
-    trf.Perform(s1.shape, True)
-    return trf.Shape()
+    return _apply_trsf(s1, _translation_trsf(pdir), lazy)
 
 def _unitary_old(s1, U):
     r""" unitary transformation
@@ -264,27 +426,24 @@ def _unitary_old(s1, U):
     return trf.Shape()
 
 
-def _translate(s1, pdir):
+def _translate(s1, pdir, lazy=False):
     r"""Translate s1 in pdir
 
     Parameters
     ----------
     s1
     pdir
+    lazy : bool, optional (default is False)
 
     Returns
     -------
     The translated shape
 
     """
-    m = _gp.gp_Trsf()
-    m.SetTranslation(_gp.gp_Vec(pdir[0], pdir[1], pdir[2]))
-    trf = _BRepBuilderAPI.BRepBuilderAPI_Transform(m)
-    trf.Perform(s1.shape, True)
-    return trf.Shape()
+    return _apply_trsf(s1, _translation_trsf(pdir), lazy)
 
 
-def _rotate(s1, pabout, pdir, angle):
+def _rotate(s1, pabout, pdir, angle, lazy=False):
     r"""
 
     Parameters
@@ -295,6 +454,7 @@ def _rotate(s1, pabout, pdir, angle):
     pdir : tuple[float]
         The axis direction vector coordinates
     angle : float
+    lazy : bool, optional (default is False)
 
     Returns
     -------
@@ -302,12 +462,7 @@ def _rotate(s1, pabout, pdir, angle):
 
 
     """
-    m = _gp.gp_Trsf()
-    m.SetRotation(_gp.gp_Ax1(_gp.gp_Pnt(pabout[0], pabout[1], pabout[2]),
-                             _gp.gp_Dir(pdir[0], pdir[1], pdir[2])), angle)
-    trf = _BRepBuilderAPI.BRepBuilderAPI_Transform(m)
-    trf.Perform(s1.shape, True)
-    return trf.Shape()
+    return _apply_trsf(s1, _rotation_trsf(pabout, pdir, angle), lazy)
 
 
 def _mirror(s1, pabout, pdir):
@@ -324,12 +479,7 @@ def _mirror(s1, pabout, pdir):
     The mirrored shape
 
     """
-    m = _gp.gp_Trsf()
-    m.SetMirror(_gp.gp_Ax2(_gp.gp_Pnt(pabout[0], pabout[1], pabout[2]),
-                           _gp.gp_Dir(pdir[0], pdir[1], pdir[2])))
-    trf = _BRepBuilderAPI.BRepBuilderAPI_Transform(m)
-    trf.Perform(s1.shape, True)
-    return trf.Shape()
+    return _apply_trsf(s1, _mirror_trsf(pabout, pdir))
 
 
 def _scale(s1, sx=1.0, sy=1.0, sz=1.0):
@@ -375,6 +525,27 @@ def transformed(s1, matrix):
     return s2
 
 
+def transform_chained(s1, steps, lazy=False):
+    r"""
+    Returns a new shape which is s1 transformed by all steps, composed
+    into a single transformation so the geometry is copied once (or not
+    at all with lazy).
+
+    Parameters
+    ----------
+    s1
+    steps : list[tuple]
+        See Shape.transform_chain
+    lazy : bool, optional (default is False)
+
+    Returns
+    -------
+    A new shape which is s1 transformed by all steps.
+
+    """
+    return globals()[s1.stype](_apply_trsf(s1, _chain_trsf(steps), lazy))
+
+
 def unitaryed(s1, matrix):
     r"""
     Returns a new shape which is s1 unitary transformes.
@@ -706,6 +877,79 @@ def _raw_faces_same_domain(f1, f2, skip_fits=0):
             return 0
 
 
+def _canonical_direction(d):
+    r"""
+    Returns the unit vector d (an np.array) with its sign chosen so the
+    first non-zero component is positive.
+
+    Parameters
+    ----------
+    d : np.array
+
+    """
+    for v in d:
+        if abs(v) > 1e-9:
+            return d if v > 0.0 else -d
+    return d
+
+
+def _face_domain_key(f1, tolerance=1e-6):
+    """
+    Returns a hashable signature of the surface underlying raw face f1,
+    equal for faces lying on the same analytic surface (plane,
+    cylinder, cone, sphere or torus).  Returns None for other surface
+    types.
+
+    Parameters
+    ----------
+    f1 : raw face
+    tolerance : float, optional (default is 1e-6)
+        Parameters are rounded to this precision
+
+    Returns
+    -------
+    tuple or None
+
+    """
+    a = _GeomAdaptor_Surface(_BRep_Tool_Surface(_TopoDS_face(f1)))
+    t1 = a.GetType()
+
+    def vec(xyz):
+        return np.array([xyz.X(), xyz.Y(), xyz.Z()])
+
+    def axis_line(ax1):
+        # A line is the closest point to the origin and a direction
+        d = _canonical_direction(vec(ax1.Direction()))
+        p = vec(ax1.Location())
+        return tuple(p - np.dot(p, d) * d) + tuple(d)
+
+    if t1 == _GeomAbs.GeomAbs_Plane:
+        ax1 = a.Plane().Axis()
+        n = _canonical_direction(vec(ax1.Direction()))
+        values = tuple(n) + (np.dot(n, vec(ax1.Location())),)
+    elif t1 == _GeomAbs.GeomAbs_Cylinder:
+        c = a.Cylinder()
+        values = axis_line(c.Axis()) + (c.Radius(),)
+    elif t1 == _GeomAbs.GeomAbs_Cone:
+        c = a.Cone()
+        values = (tuple(vec(c.Apex())) +
+                  tuple(_canonical_direction(vec(c.Axis().Direction()))) +
+                  (abs(c.SemiAngle()),))
+    elif t1 == _GeomAbs.GeomAbs_Sphere:
+        c = a.Sphere()
+        values = tuple(vec(c.Location())) + (c.Radius(),)
+    elif t1 == _GeomAbs.GeomAbs_Torus:
+        c = a.Torus()
+        ax1 = c.Axis()
+        values = (tuple(vec(ax1.Location())) +
+                  tuple(_canonical_direction(vec(ax1.Direction()))) +
+                  (c.MajorRadius(), c.MinorRadius()))
+    else:
+        return None
+    # + 0.0 turns -0.0 into 0.0
+    return (int(t1),) + tuple(np.round(np.array(values) / tolerance) + 0.0)
+
+
 def _raw_faces_merge(f1, f2):
     """
     Merges two raw faces in the same domain that share common edge(s)
@@ -869,6 +1113,40 @@ def _raw_faces_merge(f1, f2):
 
 
 # Solid Functions
+_boolean_builders = {'fuse': _BRepAlgoAPI.BRepAlgoAPI_Fuse,
+                     'cut': _BRepAlgoAPI.BRepAlgoAPI_Cut,
+                     'common': _BRepAlgoAPI.BRepAlgoAPI_Common}
+
+
+def _boolean(operation, s1, s2, refine):
+    r"""
+    Performs the boolean operation ('fuse', 'cut' or 'common') between
+    s1 and s2, through the boolean cache when it is enabled.
+
+    Parameters
+    ----------
+    operation : str
+    s1 : Shape
+    s2 : Shape
+    refine : int
+
+    Returns
+    -------
+    Solid
+
+    """
+    def compute():
+        b1 = _boolean_builders[operation](s1.shape, s2.shape)
+        if refine:
+            # Fuses edges along the way however doesn't fuse faces
+            b1.RefineEdges()
+        return Solid(b1.Shape())
+
+    if _boolean_cache is None:
+        return compute()
+    return _boolean_cache.result(operation, s1, s2, refine, compute)
+
+
 def fuse(s1, s2, refine=0):
     """
     Performs a boolean fuse between solids s1 and s2 and returns the
@@ -886,11 +1164,7 @@ def fuse(s1, s2, refine=0):
 
     """
     # return solid(BRepAlgoAPI_Fuse(s1.shape, s2.shape).Shape())
-    b1 = _BRepAlgoAPI.BRepAlgoAPI_Fuse(s1.shape, s2.shape)
-    if refine:
-        # Fuses edges along the way however doesn't fuse faces
-        b1.RefineEdges()
-    return Solid(b1.Shape())
+    return _boolean('fuse', s1, s2, refine)
 
 
 def old_fuse(s1, s2):
@@ -927,10 +1201,7 @@ def cut(s1, s2, refine=0):
     A new solid made by cutting s1 by s2
 
     """
-    b1 = _BRepAlgoAPI.BRepAlgoAPI_Cut(s1.shape, s2.shape)
-    if refine:
-        b1.RefineEdges()
-    return Solid(b1.Shape())
+    return _boolean('cut', s1, s2, refine)
 
 
 def old_cut(s1, s2):
@@ -967,10 +1238,7 @@ def common(s1, s2, refine=0):
     The common solid of s1 and s2 as a new solid
 
     """
-    b1 = _BRepAlgoAPI.BRepAlgoAPI_Common(s1.shape, s2.shape)
-    if refine:
-        b1.RefineEdges()
-    return Solid(b1.Shape())
+    return _boolean('common', s1, s2, refine)
 
 
 def old_common(s1, s2):
@@ -991,6 +1259,210 @@ def old_common(s1, s2):
     return Solid(_BRepAlgo.BRepAlgo_Common(s1.shape, s2.shape).Shape())
 
 
+def _list_of_shapes(shapes):
+    r"""
+    Returns a TopTools_ListOfShape of the raw shapes of shapes.
+
+    Parameters
+    ----------
+    shapes : list[Shape]
+
+    """
+    l1 = _TopTools.TopTools_ListOfShape()
+    for s in shapes:
+        l1.Append(s.shape)
+    return l1
+
+
+_glue_modes = {None: _BOPAlgo.BOPAlgo_GlueOff,
+               'shift': _BOPAlgo.BOPAlgo_GlueShift,
+               'full': _BOPAlgo.BOPAlgo_GlueFull}
+
+
+def _boolean_options(b1, parallel, fuzzy, glue_mode):
+    r"""
+    Sets the options shared by the multi-operand boolean operations on
+    the builder b1.
+
+    Parameters
+    ----------
+    b1 : BRepAlgoAPI_BooleanOperation or BOPAlgo_CellsBuilder
+    parallel : bool
+    fuzzy : float or None
+    glue_mode : None, 'shift' or 'full'
+
+    """
+    if glue_mode not in _glue_modes:
+        msg = 'Error: Unknown glue mode %s' % str(glue_mode)
+        logger.error(msg)
+        raise ValueError(msg)
+    b1.SetRunParallel(parallel)
+    if fuzzy is not None:
+        b1.SetFuzzyValue(fuzzy)
+    b1.SetGlue(_glue_modes[glue_mode])
+
+
+def _refine_edges(raw_shape, operands):
+    r"""
+    Returns raw_shape with its C1 continuous edges fused, except the
+    edges of the operands, as BRepAlgoAPI_BooleanOperation.RefineEdges
+    does.
+
+    Parameters
+    ----------
+    raw_shape : TopoDS_Shape
+    operands : list[Solid]
+
+    """
+    avoided = _TopTools.TopTools_IndexedMapOfShape()
+    for s in operands:
+        _TopExp_MapShapes(s.shape, _TopAbs.TopAbs_EDGE, avoided)
+    b = _TopOpeBRepTool_FuseEdges(raw_shape)
+    b.AvoidEdges(avoided)
+    return b.Shape()
+
+
+def _boolean_all(b1, arguments, tools, refine, parallel, fuzzy, glue_mode):
+    r"""
+    Runs the boolean operation b1 of arguments by tools in one pass and
+    returns the result as a new solid.
+
+    Parameters
+    ----------
+    b1 : BRepAlgoAPI_BooleanOperation
+    arguments : list[Solid]
+    tools : list[Solid]
+    refine : int
+    parallel : bool
+    fuzzy : float or None
+    glue_mode : None, 'shift' or 'full'
+
+    """
+    b1.SetArguments(_list_of_shapes(arguments))
+    b1.SetTools(_list_of_shapes(tools))
+    _boolean_options(b1, parallel, fuzzy, glue_mode)
+    b1.Build()
+    if not b1.IsDone():
+        msg = 'Error: Boolean operation failed'
+        logger.error(msg)
+        raise RuntimeError(msg)
+    if refine:
+        b1.RefineEdges()
+    return Solid(b1.Shape())
+
+
+def fuse_all(solids, refine=0, parallel=False, fuzzy=None, glue_mode=None):
+    """
+    Performs a boolean fuse of all solids in one pass and returns the
+    result as a new solid.  Much faster than chaining fuse() (or +) on
+    many operands, since each operand is intersected only once.
+
+    Parameters
+    ----------
+    solids : list[Solid]
+    refine : int, optional (default is 0)
+    parallel : bool, optional (default is False)
+        Run the intersections in parallel threads
+    fuzzy : float, optional (default is None)
+        Additional tolerance for nearly coincident geometry
+    glue_mode : None, 'shift' or 'full', optional (default is None)
+        Gluing option for operands sharing coincident faces but not
+        otherwise interfering ('full' is fastest, 'shift' for partial
+        coincidence)
+
+    Returns
+    -------
+    A new solid that is the fusion of all solids
+
+    Raises
+    ------
+    ValueError : if solids is empty
+
+    """
+    if not solids:
+        msg = 'Error: No solids to fuse'
+        logger.error(msg)
+        raise ValueError(msg)
+    if len(solids) == 1:
+        return solids[0].copy()
+    return _boolean_all(_BRepAlgoAPI.BRepAlgoAPI_Fuse(), solids[:1],
+                        solids[1:], refine, parallel, fuzzy, glue_mode)
+
+
+def cut_all(base, tools, refine=0, parallel=False, fuzzy=None,
+            glue_mode=None):
+    """
+    Performs a boolean cut of base by all tools in one pass and returns
+    the result as a new solid.
+
+    Parameters
+    ----------
+    base : Solid
+    tools : list[Solid]
+    refine : int, optional (default is 0)
+    parallel : bool, optional (default is False)
+    fuzzy : float, optional (default is None)
+    glue_mode : None, 'shift' or 'full', optional (default is None)
+
+    Returns
+    -------
+    A new solid made by cutting base by all tools
+
+    """
+    if not tools:
+        return base.copy()
+    return _boolean_all(_BRepAlgoAPI.BRepAlgoAPI_Cut(), [base], tools,
+                        refine, parallel, fuzzy, glue_mode)
+
+
+def common_all(solids, refine=0, parallel=False, fuzzy=None,
+               glue_mode=None):
+    """
+    Performs a boolean common of all solids in one pass and returns the
+    result as a new solid.
+
+    A multi-operand BRepAlgoAPI_Common intersects the union of its
+    arguments with the union of its tools, so the cells shared by every
+    solid are selected with BOPAlgo_CellsBuilder instead.  refine fuses
+    the new edges as fuse, cut and common do.
+
+    Parameters
+    ----------
+    solids : list[Solid]
+    refine : int, optional (default is 0)
+    parallel : bool, optional (default is False)
+    fuzzy : float, optional (default is None)
+    glue_mode : None, 'shift' or 'full', optional (default is None)
+
+    Returns
+    -------
+    The common solid of all solids as a new solid
+
+    Raises
+    ------
+    ValueError : if solids is empty
+
+    """
+    if not solids:
+        msg = 'Error: No solids to intersect'
+        logger.error(msg)
+        raise ValueError(msg)
+    if len(solids) == 1:
+        return solids[0].copy()
+    b1 = _BOPAlgo.BOPAlgo_CellsBuilder()
+    b1.SetArguments(_list_of_shapes(solids))
+    _boolean_options(b1, parallel, fuzzy, glue_mode)
+    b1.Perform()
+    if b1.HasErrors():
+        msg = 'Error: Boolean operation failed'
+        logger.error(msg)
+        raise RuntimeError(msg)
+    b1.AddToResult(_list_of_shapes(solids), _TopTools.TopTools_ListOfShape())
+    if refine:
+        return Solid(_refine_edges(b1.Shape(), solids))
+    return Solid(b1.Shape())
+
+
 def _fillet_boolean(b1, rad):
     r"""
 
@@ -1190,52 +1662,245 @@ def chamfer_common(s1, s2, dist):
         return common(s1, s2)
 
 
-# def glue(s1, s2, face_pairs=[]):
-def glue(s1, s2, face_pairs=None):
-    """
-    Glues solids s1 and s2 together at the face_pairs.  face_pairs is
-    a list of tuples.  Each tuple represents face indices that should
-    be glued.
+def _face_samples(f1, tolerance, count=5):
+    r"""
+    Returns sample points of raw face f1 and the outward normals there
+    (accounting for the face orientation): the points of a count x
+    count grid over its parametric bounds classified IN the face, the
+    grid being refined while none is (faces with holes, non-convex or
+    periodic faces), and its vertices.
 
     Parameters
     ----------
-    s1
-    s2
-    face_pairs : list, optional (default is an empty list)
+    f1 : raw face
+    tolerance : float
+    count : int, optional (default is 5)
 
     Returns
     -------
-    solid
+    tuple(list, list) : the (point, normal) np.array pairs inside the
+    face and at its vertices
+
+    """
+    f1 = _TopoDS_face(f1)
+    g = _BRepGProp_Face(f1)
+    u1, u2, v1, v2 = g.Bounds()
+
+    def point_normal(u, v):
+        p = _gp.gp_Pnt()
+        n = _gp.gp_Vec()
+        g.Normal(u, v, p, n)
+        return (np.array([p.X(), p.Y(), p.Z()]),
+                np.array([n.X(), n.Y(), n.Z()]))
+
+    inside = []
+    while not inside and count <= 80:
+        ts = (np.arange(count) + 0.5) / count
+        for u in u1 + ts * (u2 - u1):
+            for v in v1 + ts * (v2 - v1):
+                state = _BRepClass_FaceClassifier(
+                    f1, _gp.gp_Pnt2d(float(u), float(v)), tolerance).State()
+                if state == _TopAbs.TopAbs_IN:
+                    inside.append(point_normal(float(u), float(v)))
+        count *= 4
+    vertices = []
+    ex = _TopExp_Explorer(f1, _TopAbs.TopAbs_VERTEX)
+    while ex.More():
+        uv = _BRep_Tool.Parameters(_TopoDS_vertex(ex.Current()), f1)
+        vertices.append(point_normal(uv.X(), uv.Y()))
+        ex.Next()
+    return inside, vertices
+
+
+def _face_contains(f1, p, n, tolerance, on=True):
+    r"""
+    Returns True if point p lies on raw face f1 with an outward normal
+    opposite to n, i.e. if a face through p with normal n can be glued
+    onto f1.
 
-    """
-    if face_pairs is None:
-        face_pairs = []
+    Parameters
+    ----------
+    f1 : raw face
+    p : np.array
+    n : np.array
+    tolerance : float
+    on : bool, optional (default is True)
+        Points on the boundary of f1 count as on f1
+
+    """
+    f1 = _TopoDS_face(f1)
+    projector = _GeomAPI_ProjectPointOnSurf(_gp.gp_Pnt(p[0], p[1], p[2]),
+                                            _BRep_Tool_Surface(f1))
+    if projector.NbPoints() == 0 or projector.LowerDistance() > tolerance:
+        return False
+    u, v = projector.LowerDistanceParameters()
+    state = _BRepClass_FaceClassifier(f1, _gp.gp_Pnt2d(u, v),
+                                      tolerance).State()
+    if state != _TopAbs.TopAbs_IN and \
+            not (on and state == _TopAbs.TopAbs_ON):
+        return False
+    q = _gp.gp_Pnt()
+    m = _gp.gp_Vec()
+    _BRepGProp_Face(f1).Normal(u, v, q, m)
+    return np.dot(n, [m.X(), m.Y(), m.Z()]) < 0.0
+
+
+def _faces_overlap(f1, samples1, f2, samples2, tolerance):
+    r"""
+    Returns True if raw faces f1 and f2 overlap facing each other: a
+    point inside one lies on the other, or a vertex of one lies inside
+    the other (partial overlaps).  A vertex on the boundary of the
+    other face doesn't count, so faces touching along an edge don't
+    overlap.
 
-    s1f = s1._raw('Face')
-    s2f = s2._raw('Face')
-    if len(face_pairs) == 0:
-        # print('Error: Haven\'t implemented locate glued faces')
-        logger.error('Error: Haven\'t implemented locate glued faces')
-        return
-        # This was expensive and didn't work.  I believe intersections
-        # occurred at edge coincidences.  I may want to try
-        # BRepTools_UVBounds as a pre-filter.  I may also want to try
-        # Bounds first. ***
-
-        # for i1, f1 in enumerate(s1f):
-        #     for i2, f2 in enumerate(s2f):
-        #         b = _TopOpeBRep_FacesIntersector()
-        #         b.Perform(f1, f2)
-        #         if b.SurfacesSameOriented():
-        #             face_pairs.append((i1, i2))
-        # print(face_pairs)
+    Parameters
+    ----------
+    f1 : raw face
+    samples1 : tuple(list, list)
+        _face_samples of f1
+    f2 : raw face
+    samples2 : tuple(list, list)
+        _face_samples of f2
+    tolerance : float
+
+    """
+    for fa, (inside, vertices), fb in ((f1, samples1, f2),
+                                       (f2, samples2, f1)):
+        if any(_face_contains(fb, p, n, tolerance) for p, n in inside) or \
+                any(_face_contains(fb, p, n, tolerance, False)
+                    for p, n in vertices):
+            return True
+    return False
 
-    b = _BRepFeat_Gluer(s1.shape, s2.shape)
-    for face_pair in face_pairs:
-        f1 = _TopoDS_face(s1f[face_pair[0]])
-        f2 = _TopoDS_face(s2f[face_pair[1]])
-        b.Bind(f1, f2)
-        common_edges = _LocOpe_FindEdges(f1, f2)
+
+def _coincident_face_pairs(s1, s2, tolerance=1e-6):
+    r"""
+    Returns the (s1 face index, s2 face index) pairs of faces lying on
+    the same analytic surface, overlapping, and facing each other, as
+    glue and simple_glue expect.
+
+    Faces are bucketed by _face_domain_key, then by the cells of a
+    uniform grid their bounding boxes overlap, so that only faces
+    sharing a surface and a cell are confirmed by classifying sample
+    points of each face on the other (see _faces_overlap).
+    Faces overlapping too many cells are matched against all the faces
+    of their surface.
+
+    Parameters
+    ----------
+    s1 : Solid
+    s2 : Solid
+    tolerance : float, optional (default is 1e-6)
+
+    Returns
+    -------
+    list[tuple(int, int)]
+
+    """
+    def face_bounds(faces):
+        bounds = np.empty((len(faces), 6))
+        for i, f in enumerate(faces):
+            b1 = _Bnd_Box()
+            _brepbndlib_Add(f, b1)
+            bounds[i] = (np.inf, np.inf, np.inf, -np.inf, -np.inf, -np.inf) \
+                if b1.IsVoid() else b1.Get()
+        return bounds
+
+    s1f = s1._raw('Face')
+    s2f = s2._raw('Face')
+    if not s1f or not s2f:
+        return []
+    b1s = face_bounds(s1f)
+    b2s = face_bounds(s2f)
+    extents = (b2s[:, 3:] - b2s[:, :3]).max(axis=1)
+    extents = extents[np.isfinite(extents)]
+    if len(extents) == 0:
+        return []
+    cell = max(np.median(extents), 1e3 * tolerance)
+
+    def cells(b):
+        lo = np.floor((b[:3] - tolerance) / cell).astype(int)
+        hi = np.floor((b[3:] + tolerance) / cell).astype(int)
+        if np.prod(hi - lo + 1) > 512:  # very large faces
+            return [None]
+        return [(i, j, k) for i in range(lo[0], hi[0] + 1)
+                for j in range(lo[1], hi[1] + 1)
+                for k in range(lo[2], hi[2] + 1)]
+
+    grid = {}
+    domains = {}
+    for i2, f2 in enumerate(s2f):
+        domain = _face_domain_key(f2, tolerance)
+        if domain is None or not np.isfinite(b2s[i2]).all():
+            continue
+        domains.setdefault(domain, []).append(i2)
+        for c in cells(b2s[i2]):
+            grid.setdefault((domain, c), []).append(i2)
+
+    face_pairs = []
+    samples2 = {}
+    for i1, f1 in enumerate(s1f):
+        domain = _face_domain_key(f1, tolerance)
+        if domain is None or not np.isfinite(b1s[i1]).all():
+            continue
+        c1s = cells(b1s[i1])
+        if c1s == [None]:
+            candidates = set(domains.get(domain, []))
+        else:
+            candidates = set(grid.get((domain, None), []))
+            for c in c1s:
+                candidates.update(grid.get((domain, c), []))
+        samples1 = None
+        for i2 in sorted(candidates):
+            if (b1s[i1, :3] > b2s[i2, 3:] + tolerance).any() or \
+                    (b2s[i2, :3] > b1s[i1, 3:] + tolerance).any():
+                continue
+            if samples1 is None:
+                samples1 = _face_samples(f1, tolerance)
+            if i2 not in samples2:
+                samples2[i2] = _face_samples(s2f[i2], tolerance)
+            if _faces_overlap(f1, samples1, s2f[i2], samples2[i2],
+                              tolerance):
+                face_pairs.append((i1, i2))
+    return face_pairs
+
+
+# def glue(s1, s2, face_pairs=[]):
+def glue(s1, s2, face_pairs=None):
+    """
+    Glues solids s1 and s2 together at the face_pairs.  face_pairs is
+    a list of tuples.  Each tuple represents face indices that should
+    be glued.  When face_pairs is empty, the faces of s1 and s2 lying
+    on the same surface and facing each other are glued.
+
+    Parameters
+    ----------
+    s1
+    s2
+    face_pairs : list, optional (default is an empty list)
+
+    Returns
+    -------
+    solid
+
+    """
+    if face_pairs is None:
+        face_pairs = []
+
+    s1f = s1._raw('Face')
+    s2f = s2._raw('Face')
+    if len(face_pairs) == 0:
+        face_pairs = _coincident_face_pairs(s1, s2)
+        if len(face_pairs) == 0:
+            logger.error('Error: No coincident faces to glue')
+            return
+
+    b = _BRepFeat_Gluer(s1.shape, s2.shape)
+    for face_pair in face_pairs:
+        f1 = _TopoDS_face(s1f[face_pair[0]])
+        f2 = _TopoDS_face(s2f[face_pair[1]])
+        b.Bind(f1, f2)
+        common_edges = _LocOpe_FindEdges(f1, f2)
         common_edges.InitIterator()
         while common_edges.More():
             b.Bind(common_edges.EdgeFrom(), common_edges.EdgeTo())
@@ -1249,7 +1914,9 @@ def simple_glue(s1, s2, face_pairs=None, tolerance=1e-3):
     Glues solids s1 and s2 together at the face_pairs.  face_pairs is
     a list of tuples.  Each tuple represents faces that should be
     glued.  Unlike glue, each face_pair is expected to exactly
-    overlap.  It's more robust than glue, so it was added.
+    overlap.  It's more robust than glue, so it was added.  When
+    face_pairs is empty, the faces of s1 and s2 lying on the same
+    surface and facing each other are removed.
 
     Parameters
     ----------
@@ -1264,38 +1931,37 @@ def simple_glue(s1, s2, face_pairs=None, tolerance=1e-3):
     Solid
 
     """
-    if face_pairs is None:
-        face_pairs = []
+    if not face_pairs:
+        face_pairs = _coincident_face_pairs(s1, s2)
+        if not face_pairs:
+            logger.warning('Warning: No coincident faces to glue')
 
-    s1f = s1._raw('Face')
-    s2f = s2._raw('Face')
-    f1rs = []
-    f2rs = []
-    for face_pair in face_pairs:
-        f1rs.append(face_pair[0])
-        f2rs.append(face_pair[1])
-    f1rs.sort()
-    f1rs.reverse()
-    f2rs.sort()
-    f2rs.reverse()
-    for f1r in f1rs:
-        del s1f[f1r]
-    for f2r in f2rs:
-        del s2f[f2r]
-    b = _BRepBuilderAPI.BRepBuilderAPI_Sewing(tolerance)
-    for f in s1f:
-        b.Add(f)
-    for f in s2f:
-        b.Add(f)
-    b.Perform()
-    new_shell = b.SewedShape()
+    return sew_all([s1, s2], [[face_pair[0] for face_pair in face_pairs],
+                              [face_pair[1] for face_pair in face_pairs]],
+                   tolerance)
+
+
+def _sewed_solid(new_shell):
+    r"""
+    Returns the Solid made from the shape sewed by
+    BRepBuilderAPI_Sewing: a solid for a shell, a compound of solids
+    for a compound of shells.
+
+    Parameters
+    ----------
+    new_shell : raw shape
+
+    Returns
+    -------
+    Solid
+
+    """
     if _raw_type(new_shell) == 'Shell':
         b2 = _BRepBuilderAPI.BRepBuilderAPI_MakeSolid()
         b2.Add(_TopoDS_shell(new_shell))
         return Solid(b2.Solid())
     elif _raw_type(new_shell) == 'compound':
-        # print('Warning: simple_glue() returned compound')
-        logger.warning('Warning: simple_glue() returned compound')
+        logger.warning('Warning: sewing returned compound')
         s = Solid(new_shell)
         css = s._raw('Shell')
         c = _TopoDS_compound()
@@ -1307,12 +1973,64 @@ def simple_glue(s1, s2, face_pairs=None, tolerance=1e-3):
             b3.Add(c, b2.Solid())
         return Solid(c)
     else:
-        # print('Warning: Wrong sewed shape after simple_glue():', end='')
-        logger.warning('Warning: Wrong sewed shape after simple_glue():')
-        _raw_type(new_shell)
+        logger.warning('Warning: Wrong sewed shape after sewing: %s' %
+                       _raw_type(new_shell))
         return Solid(new_shell)
 
 
+def sew_all(solids, face_pairs_per_solid=None, tolerance=1e-3):
+    """
+    Glues many solids together in a single sewing pass, after removing
+    from each solid the faces glued to another one.  It is
+    simple_glue for any number of solids: gluing a stack of solids
+    sews each face once instead of re-sewing the faces collected so
+    far at every step.
+
+    Parameters
+    ----------
+    solids : list of Solid
+    face_pairs_per_solid : list, optional (default is None)
+        For each solid, the indices of the faces to remove.  When None,
+        the faces lying on the same surface as a face of another solid
+        and facing it are removed (see simple_glue).
+    tolerance : float, optional (default is 1e-3)
+
+    Returns
+    -------
+    Solid
+        A solid, or a compound of solids when the sewed faces don't
+        form a single shell
+
+    """
+    solids = list(solids)
+    if face_pairs_per_solid is None:
+        face_pairs_per_solid = [set() for _ in solids]
+        bounds = [s.bounds() for s in solids]
+        for i1 in range(len(solids)):
+            for i2 in range(i1 + 1, len(solids)):
+                b1 = bounds[i1]
+                b2 = bounds[i2]
+                if any(b1[k] > b2[k + 3] + tolerance or
+                       b2[k] > b1[k + 3] + tolerance for k in range(3)):
+                    continue
+                for f1, f2 in _coincident_face_pairs(solids[i1], solids[i2]):
+                    face_pairs_per_solid[i1].add(f1)
+                    face_pairs_per_solid[i2].add(f2)
+    elif len(face_pairs_per_solid) != len(solids):
+        msg = 'face_pairs_per_solid must have one entry per solid'
+        logger.error(msg)
+        raise ValueError(msg)
+
+    b = _BRepBuilderAPI.BRepBuilderAPI_Sewing(tolerance)
+    for s, removed in zip(solids, face_pairs_per_solid):
+        removed = set(removed)
+        for index, f in enumerate(s._raw('Face')):
+            if index not in removed:
+                b.Add(f)
+    b.Perform()
+    return _sewed_solid(b.SewedShape())
+
+
 # Import Functions
 def _convert_import(s):
     r"""
@@ -1338,6 +2056,72 @@ def _convert_import(s):
         return globals()[stype](s)
 
 
+def _raw_to_brep_bytes(raw_shape, binary=False):
+    r"""Serializes raw_shape in BREP format
+
+    Parameters
+    ----------
+    raw_shape : TopoDS_Shape
+    binary : bool, optional (default is False)
+        Use the faster binary BREP format if OCC provides it
+
+    Returns
+    -------
+    bytes
+
+    """
+    if binary and _bintools_Write is not None:
+        write = _bintools_Write
+    else:
+        write = _breptools_Write
+    fd, name = _tempfile.mkstemp(suffix='.brep')
+    os.close(fd)
+    try:
+        write(raw_shape, name)
+        with open(name, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(name)
+
+
+def _raw_from_brep_bytes(data):
+    r"""Deserializes a raw shape from BREP (text or binary) bytes
+
+    Parameters
+    ----------
+    data : bytes
+
+    Returns
+    -------
+    TopoDS_Shape
+
+    Raises
+    ------
+    ValueError : if data can't be read
+
+    """
+    fd, name = _tempfile.mkstemp(suffix='.brep')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        s = _TopoDS_Shape()
+        if data[:64].lstrip().startswith(b'Open CASCADE Topology'):
+            if _bintools_Read is None:
+                msg = 'Error: Binary BREP is not supported by this OCC'
+                logger.error(msg)
+                raise ValueError(msg)
+            _bintools_Read(s, name)
+        else:
+            _breptools_Read(s, name, _BRep_Builder())
+    finally:
+        os.remove(name)
+    if s.IsNull():
+        msg = 'Error: Could not read BREP data'
+        logger.error(msg)
+        raise ValueError(msg)
+    return s
+
+
 def from_brep(name):
     """
     Imports a brep file and returns the shape.
@@ -1421,6 +2205,359 @@ def from_step(name):
         # print('Error: Can\'t find', name)
 
 
+def _deref(h):
+    r"""Returns the object of the OCC handle h (older pythonocc), or h"""
+    if hasattr(h, 'GetObject'):
+        return h.GetObject()
+    return h
+
+
+def _step_downcast(module, class_name, entity):
+    r"""Returns the STEP entity downcast to class_name of module, or None
+
+    Parameters
+    ----------
+    module : module
+        OCC.Core.StepBasic, OCC.Core.StepRepr, ...
+    class_name : str
+    entity : Standard_Transient (a handle in older pythonocc)
+
+    """
+    if entity is None:
+        return None
+    if hasattr(module, 'Handle_' + class_name):
+        result = getattr(module, 'Handle_' + class_name).DownCast(entity)
+    else:
+        result = getattr(module, class_name).DownCast(entity)
+    if result is None or (hasattr(result, 'IsNull') and result.IsNull()):
+        return None
+    return _deref(result)
+
+
+def _step_product_name(entity):
+    r"""Returns the product name of a product definition or of the
+    component of a next assembly usage occurrence, or None for other
+    STEP entities
+
+    Parameters
+    ----------
+    entity : Standard_Transient (a handle in older pythonocc)
+
+    """
+    pd = _step_downcast(_StepBasic, 'StepBasic_ProductDefinition', entity)
+    if pd is None:
+        nauo = _step_downcast(_StepRepr,
+                              'StepRepr_NextAssemblyUsageOccurrence', entity)
+        if nauo is None:
+            return None
+        pd = _deref(nauo.RelatedProductDefinition())
+    product = _deref(_deref(pd.Formation()).OfProduct())
+    return _deref(product.Name()).ToCString()
+
+
+def _step_root_name(reader, index):
+    r"""Returns the product name of root index of a STEPControl_Reader, or
+    None if the root is not a product definition
+
+    Parameters
+    ----------
+    reader : STEPControl_Reader
+    index : int
+
+    """
+    return _step_product_name(reader.RootForTransfer(index))
+
+
+def _iter_step_components(transfer_reader, shape, product_name):
+    r"""Generates the (product name, raw shape) of the parts of a shape
+    transferred from STEP.  A compound whose children come from product
+    definitions is an assembly: it is exploded, placing its children.
+
+    Parameters
+    ----------
+    transfer_reader : XSControl_TransferReader
+    shape : TopoDS_Shape
+    product_name : str or None
+        Of shape
+
+    """
+    if shape.ShapeType() == _TopAbs.TopAbs_COMPOUND:
+        children = []
+        it = _TopoDS.TopoDS_Iterator(shape)
+        while it.More():
+            child = it.Value()
+            children.append((_step_product_name(
+                transfer_reader.EntityFromShapeResult(child, 1)), child))
+            it.Next()
+        if any(child_name is not None for child_name, _ in children):
+            for child_name, child in children:
+                for part in _iter_step_components(transfer_reader, child,
+                                                  child_name):
+                    yield part
+            return
+    yield product_name, shape
+
+
+def _xcaf_document():
+    r"""Returns a new XCAF document (a handle in older pythonocc)"""
+    if hasattr(_TDocStd, 'Handle_TDocStd_Document'):
+        h = _TDocStd.Handle_TDocStd_Document()
+        app = _deref(_XCAFApp.XCAFApp_Application_GetApplication())
+        app.NewDocument(_TCollection_ExtendedString('MDTV-XCAF'), h)
+        return h
+    return _TDocStd.TDocStd_Document(_TCollection_ExtendedString('MDTV-XCAF'))
+
+
+def _xcaf_shape_tool(doc):
+    r"""Returns the XCAFDoc_ShapeTool of the XCAF document doc"""
+    main = _deref(doc).Main()
+    if hasattr(_XCAFDoc, 'XCAFDoc_DocumentTool_ShapeTool'):
+        return _deref(_XCAFDoc.XCAFDoc_DocumentTool_ShapeTool(main))
+    return _deref(_XCAFDoc.XCAFDoc_DocumentTool.ShapeTool(main))
+
+
+def _label_name(label):
+    r"""Returns the name of the XCAF label, or None"""
+    if hasattr(label, 'GetLabelName'):
+        return label.GetLabelName() or None
+    return None
+
+
+def _iter_xcaf_parts(shape_tool, label, location):
+    r"""Generates the (product name, located raw shape) of the parts
+    under the XCAF label, placed by location and the locations of the
+    assembly components on the way
+
+    Parameters
+    ----------
+    shape_tool : XCAFDoc_ShapeTool
+    label : TDF_Label
+    location : TopLoc_Location
+
+    """
+    if shape_tool.IsAssembly(label):
+        components = _TDF_LabelSequence()
+        shape_tool.GetComponents(label, components)
+        for index in range(1, components.Length() + 1):
+            component = components.Value(index)
+            referred = _TDF_Label()
+            if not shape_tool.GetReferredShape(component, referred):
+                continue
+            for part in _iter_xcaf_parts(
+                    shape_tool, referred,
+                    location.Multiplied(shape_tool.GetLocation(component))):
+                yield part
+    else:
+        shape = shape_tool.GetShape(label)
+        if not shape.IsNull():
+            yield _label_name(label), shape.Moved(location)
+
+
+def iter_step(name, components=True, xcaf=False):
+    """
+    Imports a step file one part at a time.
+
+    Each root is transferred only when the iteration reaches it, and
+    released by the reader once yielded, so the work on the first part
+    starts immediately and the transferred shapes don't accumulate.
+    With components, the compound of an assembly root is exploded as it
+    is reached: each part, however deeply nested, is yielded with the
+    name of its product definition and its placement in the assembly.
+
+    With xcaf, the product structure is walked in an XCAF document
+    instead, whose part geometry is shared by all the instances of a
+    part.  This is not streaming: the whole file is transferred before
+    the first part is yielded.
+
+    In all cases, the STEP entities are parsed all at once.
+
+    Parameters
+    ----------
+    name : str
+    components : bool, optional (default is True)
+        Explodes assemblies into their parts; without, each root is
+        yielded whole
+    xcaf : bool, optional (default is False)
+        Walks the assemblies through XCAF; implies components
+
+    Yields
+    ------
+    tuple(str or None, Shape) : the product name and the shape of each
+    part (each root without components)
+
+    Raises
+    ------
+    IOError : if the file can't be found
+    ValueError : if the file can't be read
+
+    """
+    if not _path.exists(name):
+        raise IOError("Can't find %s" % name)
+    if xcaf:
+        reader = _STEPCAFControl_Reader()
+        reader.SetNameMode(True)
+        if reader.ReadFile(name) != _IFSelect.IFSelect_RetDone:
+            raise ValueError('Could not read %s' % name)
+        doc = _xcaf_document()
+        if not reader.Transfer(doc):
+            raise ValueError('Could not translate %s' % name)
+        shape_tool = _xcaf_shape_tool(doc)
+        labels = _TDF_LabelSequence()
+        shape_tool.GetFreeShapes(labels)
+        for index in range(1, labels.Length() + 1):
+            for product_name, shape in _iter_xcaf_parts(
+                    shape_tool, labels.Value(index), _TopLoc_Location()):
+                yield product_name, _convert_import(shape)
+        return
+    reader = _STEPControl.STEPControl_Reader()
+    if reader.ReadFile(name) != _IFSelect.IFSelect_RetDone:
+        raise ValueError('Could not read %s' % name)
+    transfer_reader = _deref(_deref(reader.WS()).TransferReader())
+    for index in range(1, reader.NbRootsForTransfer() + 1):
+        product_name = _step_root_name(reader, index)
+        if not reader.TransferRoot(index):
+            logger.warning('Warning: Could not translate root %d of %s' %
+                           (index, name))
+            continue
+        shapes = [reader.Shape(count)
+                  for count in range(1, reader.NbShapes() + 1)]
+        reader.ClearShapes()
+        for shape in shapes:
+            if shape.IsNull():
+                continue
+            if not components:
+                yield product_name, _convert_import(shape)
+                continue
+            for part_name, part in _iter_step_components(
+                    transfer_reader, shape, product_name):
+                yield part_name, _convert_import(part)
+
+
+def _read_raw(name):
+    r"""Reads a STEP, IGES or BREP file into a raw shape, raising instead
+    of logging on failures
+
+    Parameters
+    ----------
+    name : str
+
+    Returns
+    -------
+    TopoDS_Shape
+
+    Raises
+    ------
+    IOError : if the file can't be found
+    ValueError : if the file can't be read or translated
+
+    """
+    if not _path.exists(name):
+        raise IOError("Can't find %s" % name)
+    extension = os.path.splitext(name)[1].lower()
+    if extension in ('.stp', '.step'):
+        reader = _STEPControl.STEPControl_Reader()
+    elif extension in ('.igs', '.iges'):
+        reader = _IGESControl_Reader()
+    elif extension in ('.brep', '.brp'):
+        with open(name, 'rb') as f:
+            return _raw_from_brep_bytes(f.read())
+    else:
+        raise ValueError('Unknown file type %s' % extension)
+    if reader.ReadFile(name) != _IFSelect.IFSelect_RetDone:
+        raise ValueError('Could not read %s' % name)
+    if not reader.TransferRoots():
+        raise ValueError('Could not translate %s' % name)
+    shape = reader.OneShape()
+    if shape.IsNull():
+        raise ValueError('No shape in %s' % name)
+    return shape
+
+
+def _load_worker(name):
+    r"""load_many worker: reads name and returns its shape as BREP bytes
+
+    Parameters
+    ----------
+    name : str
+
+    Returns
+    -------
+    tuple(bytes or None, float, str or None) : data, seconds, error
+
+    """
+    start = _time.time()
+    try:
+        data = _raw_to_brep_bytes(_read_raw(name), binary=True)
+        error = None
+    except Exception as e:  # reported, not raised, per file
+        data = None
+        error = '%s: %s' % (type(e).__name__, e)
+    return data, _time.time() - start, error
+
+
+LoadReport = namedtuple('LoadReport', ['path', 'shape', 'seconds', 'error'])
+
+
+def load_many(names, workers=None):
+    """
+    Imports many STEP, IGES or BREP files in a process pool.  The
+    shapes are transferred back from the workers as BREP bytes.
+
+    Parameters
+    ----------
+    names : list[str]
+    workers : int, optional (default is None)
+        Number of processes.  None uses the number of CPUs; 1 reads the
+        files in this process.
+
+    Returns
+    -------
+    list[LoadReport] : in the order of names.  Each report holds the
+    path, the shape (None on failure), the read time in seconds in the
+    worker and the error message (None on success).  A file crashing
+    its worker process gets an error report; the others are still
+    loaded.
+
+    """
+    def pool_results(names):
+        # A crashed worker breaks the whole pool: the files it took down
+        # are retried alone, so only the crashing file fails
+        results = []
+        retry = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_load_worker, name) for name in names]
+            for index, future in enumerate(futures):
+                try:
+                    results.append(future.result())
+                except BrokenProcessPool:
+                    results.append(None)
+                    retry.append(index)
+        for index in retry:
+            if len(names) == 1:
+                results[index] = (None, 0.0,
+                                  'BrokenProcessPool: worker crashed')
+            else:
+                results[index] = pool_results([names[index]])[0]
+        return results
+
+    if workers == 1:
+        results = [_load_worker(name) for name in names]
+    else:
+        results = pool_results(list(names))
+    reports = []
+    for name, (data, seconds, error) in zip(names, results):
+        shape = None
+        if error is None:
+            try:
+                shape = _convert_import(_raw_from_brep_bytes(data))
+            except ValueError as e:
+                error = 'ValueError: %s' % e
+        if error is not None:
+            logger.error('Error: Could not load %s (%s)' % (name, error))
+        reports.append(LoadReport(name, shape, seconds, error))
+    return reports
+
+
 def from_svg(name):
     """
     Imports a 2D svg file, converts each graphics path into a wire,
@@ -1766,146 +2903,1466 @@ def _raw_type(raw_shape):
         logger.warning(msg)
         return 'unknown'
 
-# Classes
-class Part(object):
-    r""" Part class
 
-    Notes
-    -----
+_raw_types = {'Vertex': _TopAbs.TopAbs_VERTEX,
+              'Edge': _TopAbs.TopAbs_EDGE,
+              'Wire': _TopAbs.TopAbs_WIRE,
+              'Face': _TopAbs.TopAbs_FACE,
+              'Shell': _TopAbs.TopAbs_SHELL,
+              'Solid': _TopAbs.TopAbs_SOLID,
+              'Compound': _TopAbs.TopAbs_COMPOUND,
+              'Compsolid': _TopAbs.TopAbs_COMPSOLID}
 
-    A Part could be n solids : e.g. a bearing has two rings and n balls
 
-    """
+class _SubshapeIndex(object):
+    r"""Ordered, unique OCC subshapes of one type of a raw shape
 
-    def __init__(self, geometry, origin):
-        """
+    The subshapes are kept in a TopTools_IndexedMapOfShape, so building
+    the index is linear in the number of explored subshapes (the list
+    based hash check it replaces was quadratic).  The order is the
+    explorer order of the first occurrence of each subshape.
 
-        Parameters
-        ----------
+    Parameters
+    ----------
+    raw_shape : TopoDS_Shape
+    raw_type : str
+        'Vertex', 'Edge', 'Wire', 'Face', 'Shell', 'Solid', 'Compound'
+        or 'Compsolid'
+    ordered_edges : bool, optional (default is False)
+        If True and raw_type is 'Edge', raw_shape must be a wire and the
+        edges are explored in connection order (BRepTools_WireExplorer)
 
-        geometry : solid
-        origin : string
+    """
 
-        """
+    def __init__(self, raw_shape, raw_type, ordered_edges=False):
+        self._map = _TopTools.TopTools_IndexedMapOfShape()
+        if ordered_edges and raw_type == 'Edge':
+            ex = _BRepTools.BRepTools_WireExplorer(_TopoDS_wire(raw_shape))
+            while ex.More():
+                self._map.Add(ex.Current())
+                ex.Next()
+        else:
+            _TopExp_MapShapes(raw_shape, _raw_types[raw_type], self._map)
+        self._shapes = [self._map.FindKey(i)
+                        for i in range(1, self._map.Extent() + 1)]
 
-        self._geometry = geometry
-        self.origin = origin
+    def __len__(self):
+        return len(self._shapes)
 
-    def __repr__(self):
-        st = 'Part from :' + self.origin +'\n'
-        st = st + self.geometry.__repr__()
-        return(st)
+    def __getitem__(self, i):
+        return self._shapes[i]
 
-    @classmethod
-    def from_step(cls, step_filename):
-        r"""Create a Part instance from a STEP file
+    def __iter__(self):
+        return iter(self._shapes)
+
+    def __contains__(self, raw_shape):
+        return self._map.Contains(raw_shape)
+
+    def index(self, raw_shape):
+        r"""Index of raw_shape in the subshapes
 
         Parameters
         ----------
-        step_filename : str
-            Path to the STEP file
+        raw_shape : TopoDS_Shape
 
         Returns
         -------
-        Part : a new Part object created from the STEP file
+        int
 
         Raises
         ------
-        IOError : if the STEP file cannot be found
+        ValueError : if raw_shape is not a subshape
 
         """
-        # if not os.path.isfile(step_filename):
-        #     msg = "STEP part file does not exist"
-        #     logger.error(msg)
-        #     raise IOError(msg)
-        # TODO : make sure is it not a compound or a compsolid
-        #      : actually, why not? e.g. bearing
-        solid = from_step(step_filename)
-        return cls(solid, origin=step_filename)
-
-    @classmethod
-    def from_py(cls, py_filename):
-        r"""Create a Part instance from a Python file
+        i = self._map.FindIndex(raw_shape)
+        if i == 0:
+            raise ValueError('shape is not a subshape')
+        return i - 1
 
-        Parameters
-        ----------
-        py_filename : str
-            Path to the Python generator module
-            that has a 'part' variable in its global namespace
+    def to_list(self):
+        r"""A new list of the subshapes
 
         Returns
         -------
-        Part : a new Part object created from the library
+        list[TopoDS_Shape]
 
-        Raises
+        """
+        return list(self._shapes)
+
+
+class _TopologyIndex(object):
+    r"""Lazily built topology of a raw shape
+
+    Keeps one _SubshapeIndex per subshape type and one ancestor map per
+    (subshape type, ancestor type) pair, each built on first use.  A
+    Shape owns one _TopologyIndex and drops it whenever its shape is
+    replaced, so repeated queries on an unchanged shape don't re-walk
+    the B-rep.
+
+    data is a dictionary where callers may keep anything else derived
+    from the topology (centers, search trees, ...).  It is dropped with
+    the index.
+
+    Parameters
+    ----------
+    raw_shape : TopoDS_Shape
+    ordered_edges : bool, optional (default is False)
+        Passed to the edge _SubshapeIndex (True for wires)
+
+    """
+
+    def __init__(self, raw_shape, ordered_edges=False):
+        self._shape = raw_shape
+        self._ordered_edges = ordered_edges
+        self._subshapes = {}
+        self._ancestors = {}
+        self.data = {}
+
+    def subshapes(self, raw_type):
+        r"""The _SubshapeIndex of raw_type
+
+        Parameters
+        ----------
+        raw_type : str
+
+        Returns
+        -------
+        _SubshapeIndex
+
+        """
+        if raw_type not in self._subshapes:
+            self._subshapes[raw_type] = _SubshapeIndex(
+                self._shape, raw_type, ordered_edges=self._ordered_edges)
+        return self._subshapes[raw_type]
+
+    def ancestors(self, raw_type, ancestor_type):
+        r"""The map of every raw_type subshape to its ancestor_type
+        ancestors
+
+        Parameters
+        ----------
+        raw_type : str
+            e.g. 'Edge'
+        ancestor_type : str
+            e.g. 'Face'
+
+        Returns
+        -------
+        TopTools_IndexedDataMapOfShapeListOfShape
+
+        """
+        key = (raw_type, ancestor_type)
+        if key not in self._ancestors:
+            ancestor_map = \
+                _TopTools.TopTools_IndexedDataMapOfShapeListOfShape()
+            _TopExp_MapShapesAndAncestors(self._shape, _raw_types[raw_type],
+                                          _raw_types[ancestor_type],
+                                          ancestor_map)
+            self._ancestors[key] = ancestor_map
+        return self._ancestors[key]
+
+
+def _nearest_choice(candidates, values, pt):
+    r"""Selects one of the tied nearest candidates
+
+    The candidate with the smallest value wins.  If pt has a 4th
+    coordinate and other candidates tie with the winner, pt[3] selects
+    one of them instead, as Shape.nearest always did: pt[3] = 2 is the
+    first of the other tied candidates, 3 the second, etc.
+
+    Parameters
+    ----------
+    candidates : np.ndarray
+        Subshape indices in increasing order
+    values : np.ndarray
+        Distances (or squared distances) of the candidates
+    pt : tuple[float]
+
+    Returns
+    -------
+    int
+
+    Raises
+    ------
+    ValueError : if there are no candidates
+
+    """
+    if len(candidates) == 0:
+        msg = 'Error: No subshape to choose the nearest from'
+        logger.error(msg)
+        raise ValueError(msg)
+    arg_min = candidates[int(np.argmin(values))]
+    arg_mins = [c for c in candidates if c != arg_min]
+    if len(pt) == 4 and len(arg_mins) > 0:
+        return int(arg_mins[int(pt[3]) - 2])
+    else:
+        return int(arg_min)
+
+
+# Mass properties function by subshape type (vertices have none)
+_gprops = {'Edge': _brepgprop_LinearProperties,
+           'Wire': _brepgprop_LinearProperties,
+           'Face': _brepgprop_SurfaceProperties,
+           'Shell': _brepgprop_SurfaceProperties,
+           'Solid': _brepgprop_VolumeProperties}
+
+
+# Part.from_library sources and parts per (url, name)
+_library_cache = {}
+_library_locks = {}
+_library_lock = _threading.Lock()
+
+
+def _library_location(url, name, mirror=None):
+    r"""Returns where name.py of the library at url is fetched from: the
+    file of the mirror if there is one, else the library
+
+    Parameters
+    ----------
+    url : str
+    name : str
+    mirror : str, optional (default is None)
+        A local directory searched first
+
+    """
+    if mirror is not None:
+        local = _path.join(mirror, '%s.py' % name)
+        if _path.isfile(local):
+            return local
+    return "%s/%s.py" % (url, name)
+
+
+def _fetch_library_source(location, etag=None):
+    r"""Returns the source at location, and its ETag
+
+    Parameters
+    ----------
+    location : str
+        A local file or a url (see _library_location)
+    etag : str, optional (default is None)
+        ETag of the cached source
+
+    Returns
+    -------
+    tuple(bytes or None, str or None) : the source is None if the server
+    reports that the source with etag is unchanged
+
+    """
+    if _path.isfile(location):
+        with open(location, 'rb') as f:
+            return f.read(), None
+    request = Request(location)
+    if etag is not None:
+        request.add_header('If-None-Match', etag)
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        if e.code == 304:  # Not modified
+            return None, etag
+        raise
+    try:
+        return response.read(), response.info().get('ETag')
+    finally:
+        response.close()
+
+
+# Classes
+class Part(object):
+    r""" Part class
+
+    Notes
+    -----
+
+    A Part could be n solids : e.g. a bearing has two rings and n balls
+
+    """
+
+    def __init__(self, geometry, origin):
+        """
+
+        Parameters
+        ----------
+
+        geometry : solid
+        origin : string
+
+        """
+
+        self._geometry = geometry
+        self.origin = origin
+
+    def __repr__(self):
+        st = 'Part from :' + self.origin +'\n'
+        st = st + self.geometry.__repr__()
+        return(st)
+
+    @classmethod
+    def from_step(cls, step_filename):
+        r"""Create a Part instance from a STEP file
+
+        Parameters
+        ----------
+        step_filename : str
+            Path to the STEP file
+
+        Returns
+        -------
+        Part : a new Part object created from the STEP file
+
+        Raises
+        ------
+        IOError : if the STEP file cannot be found
+
+        """
+        # if not os.path.isfile(step_filename):
+        #     msg = "STEP part file does not exist"
+        #     logger.error(msg)
+        #     raise IOError(msg)
+        # TODO : make sure is it not a compound or a compsolid
+        #      : actually, why not? e.g. bearing
+        solid = from_step(step_filename)
+        return cls(solid, origin=step_filename)
+
+    @classmethod
+    def from_py(cls, py_filename, cache=None):
+        r"""Create a Part instance from a Python file
+
+        Parameters
+        ----------
+        py_filename : str
+            Path to the Python generator module
+            that has a 'part' variable in its global namespace
+        cache : DiskCache, optional (default is None)
+            Serve the part from cache, without executing the module,
+            when the module source and the ccad and OCC versions are
+            unchanged.  Modules imported by the generator are not part
+            of the key.
+
+        Returns
+        -------
+        Part : a new Part object created from the library
+
+        Raises
         ------
         IOError : if the Python generator module cannot be found
         ValueError : if the Python generator does not have a 'part' variable
                      in its global namespace
 
         """
-        # if not os.path.isfile(py_filename):
-        #     msg = "Python part file does not exist"
-        #     logger.error(msg)
-        #     raise IOError(msg)
+        # if not os.path.isfile(py_filename):
+        #     msg = "Python part file does not exist"
+        #     logger.error(msg)
+        #     raise IOError(msg)
+
+        if cache is not None:
+            with open(py_filename, 'rb') as f:
+                key = DiskCache.key(f.read(), _ccad_version, _occ_version)
+            solid = cache.get(key)
+            if solid is not None:
+                return cls(solid, origin=py_filename)
+
+        spec = importlib.util.spec_from_file_location(os.path.splitext(py_filename)[0], py_filename)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        # module = imp.load_source(os.path.splitext(py_filename)[0], py_filename)
+        if not hasattr(module, 'part'):
+            raise ValueError("The Python module should have a 'part' variable")
+        solid = module.part
+        if cache is not None:
+            cache.put(key, solid, {'origin': py_filename})
+        return cls(solid, origin=py_filename)
+
+    @classmethod
+    def from_library(cls, url, name, mirror=None):
+        r"""Create a Part instance from a library of Python generators
+
+        The generator source is fetched into memory and executed there.
+        The source and the built part are cached per location fetched
+        from (the mirror file or the library url): http sources are
+        revalidated with their ETag and rebuilt only if their content
+        changed.  Safe to call from several threads.
+
+        Parameters
+        ----------
+        url : str
+            The library url (http://, https:// or file://)
+        name : str
+            The name of the part in the library
+        mirror : str, optional (default is None)
+            A local directory searched for name.py before url
+
+        Returns
+        -------
+        Part : a new Part object created from the library
+        anchors : the anchors defined by the generator
+
+        Raises
+        ------
+        IOError : if the url of the library is wrong
+        SyntaxError : if the name of the part does not exist
+
+        """
+        origin = "%s/%s.py" % (url, name)
+        location = _library_location(url, name, mirror)
+        with _library_lock:
+            entry_lock = _library_locks.setdefault(location,
+                                                   _threading.Lock())
+        with entry_lock:
+            entry = _library_cache.get(location)
+            source, etag = _fetch_library_source(
+                location, entry['etag'] if entry else None)
+            if source is not None:
+                digest = _hashlib.sha256(source).hexdigest()
+            if entry is None or (source is not None and
+                                 digest != entry['digest']):
+                module = _types.ModuleType(name)
+                module.__file__ = location
+                exec(compile(source, location, 'exec'), module.__dict__)
+                entry = {'digest': digest,
+                         'part': module.part,
+                         'anchors': module.anchors}
+                _library_cache[location] = entry
+            entry['etag'] = etag
+        # Fresh wrappers, so callers can't change each other's parts
+        solid = globals()[entry['part'].stype](entry['part'].shape)
+        return cls(solid, origin=origin), _copy.deepcopy(entry['anchors'])
+
+    @classmethod
+    def from_library_many(cls, url, names, workers=4, mirror=None):
+        r"""Create Part instances for many names of a library, fetching
+        them concurrently
+
+        Parameters
+        ----------
+        url : str
+        names : list[str]
+        workers : int, optional (default is 4)
+            Number of threads
+        mirror : str, optional (default is None)
+
+        Returns
+        -------
+        list[tuple(Part, anchors)] : in the order of names
+
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                lambda name: cls.from_library(url, name, mirror), names))
+
+    @property
+    def geometry(self):
+        r"""Part geometry
+
+        Returns
+        -------
+        Solid
+
+        """
+        return self._geometry
+
+
+class InstancedPart(Part):
+    r""" Part made of one geometry placed many times
+
+    Notes
+    -----
+
+    Each placement is a 4x4 rigid transformation matrix.  The instances
+    are located TopoDS shapes sharing the geometry's TShape, so memory
+    and STEP export size don't grow with the number of placements.
+
+    """
+
+    def __init__(self, geometry, origin, placements=None):
+        """
+
+        Parameters
+        ----------
+
+        geometry : solid
+        origin : string
+        placements : list[np.array], optional (default is None)
+            4x4 (or 3x4) rigid transformation matrices
+
+        """
+        super(InstancedPart, self).__init__(geometry, origin)
+        self._placements = []
+        if placements is not None:
+            for placement in placements:
+                self.add_placement(placement)
+
+    def __repr__(self):
+        st = 'InstancedPart from :' + self.origin + '\n'
+        st = st + str(len(self._placements)) + ' instances of\n'
+        st = st + self.geometry.__repr__()
+        return st
+
+    def __len__(self):
+        return len(self._placements)
+
+    def add_placement(self, matrix):
+        r"""Adds an instance of the geometry placed by matrix
+
+        Parameters
+        ----------
+        matrix : np.array
+            4x4 (or 3x4) rigid transformation matrix
+
+        Raises
+        ------
+        ValueError : if matrix is not a rigid transformation
+
+        """
+        placement = np.identity(4)
+        placement[:3, :] = np.asarray(matrix, dtype=float)[:3, :4]
+        # gp_Trsf orthogonalizes sheared or scaled matrices, so check here
+        r = placement[:3, :3]
+        if not (np.allclose(r.dot(r.T), np.identity(3), atol=1e-9) and
+                abs(la.det(r) - 1.0) < 1e-9):
+            msg = 'Error: Instance placements must be rigid transformations'
+            logger.error(msg)
+            raise ValueError(msg)
+        self._placements.append(placement)
+
+    @property
+    def placements(self):
+        r"""Instance placements
+
+        Returns
+        -------
+        list[np.array] : 4x4 transformation matrices
+
+        """
+        return [placement.copy() for placement in self._placements]
+
+    def instances(self):
+        r"""Located raw shapes of the instances, sharing the geometry's
+        TShape
+
+        Returns
+        -------
+        list[TopoDS_Shape]
+
+        """
+        raw_shape = self.geometry.shape
+        return [raw_shape.Moved(_TopLoc_Location(_matrix_trsf(placement)))
+                for placement in self._placements]
+
+    def compound(self):
+        r"""All instances in a compound
+
+        Returns
+        -------
+        Solid : holding a TopoDS_Compound
+
+        """
+        c = _TopoDS.TopoDS_Compound()
+        b = _BRep_Builder()
+        b.MakeCompound(c)
+        for raw_shape in self.instances():
+            b.Add(c, raw_shape)
+        return Solid(c)
+
+    def to_step(self, name, **options):
+        r"""Exports the instances in .stp format.  The geometry is written
+        once, with one assembly occurrence per placement.
+
+        Parameters
+        ----------
+        name : str
+        options : see Shape.to_step.  assembly defaults to 1.
+
+        """
+        options.setdefault('assembly', 1)
+        self.compound().to_step(name, **options)
+
+
+def _face_triangulation(raw_face):
+    r"""Returns the triangulation of raw_face, or None, and its location
+
+    Parameters
+    ----------
+    raw_face : TopoDS_Face
+
+    Returns
+    -------
+    tuple(Poly_Triangulation or None, TopLoc_Location)
+
+    """
+    location = _TopLoc_Location()
+    h = _BRep_Tool.Triangulation(_TopoDS_face(raw_face), location)
+    if h is None or (hasattr(h, 'IsNull') and h.IsNull()):
+        return None, location
+    if hasattr(h, 'GetObject'):  # Handle in older pythonocc
+        h = h.GetObject()
+    return h, location
+
+
+@contextmanager
+def _output_file(f):
+    r"""Yields a binary file object for f, opening and closing it if f is
+    a file name
+
+    Parameters
+    ----------
+    f : str or file object
+
+    """
+    if hasattr(f, 'write'):
+        yield f
+    else:
+        with open(f, 'wb') as fileobj:
+            yield fileobj
+
+
+# Binary STL triangle record
+_stl_dtype = np.dtype([('normal', '<f4', (3,)),
+                       ('vertices', '<f4', (3, 3)),
+                       ('attribute', '<u2')])
+
+
+class Mesh(object):
+    r""" Triangle mesh held in contiguous numpy arrays
+
+    Attributes
+    ----------
+
+    vertices : np.array (N x 3, float64)
+        Vertex coordinates, without duplicates
+    triangles : np.array (M x 3, int32)
+        Vertex indices of each triangle, counter-clockwise seen from
+        outside
+    face_ranges : np.array (F x 2, int64)
+        [start, stop) rows of triangles for each face, in the order of
+        Shape.subshapes('Face')
+    normals : np.array (M x 3, float64)
+        Unit normal of each triangle
+
+    """
+
+    def __init__(self, vertices, triangles, face_ranges=None, normals=None):
+        """
+
+        Parameters
+        ----------
+
+        vertices : np.array (N x 3)
+        triangles : np.array (M x 3)
+        face_ranges : np.array (F x 2), optional (default is None)
+            Defaults to a single face holding all triangles
+        normals : np.array (M x 3), optional (default is None)
+            Computed from the triangles if None
+
+        """
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64)
+        self.vertices.shape = (-1, 3)
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.int32)
+        self.triangles.shape = (-1, 3)
+        if face_ranges is None:
+            face_ranges = [(0, len(self.triangles))]
+        self.face_ranges = np.ascontiguousarray(face_ranges, dtype=np.int64)
+        self.face_ranges.shape = (-1, 2)
+        if normals is None:
+            normals = self.triangle_normals()
+        self.normals = np.ascontiguousarray(normals, dtype=np.float64)
+
+    def __repr__(self):
+        return 'Mesh : %d vertices, %d triangles, %d faces' % \
+               (len(self.vertices), len(self.triangles),
+                len(self.face_ranges))
+
+    def face_triangles(self, index):
+        r"""Triangles of face index
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        np.array (n x 3, int32)
+
+        """
+        start, stop = self.face_ranges[index]
+        return self.triangles[start:stop]
+
+    def triangle_normals(self):
+        r"""Unit normals of the triangles (zero for degenerate triangles)
+
+        Returns
+        -------
+        np.array (M x 3, float64)
+
+        """
+        p = self.vertices[self.triangles]
+        normals = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+        lengths = np.sqrt((normals ** 2).sum(axis=1))
+        lengths[lengths == 0.0] = 1.0
+        return normals / lengths[:, np.newaxis]
+
+    def valid_triangles(self):
+        r"""Mask of the non-degenerate triangles (three distinct vertices
+        and a non-zero normal)
+
+        Returns
+        -------
+        np.array (M, bool)
+
+        """
+        t = self.triangles
+        return ((t[:, 0] != t[:, 1]) & (t[:, 1] != t[:, 2]) &
+                (t[:, 2] != t[:, 0]) & (abs(self.normals).sum(axis=1) > 0.0))
 
-        spec = importlib.util.spec_from_file_location(os.path.splitext(py_filename)[0], py_filename)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        # module = imp.load_source(os.path.splitext(py_filename)[0], py_filename)
-        if not hasattr(module, 'part'):
-            raise ValueError("The Python module should have a 'part' variable")
-        solid = module.part
-        return cls(solid, origin=py_filename)
+    def to_stl(self, f, ascii=False, chunk_size=100000):
+        r"""Writes the mesh in .stl format, without degenerate triangles.
+        The output is streamed chunk_size triangles at a time.
 
-    @classmethod
-    def from_library(cls, url, name):
-        r"""
+        Parameters
+        ----------
+        f : str or binary file object
+        ascii : bool, optional (default is False)
+        chunk_size : int, optional (default is 100000)
+
+        """
+        valid = np.nonzero(self.valid_triangles())[0]
+        with _output_file(f) as fileobj:
+            if ascii:
+                fileobj.write(b'solid ccad\n')
+            else:
+                fileobj.write(b'ccad binary stl'.ljust(80, b' '))
+                fileobj.write(np.array([len(valid)], '<u4').tobytes())
+            for start in range(0, len(valid), chunk_size):
+                rows = valid[start:start + chunk_size]
+                if ascii:
+                    lines = []
+                    for n, p in zip(self.normals[rows],
+                                    self.vertices[self.triangles[rows]]):
+                        lines.append(
+                            'facet normal %e %e %e\n outer loop\n'
+                            '  vertex %e %e %e\n  vertex %e %e %e\n'
+                            '  vertex %e %e %e\n endloop\nendfacet\n' %
+                            (tuple(n) + tuple(p.ravel())))
+                    fileobj.write(''.join(lines).encode('ascii'))
+                else:
+                    records = np.zeros(len(rows), _stl_dtype)
+                    records['normal'] = self.normals[rows]
+                    records['vertices'] = self.vertices[self.triangles[rows]]
+                    fileobj.write(records.tobytes())
+            if ascii:
+                fileobj.write(b'endsolid ccad\n')
+
+    def to_ply(self, f, chunk_size=100000):
+        r"""Writes the mesh in binary .ply format with shared vertices,
+        without degenerate triangles.
 
         Parameters
         ----------
-        url : str
-            The library url
-        name : str
-            The name of the part in the library
+        f : str or binary file object
+        chunk_size : int, optional (default is 100000)
+
+        """
+        triangles = self.triangles[self.valid_triangles()]
+        face_dtype = np.dtype([('count', 'u1'), ('indices', '<i4', (3,))])
+        header = ('ply\n'
+                  'format binary_little_endian 1.0\n'
+                  'comment ccad\n'
+                  'element vertex %d\n'
+                  'property double x\n'
+                  'property double y\n'
+                  'property double z\n'
+                  'element face %d\n'
+                  'property list uchar int vertex_indices\n'
+                  'end_header\n' % (len(self.vertices), len(triangles)))
+        with _output_file(f) as fileobj:
+            fileobj.write(header.encode('ascii'))
+            for start in range(0, len(self.vertices), chunk_size):
+                fileobj.write(self.vertices[start:start + chunk_size].astype(
+                    '<f8').tobytes())
+            for start in range(0, len(triangles), chunk_size):
+                rows = triangles[start:start + chunk_size]
+                records = np.empty(len(rows), face_dtype)
+                records['count'] = 3
+                records['indices'] = rows
+                fileobj.write(records.tobytes())
+
+    def to_obj(self, f):
+        r"""Writes the mesh in .obj format with shared vertices, without
+        degenerate triangles.
+
+        Parameters
+        ----------
+        f : str or binary file object
+
+        """
+        triangles = self.triangles[self.valid_triangles()]
+        with _output_file(f) as fileobj:
+            fileobj.write(b'# ccad\n')
+            np.savetxt(fileobj, self.vertices, fmt='v %.17g %.17g %.17g')
+            np.savetxt(fileobj, triangles + 1, fmt='f %d %d %d')
+
+
+def _default_deflection(raw_shape, coefficient=1e-3):
+    r"""Returns a linear deflection of coefficient times the raw_shape
+    bounding box diagonal
+
+    Parameters
+    ----------
+    raw_shape : TopoDS_Shape
+    coefficient : float, optional (default is 1e-3)
+
+    """
+    b1 = _Bnd_Box()
+    _brepbndlib_Add(raw_shape, b1)
+    if b1.IsVoid():
+        return coefficient
+    x1, y1, z1, x2, y2, z2 = b1.Get()
+    return max(coefficient * _math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2 +
+                                        (z2 - z1) ** 2), 1e-6)
+
+
+def _warm_triangulation(shape, linear_deflection=None,
+                        angular_deflection=0.5):
+    r"""Triangulates the faces of shape in place through mesh_cache, so
+    the renderers and writers reading the face triangulations share the
+    tessellation of Shape.mesh.  A shape already cached isn't meshed
+    again.  Shapes without faces are left alone.
+
+    Parameters
+    ----------
+    shape : Shape or TopoDS_Shape
+    linear_deflection : float, optional (default is None)
+    angular_deflection : float, optional (default is 0.5)
+        See Shape.mesh
+
+    Returns
+    -------
+    Mesh or None : None if shape has no faces
+
+    """
+    raw_shape = shape.shape if isinstance(shape, Shape) else shape
+    if not _TopExp_Explorer(raw_shape, _TopAbs.TopAbs_FACE).More():
+        return None
+    return mesh_cache.mesh(shape, linear_deflection, angular_deflection)
+
+
+def _raw_mesh(raw_shape, raw_faces, linear_deflection, angular_deflection,
+              relative, merge_tolerance):
+    r"""Implements Shape.mesh without caching
+
+    Parameters
+    ----------
+    raw_shape : TopoDS_Shape
+    raw_faces : iterable of the faces of raw_shape
+    linear_deflection : float or None
+    angular_deflection : float
+    relative : bool
+    merge_tolerance : float
+
+    Returns
+    -------
+    Mesh
+
+    """
+    if linear_deflection is None:
+        linear_deflection = _default_deflection(raw_shape)
+    _BRepMesh_IncrementalMesh(raw_shape, linear_deflection, relative,
+                              angular_deflection, True)
+    vertices = []
+    triangles = []
+    face_ranges = []
+    nvertices = 0
+    ntriangles = 0
+    for raw_face in raw_faces:
+        tri, location = _face_triangulation(raw_face)
+        if tri is None:
+            face_ranges.append((ntriangles, ntriangles))
+            continue
+        nodes = tri.Nodes()
+        pts = np.array([(p.X(), p.Y(), p.Z()) for p in
+                        (nodes.Value(i) for i in
+                         range(nodes.Lower(), nodes.Upper() + 1))])
+        if not location.IsIdentity():
+            t = location.Transformation()
+            m = np.array([[t.Value(row, col) for col in range(1, 5)]
+                          for row in range(1, 4)])
+            pts = pts.dot(m[:, :3].T) + m[:, 3]
+        ts = tri.Triangles()
+        ids = np.array([ts.Value(i).Get() for i in
+                        range(ts.Lower(), ts.Upper() + 1)]) - nodes.Lower()
+        if raw_face.Orientation() == _TopAbs.TopAbs_REVERSED:
+            ids = ids[:, [0, 2, 1]]
+        vertices.append(pts)
+        triangles.append(ids + nvertices)
+        face_ranges.append((ntriangles, ntriangles + len(ids)))
+        nvertices += len(pts)
+        ntriangles += len(ids)
+    if not vertices:
+        return Mesh(np.zeros((0, 3)), np.zeros((0, 3)), face_ranges)
+    vertices = np.concatenate(vertices)
+    triangles = np.concatenate(triangles)
+    # Merge coincident vertices
+    keys = np.round(vertices / merge_tolerance)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True,
+                                  return_inverse=True)
+    return Mesh(vertices[first], inverse.reshape(-1)[triangles],
+                face_ranges)
+
+
+class MeshCache(object):
+    r""" Least recently used cache of shape tessellations
+
+    Meshes are keyed by the raw shape identity (TShape, location and
+    orientation) and the tessellation parameters, and evicted once the
+    cached triangles exceed max_triangles.  A shape changed by any ccad
+    operation gets a new identity, so its stale meshes are never
+    returned.  The cached arrays are read-only since they are shared.
+
+    """
+
+    def __init__(self, max_triangles=10000000):
+        """
+
+        Parameters
+        ----------
+
+        max_triangles : int, optional (default is 10000000)
+            Triangle budget of the cache
+
+        """
+        self.max_triangles = max_triangles
+        self._entries = OrderedDict()
+        self._triangles = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def triangles(self):
+        r"""Number of cached triangles"""
+        return self._triangles
+
+    def clear(self):
+        r"""Empties the cache"""
+        self._entries.clear()
+        self._triangles = 0
+
+    def mesh(self, shape, linear_deflection=None, angular_deflection=0.5,
+             relative=False, merge_tolerance=1e-9):
+        r"""Returns the cached Mesh of shape, tessellating it on a miss
+
+        Parameters
+        ----------
+        shape : Shape or TopoDS_Shape
+        linear_deflection : float, optional (default is None)
+        angular_deflection : float, optional (default is 0.5)
+        relative : bool, optional (default is False)
+        merge_tolerance : float, optional (default is 1e-9)
+            See Shape.mesh
 
         Returns
         -------
-        Part : a new Part object created from the library
+        Mesh
 
-        Raises
-        ------
-        IOError : if the url of the library is wrong
-        SyntaxError : if the name of the part does not exist
+        """
+        if isinstance(shape, Shape):
+            raw_shape = shape.shape
+            raw_faces = shape._raw_index('Face')
+        else:
+            raw_shape = shape
+            raw_faces = _SubshapeIndex(raw_shape, 'Face')
+        if linear_deflection is None:
+            linear_deflection = _default_deflection(raw_shape)
+        key = (raw_shape.__hash__(), int(raw_shape.Orientation()),
+               linear_deflection, angular_deflection, bool(relative),
+               merge_tolerance)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0].IsEqual(raw_shape):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        m1 = _raw_mesh(raw_shape, raw_faces, linear_deflection,
+                       angular_deflection, relative, merge_tolerance)
+        for a in (m1.vertices, m1.triangles, m1.face_ranges, m1.normals):
+            a.flags.writeable = False
+        if entry is not None:  # hash collision
+            self._triangles -= len(entry[1].triangles)
+        self._entries[key] = (raw_shape, m1)
+        self._triangles += len(m1.triangles)
+        while self._triangles > self.max_triangles and len(self._entries) > 1:
+            _, (_, old) = self._entries.popitem(last=False)
+            self._triangles -= len(old.triangles)
+        return m1
+
+
+# Shared by all tessellating functions and the display
+mesh_cache = MeshCache()
+
+
+class DiskCache(object):
+    r""" Content addressed on-disk cache of shapes
+
+    Shapes are stored as binary BREP files (text BREP on OCC < 7.3)
+    named by their key, next to a JSON metadata file.  The least
+    recently used entries are evicted beyond max_bytes, and entries
+    created more than max_age seconds ago are dropped.
+
+    """
+
+    def __init__(self, directory=None, max_bytes=1 << 30, max_age=None):
+        """
+
+        Parameters
+        ----------
+
+        directory : str, optional (default is None)
+            $CCAD_CACHE_DIR if set, ~/.cache/ccad otherwise
+        max_bytes : int, optional (default is 1 GiB)
+        max_age : float, optional (default is None)
+            In seconds; None keeps entries until evicted by size
 
         """
-        response = urlopen("%s/%s.py" % (url, name))
+        if directory is None:
+            directory = os.environ.get(
+                'CCAD_CACHE_DIR',
+                _path.join(_path.expanduser('~'), '.cache', 'ccad'))
+        if not _path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @staticmethod
+    def key(*parts):
+        r"""Returns the sha256 hex digest of parts
 
-        with open("tmp.py", "wb") as tmp_py_file:
-            for line in response.readlines():
-                tmp_py_file.write(line)
+        Parameters
+        ----------
+        parts : bytes or str
 
-        spec = importlib.util.spec_from_file_location(name, "tmp.py")
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        # module = imp.load_source(name, "tmp.py")
+        """
+        h = _hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = str(part).encode('utf-8')
+            h.update(_hashlib.sha256(part).digest())
+        return h.hexdigest()
+
+    def _paths(self, key):
+        base = _path.join(self.directory, key)
+        return base + '.brep', base + '.json'
+
+    def _entries(self):
+        r"""Returns the (key, brep size, last use, creation time) of all
+        entries"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.brep'):
+                continue
+            key = name[:-len('.brep')]
+            brep_path, json_path = self._paths(key)
+            try:
+                st = os.stat(brep_path)
+                created = os.stat(json_path).st_mtime
+            except OSError:  # Removed concurrently or half written
+                continue
+            entries.append((key, st.st_size, st.st_mtime, created))
+        return entries
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _remove(self, key):
+        for name in self._paths(key):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
 
-        solid = module.part
-        anchors = module.anchors
-        #logger.debug("solid has type: %s" % type(solid))
-        os.remove("tmp.py")
-        return cls(solid, origin="%s/%s.py" % (url, name)), anchors
+    def get(self, key):
+        r"""Returns the shape stored under key, or None
 
-    @property
-    def geometry(self):
-        r"""Part geometry
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        Shape or None
+
+        """
+        brep_path, json_path = self._paths(key)
+        try:
+            created = os.stat(json_path).st_mtime
+            if (self.max_age is not None and
+                    _time.time() - created > self.max_age):
+                self._remove(key)
+                return None
+            with open(brep_path, 'rb') as f:
+                data = f.read()
+            with open(json_path) as f:
+                metadata = _json.load(f)
+        except (OSError, IOError, ValueError):
+            return None
+        try:
+            raw_shape = _raw_from_brep_bytes(data)
+        except ValueError:
+            self._remove(key)
+            return None
+        os.utime(brep_path, None)  # Last use, for eviction
+        return globals()[metadata['stype']](raw_shape)
+
+    def put(self, key, shape, metadata=None):
+        r"""Stores shape under key
+
+        Parameters
+        ----------
+        key : str
+        shape : Shape
+        metadata : dict, optional (default is None)
+            Additional JSON serializable information
+
+        """
+        brep_path, json_path = self._paths(key)
+        info = dict(metadata or {})
+        info.update({'stype': shape.stype,
+                     'ccad': _ccad_version,
+                     'occ': _occ_version})
+        # Write then rename, so readers never see partial files
+        for name, data in ((brep_path, shape.to_brep_bytes(binary=True)),
+                           (json_path, _json.dumps(info).encode('utf-8'))):
+            fd, tmp_name = _tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, name)
+        self.evict()
+
+    def evict(self):
+        r"""Drops entries older than max_age, then the least recently used
+        entries until the cache fits in max_bytes"""
+        now = _time.time()
+        entries = []
+        for entry in self._entries():
+            if self.max_age is not None and now - entry[3] > self.max_age:
+                self._remove(entry[0])
+            else:
+                entries.append(entry)
+        total = sum(entry[1] for entry in entries)
+        for key, size, _, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+
+    def clear(self):
+        r"""Removes all entries"""
+        for entry in self._entries():
+            self._remove(entry[0])
+
+
+class BooleanCache(object):
+    r""" Least recently used cache of boolean operation results
+
+    Results are keyed by the operation, the refine flag and the
+    fingerprints of both operands: the sha256 digest of their binary
+    BREP, computed once per shape and dropped whenever its shape is
+    replaced.  Operands equal in geometry hit the cache even if they
+    were built separately.  Results can also be kept in a DiskCache,
+    so they survive between sessions.
+
+    """
+
+    def __init__(self, max_entries=256, directory=None):
+        """
+
+        Parameters
+        ----------
+
+        max_entries : int, optional (default is 256)
+            Number of results kept in memory
+        directory : str, optional (default is None)
+            Directory of the DiskCache backing the memory cache.  None
+            keeps the results in memory only.
+
+        """
+        self.max_entries = max_entries
+        self.disk = None if directory is None else DiskCache(directory)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        r"""Empties the memory cache"""
+        self._entries.clear()
+
+    @staticmethod
+    def fingerprint(shape):
+        r"""Returns the sha256 hex digest of the binary BREP of shape,
+        memoized with its topology
+
+        Parameters
+        ----------
+        shape : Shape
+
+        """
+        data = shape._topology_index().data
+        orientation = int(shape.shape.Orientation())
+        # Some operations reorient the raw shape in place
+        if data.get('fingerprint', (None,))[0] != orientation:
+            data['fingerprint'] = (orientation, _hashlib.sha256(
+                shape.stype.encode('utf-8') +
+                shape.to_brep_bytes(binary=True)).hexdigest())
+        return data['fingerprint'][1]
+
+    def result(self, operation, s1, s2, refine, compute):
+        r"""Returns the cached result of operation between s1 and s2,
+        calling compute on a miss
+
+        Parameters
+        ----------
+        operation : str
+        s1 : Shape
+        s2 : Shape
+        refine : int
+        compute : callable without arguments returning the Solid result
 
         Returns
         -------
         Solid
 
         """
-        return self._geometry
+        # Operand order is kept even for fuse and common: it changes
+        # the subshape order of the result, which indices rely on
+        key = (operation, bool(refine), self.fingerprint(s1),
+               self.fingerprint(s2))
+        raw_shape = self._entries.get(key)
+        if raw_shape is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            disk_key = None
+            result = None
+            if self.disk is not None:
+                disk_key = DiskCache.key(_ccad_version, _occ_version, *key)
+                result = self.disk.get(disk_key)
+            if result is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                result = compute()
+                if self.disk is not None:
+                    self.disk.put(disk_key, result,
+                                  {'operation': operation})
+            raw_shape = result.shape
+            self._entries[key] = raw_shape
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        # A new TopoDS_Shape sharing the cached TShape, so that in place
+        # changes of the returned solid don't reach the cache
+        return Solid(raw_shape.Located(raw_shape.Location()))
+
+
+_boolean_cache = None
+
+
+def enable_boolean_cache(max_entries=256, directory=None):
+    """
+    Caches the results of fuse, cut and common (and of the +, - and &
+    operators on solids), so that repeating an operation on unchanged
+    operands returns at once.
+
+    Parameters
+    ----------
+    max_entries : int, optional (default is 256)
+    directory : str, optional (default is None)
+        Also keeps the results on disk in this directory
+
+    Returns
+    -------
+    BooleanCache
+
+    """
+    global _boolean_cache
+    _boolean_cache = BooleanCache(max_entries, directory)
+    return _boolean_cache
+
+
+def disable_boolean_cache():
+    """
+    Stops caching boolean results and drops the cached ones.
+    """
+    global _boolean_cache
+    _boolean_cache = None
+
+
+# Interface_Static STEP settings: option -> (parameter, type)
+_step_statics = {'precision_mode': ('write.precision.mode', 'I'),
+                 'precision_value': ('write.precision.val', 'R'),
+                 'assembly': ('write.step.assembly', 'I'),
+                 'schema': ('write.step.schema', 'C'),
+                 'product': ('write.product.name', 'C'),
+                 'surface_curve_mode': ('write.surfacecurve.mode', 'I'),
+                 'units': ('write.step.unit', 'C'),
+                 'product_name': ('write.step.product.name', 'C')}
+_step_transfer_modes = [_STEPControl.STEPControl_AsIs,
+                        _STEPControl.STEPControl_ManifoldSolidBrep,
+                        _STEPControl.STEPControl_FacetedBrep,
+                        _STEPControl.STEPControl_ShellBasedSurfaceModel,
+                        _STEPControl.STEPControl_GeometricCurveSet]
+# Interface_Static is global, so STEP sessions run one at a time
+_step_lock = _threading.RLock()
+_step_controller = []
+
+
+def _get_static(parameter, kind):
+    if kind == 'I':
+        return _Interface_Static_IVal(parameter)
+    elif kind == 'R':
+        return _Interface_Static_RVal(parameter)
+    return _Interface_Static_CVal(parameter)
+
+
+def _set_static(parameter, kind, value):
+    if kind == 'I':
+        _Interface_Static_SetIVal(parameter, int(value))
+    elif kind == 'R':
+        _Interface_Static_SetRVal(parameter, float(value))
+    else:
+        _Interface_Static_SetCVal(parameter, str(value))
+
+
+class StepWriterSession(object):
+    r""" Context manager exporting many shapes in .stp format
+
+    The STEP controller is initialized once per process.  The options
+    (see Shape.to_step) are set on entry and the previous global
+    Interface_Static values are restored on exit.  Sessions hold a lock,
+    so concurrent sessions run one after the other.
+
+    Examples
+    --------
+
+    with StepWriterSession(schema=3) as session:
+        for name, shape in parts:
+            session.write_shape(shape, name + '.stp', name)
+
+    """
+
+    def __init__(self, **options):
+        """
+
+        Parameters
+        ----------
+
+        options : see Shape.to_step
+
+        """
+        self.options = options
+        self._saved = None
+        self._writer = None
+        self._product_name = None
+        self.count = 0
+        self.transfer_mode = _step_transfer_modes[
+            options.get('transfer_mode', 0)]
+
+    def __enter__(self):
+        _step_lock.acquire()
+        try:
+            if not _step_controller:
+                c = _STEPControl.STEPControl_Controller()
+                c.Init()
+                _step_controller.append(c)
+            self._saved = [(parameter, kind, _get_static(parameter, kind))
+                           for parameter, kind in _step_statics.values()]
+            for option, (parameter, kind) in _step_statics.items():
+                if option in self.options:
+                    _set_static(parameter, kind, self.options[option])
+            self._product_name = _get_static('write.step.product.name', 'C')
+            self._new_writer()
+        except Exception:
+            _step_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            for parameter, kind, value in self._saved:
+                _set_static(parameter, kind, value)
+        finally:
+            self._writer = None
+            _step_lock.release()
+        return False
+
+    def _new_writer(self):
+        self._writer = _STEPControl.STEPControl_Writer()
+        if 'schema' in self.options:
+            self._writer.Model(True)
+        self.count = 0
+
+    def add(self, shape, name=None):
+        r"""Transfers shape to the file being written
+
+        Parameters
+        ----------
+        shape : Shape
+        name : str, optional (default is None)
+            The STEP product name of the shape
+
+        Returns
+        -------
+        bool : False if the shape could not be translated
+
+        """
+        _set_static('write.step.product.name', 'C',
+                    self._product_name if name is None else name)
+        okay = self._writer.Transfer(shape.shape, self.transfer_mode)
+        if okay in [_IFSelect.IFSelect_RetError,
+                    _IFSelect.IFSelect_RetFail,
+                    _IFSelect.IFSelect_RetStop]:
+            logger.error('Error: Could not translate shape to step')
+            return False
+        self.count += 1
+        return True
+
+    def write(self, filename):
+        r"""Writes the shapes added since the last write to filename
+
+        Parameters
+        ----------
+        filename : str
+
+        Returns
+        -------
+        bool : False if the file could not be written
+
+        """
+        okay = self._writer.Write(filename)
+        self._new_writer()
+        if okay != _IFSelect.IFSelect_RetDone:
+            logger.error('Error: Could not write %s' % filename)
+            return False
+        return True
+
+    def write_shape(self, shape, filename, name=None):
+        r"""Writes shape alone to filename
+
+        Parameters
+        ----------
+        shape : Shape
+        filename : str
+        name : str, optional (default is None)
+
+        Returns
+        -------
+        bool
+
+        """
+        return self.add(shape, name) and self.write(filename)
 
 
 class Shape(object):
@@ -1918,6 +4375,24 @@ class Shape(object):
             solid
     """
 
+    @property
+    def shape(self):
+        r"""The underlying OCC shape
+
+        Returns
+        -------
+        TopoDS_Shape
+
+        """
+        return self._shape
+
+    @shape.setter
+    def shape(self, raw_shape):
+        # Every in-place method replaces the shape through here, which
+        # invalidates the cached topology
+        self._shape = raw_shape
+        self._topology = None
+
     def _raw_type(self):
         return _raw_type(self.shape)
 
@@ -1932,6 +4407,58 @@ class Shape(object):
         """
         _breptools_Write(self.shape, name)
 
+    def to_brep_bytes(self, binary=False):
+        """
+        Returns the shape in .brep format
+
+        Parameters
+        ----------
+        binary : bool, optional (default is False)
+            Use the faster and smaller binary BREP format when OCC
+            provides it (7.3+); the text format otherwise
+
+        Returns
+        -------
+        bytes
+
+        """
+        return _raw_to_brep_bytes(self.shape, binary)
+
+    @classmethod
+    def from_brep_bytes(cls, data):
+        """
+        Returns the shape stored by to_brep_bytes
+
+        Parameters
+        ----------
+        data : bytes
+            Text or binary BREP
+
+        Returns
+        -------
+        Shape : of class cls, or of the stored shape type when called on
+        Shape
+
+        """
+        raw_shape = _raw_from_brep_bytes(data)
+        if cls is Shape:
+            return _convert_import(raw_shape)
+        return cls(raw_shape)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_shape', None)
+        state.pop('_topology', None)  # Rebuilt on demand
+        state['_brep'] = self.to_brep_bytes(binary=True)
+        return state
+
+    def __setstate__(self, state):
+        state = state.copy()
+        raw_shape = _raw_from_brep_bytes(state.pop('_brep'))
+        self.__dict__.update(state)
+        # The constructors downcast the raw shape
+        self.shape = type(self)(raw_shape).shape
+
     def to_iges(self, name, **options):
         """
         Exports the shape in .igs format.  It supports the following options:
@@ -2077,56 +4604,53 @@ class Shape(object):
 
         """
 
-        # Setup
-        c = _STEPControl.STEPControl_Controller()
-        c.Init()
-        w = _STEPControl.STEPControl_Writer()
+        with StepWriterSession(**options) as session:
+            if session.add(self):
+                session.write(name)
 
-        # Parse Options
-        if 'precision_mode' in options:
-            _Interface_Static_SetIVal('write.precision.mode',
-                                      options['precision_mode'])
-        if 'precision_value' in options:
-            _Interface_Static_SetRVal('write.precision.val',
-                                      options['precision_value'])
-        if 'assembly' in options:
-            _Interface_Static_SetIVal('write.step.assembly',
-                                      options['assembly'])
-        if 'schema' in options:
-            _Interface_Static_SetCVal('write.step.schema',
-                                      str(options['schema']))
-            w.Model(True)
-        if 'product' in options:
-            _Interface_Static_SetCVal('write.product.name',
-                                      options['product'])
-        if 'surface_curve_mode' in options:
-            _Interface_Static_SetIVal('write.surfacecurve.mode',
-                                      options['surface_curve_mode'])
-        if 'units' in options:
-            _Interface_Static_SetCVal('write.step.unit', options['units'])
-        if 'transfer_mode' in options:
-            transfer_modes = [_STEPControl.STEPControl_AsIs,
-                              _STEPControl.STEPControl_ManifoldSolidBrep,
-                              _STEPControl.STEPControl_FacetedBrep,
-                              _STEPControl.STEPControl_ShellBasedSurfaceModel,
-                              _STEPControl.STEPControl_GeometricCurveSet]
-            transfer_mode = transfer_modes[options['transfer_mode']]
-        else:
-            transfer_mode = _STEPControl.STEPControl_AsIs
+    def mesh(self, linear_deflection=None, angular_deflection=0.5,
+             relative=False, merge_tolerance=1e-9, cache=True):
+        """
+        Tessellates the faces of the shape once with
+        BRepMesh_IncrementalMesh and returns the triangles in numpy
+        arrays, with coincident vertices merged.
+
+        Meshes are shared through mesh_cache, so exporting or displaying
+        the same shape again doesn't re-tessellate it.
 
-        # Write
-        okay = w.Transfer(self.shape, transfer_mode)
-        if okay in [_IFSelect.IFSelect_RetError,
-                    _IFSelect.IFSelect_RetFail,
-                    _IFSelect.IFSelect_RetStop]:
-            # print('Error: Could not translate shape to step')
-            logger.error('Error: Could not translate shape to step')
-        else:
-            w.Write(name)
+        Parameters
+        ----------
+        linear_deflection : float, optional (default is None)
+            Maximum distance between the mesh and the surface.  None
+            is 1/1000 of the bounding box diagonal.
+        angular_deflection : float, optional (default is 0.5)
+            Maximum angle (radians) between adjacent triangles
+        relative : bool, optional (default is False)
+            linear_deflection is relative to each edge size
+        merge_tolerance : float, optional (default is 1e-9)
+            Vertices closer than this are merged
+        cache : bool, optional (default is True)
+            Use mesh_cache.  The cached arrays are read-only.
+
+        Returns
+        -------
+        Mesh
+
+        """
+        if cache:
+            return mesh_cache.mesh(self, linear_deflection, angular_deflection,
+                                   relative, merge_tolerance)
+        return _raw_mesh(self.shape, self._raw_index('Face'),
+                         linear_deflection, angular_deflection, relative,
+                         merge_tolerance)
 
     def to_html(self, filename_html,color=(0.65,0.65,0.65)):
         r"""Generates an html file to view the Shape in the browser
 
+        The faces are triangulated through the shared mesh cache (see
+        mesh) first, so the renderer reuses the triangulation of a
+        shape already meshed.
+
         Parameters
         ----------
         filename_html : str
@@ -2147,6 +4671,7 @@ class Shape(object):
                                                   '%s.x3d' % name_no_extension)
                 self._html_filename = path_
 
+        _warm_triangulation(self)
         renderer = X3DomRendererCustomized(path_=filename_html)
         renderer.DisplayShape(self.shape,
                               vertex_shader=None,
@@ -2162,16 +4687,54 @@ class Shape(object):
 
         renderer.GenerateHTMLFile()
 
-    def transform(self, matrix):
+    def transform(self, matrix, lazy=False):
         """
         transform the shape
 
         Parameters
         ----------
         matrix  : np.array
+        lazy : bool, optional (default is False)
+            Record a rigid transform in the shape location instead of
+            copying the geometry (see materialize)
+
+        """
+        self.shape = _transform(self, matrix, lazy)
 
+    def transform_chain(self, steps, lazy=False):
         """
-        self.shape = _transform(self, matrix)
+        transforms the shape by a sequence of transformations composed
+        into one, so the geometry is copied once (or not at all with
+        lazy)
+
+        Parameters
+        ----------
+        steps : list[tuple]
+            Applied in order.  Each step is one of ('translate', pdir),
+            ('rotate', pabout, pdir, angle), ('rotatex', angle),
+            ('rotatey', angle), ('rotatez', angle),
+            ('mirror', pabout, pdir), ('scale', sf) or
+            ('transform', matrix)
+        lazy : bool, optional (default is False)
+            Record a rigid result in the shape location instead of
+            copying the geometry (see materialize)
+
+        """
+        self.shape = _apply_trsf(self, _chain_trsf(steps), lazy)
+
+    def materialize(self):
+        """
+        applies the location accumulated by lazy transforms to the
+        geometry, leaving the shape with an identity location.  Needed
+        only by code that reads the underlying geometry directly.
+        """
+        location = self.shape.Location()
+        if location.IsIdentity():
+            return
+        trf = _BRepBuilderAPI.BRepBuilderAPI_Transform(
+            self.shape.Located(_TopLoc_Location()),
+            location.Transformation(), True)
+        self.shape = trf.Shape()
 
     def unitary(self, matrix):
         """
@@ -2184,18 +4747,21 @@ class Shape(object):
         """
         self.shape = _unitary(self, matrix)
 
-    def translate(self, pdir):
+    def translate(self, pdir, lazy=False):
         """
         moves the shape
 
         Parameters
         ----------
         pdir
+        lazy : bool, optional (default is False)
+            Record the move in the shape location instead of copying
+            the geometry (see materialize)
 
         """
-        self.shape = _translate(self, pdir)
+        self.shape = _translate(self, pdir, lazy)
 
-    def rotate(self, pabout, pdir, angle):
+    def rotate(self, pabout, pdir, angle, lazy=False):
         """
         rotates the shape
 
@@ -2204,42 +4770,51 @@ class Shape(object):
         pabout
         pdir
         angle : float
+        lazy : bool, optional (default is False)
+            Record the rotation in the shape location instead of
+            copying the geometry (see materialize)
 
         """
-        self.shape = _rotate(self, pabout, pdir, angle)
+        self.shape = _rotate(self, pabout, pdir, angle, lazy)
 
-    def rotatex(self, angle):
+    def rotatex(self, angle, lazy=False):
         """
         rotates the shape about (0.0, 0.0, 0.0) around (1.0, 0.0, 0.0)
 
         Parameters
         ----------
         angle : float
+        lazy : bool, optional (default is False)
 
         """
-        self.shape = _rotate(self, (0.0, 0.0, 0.0), (1.0, 0.0, 0.0), angle)
+        self.shape = _rotate(self, (0.0, 0.0, 0.0), (1.0, 0.0, 0.0), angle,
+                             lazy)
 
-    def rotatey(self, angle):
+    def rotatey(self, angle, lazy=False):
         """
         rotates the shape about (0.0, 0.0, 0.0) around (0.0, 1.0, 0.0)
 
         Parameters
         ----------
         angle : float
+        lazy : bool, optional (default is False)
 
         """
-        self.shape = _rotate(self, (0.0, 0.0, 0.0), (0.0, 1.0, 0.0), angle)
+        self.shape = _rotate(self, (0.0, 0.0, 0.0), (0.0, 1.0, 0.0), angle,
+                             lazy)
 
-    def rotatez(self, angle):
+    def rotatez(self, angle, lazy=False):
         """
         rotates the shape about (0.0, 0.0, 0.0) around (1.0, 0.0, 0.0)
 
         Parameters
         ----------
         angle : float
+        lazy : bool, optional (default is False)
 
         """
-        self.shape = _rotate(self, (0.0, 0.0, 0.0), (0.0, 0.0, 1.0), angle)
+        self.shape = _rotate(self, (0.0, 0.0, 0.0), (0.0, 0.0, 1.0), angle,
+                             lazy)
 
     # def unitary(self, U):
     #     self.shape = _unitary(self, U)
@@ -2344,30 +4919,52 @@ class Shape(object):
         raw_type : str
 
         """
-        raw_types = {'Vertex': _TopAbs.TopAbs_VERTEX,
-                     'Edge': _TopAbs.TopAbs_EDGE,
-                     'Wire': _TopAbs.TopAbs_WIRE,
-                     'Face': _TopAbs.TopAbs_FACE,
-                     'Shell': _TopAbs.TopAbs_SHELL,
-                     'Solid': _TopAbs.TopAbs_SOLID,
-                     'Compound':_TopAbs.TopAbs_COMPOUND,
-                     'Compsolid':_TopAbs.TopAbs_COMPSOLID}
         # This returns OCC types, not ccad types
-        if self.stype == 'Wire' and raw_type == 'Edge':
-            # Ordered this way
-            ex = _BRepTools.BRepTools_WireExplorer(_TopoDS_wire(self.shape))
-        else:
-            ex = _TopExp_Explorer(self.shape, raw_types[raw_type])
-        hashes = []
-        retval = []
-        while ex.More():
-            s1 = ex.Current()
-            s1_hash = s1.__hash__()
-            if s1_hash not in hashes:
-                hashes.append(s1_hash)
-                retval.append(s1)
-            ex.Next()
-        return retval
+        return self._raw_index(raw_type).to_list()
+
+    def _raw_index(self, raw_type):
+        """
+        Returns the _SubshapeIndex of all the OCC vertices, edges,
+        wires, faces, shells, or solids (dependent on raw_type) in the
+        shape.
+
+        Parameters
+        ----------
+        raw_type : str
+
+        """
+        return self._topology_index().subshapes(raw_type)
+
+    def _topology_index(self):
+        """
+        Returns the _TopologyIndex of the shape, building it on first
+        use.  It is dropped whenever self.shape is replaced.
+        """
+        if getattr(self, '_topology', None) is None:
+            # Wire edges are ordered this way
+            self._topology = _TopologyIndex(
+                self.shape, ordered_edges=(self.stype == 'Wire'))
+        return self._topology
+
+    def subshape_index(self, s):
+        """
+        Returns the index of the subshape s in the list returned by
+        subshapes(s.stype).
+
+        Parameters
+        ----------
+        s : Shape
+
+        Returns
+        -------
+        int
+
+        Raises
+        ------
+        ValueError : if s is not a subshape of the shape
+
+        """
+        return self._raw_index(s.stype).index(s.shape)
 
     def _valid_subshapes(self, include_top=False):
         r"""
@@ -2475,9 +5072,55 @@ class Shape(object):
         """
         centers = list()
         if self._valid_subshape(stype):
-            centers = [globals()[stype](s).center() for s in self._raw(stype)]
+            centers = [tuple(c) for c in self.properties(stype)[0].tolist()]
         return centers
 
+    def properties(self, stype):
+        """
+        Computes the mass properties of every subshape (as selected by
+        stype) in one pass and returns them as numpy arrays.  The mass
+        is a length for edges and wires, an area for faces and shells
+        and a volume for solids.  Vertices have no mass or inertia.
+
+        The arrays are cached until the shape changes.
+
+        Parameters
+        ----------
+        stype : str
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray]
+            The centers of mass (n x 3), the masses (n) and the matrices
+            of inertia (n x 3 x 3) of the n subshapes
+
+        """
+        if not self._valid_subshape(stype):
+            return np.zeros((0, 3)), np.zeros(0), np.zeros((0, 3, 3))
+        data = self._topology_index().data
+        key = ('properties', stype)
+        if key not in data:
+            raw_shapes = self._raw_index(stype)
+            centers = np.empty((len(raw_shapes), 3))
+            masses = np.zeros(len(raw_shapes))
+            inertias = np.zeros((len(raw_shapes), 3, 3))
+            gprops = _gprops.get(stype)
+            for i, raw_shape in enumerate(raw_shapes):
+                if gprops is None:  # Vertex
+                    p = _BRep_Tool.Pnt(_TopoDS_vertex(raw_shape))
+                else:
+                    g1 = _GProp_GProps()
+                    gprops(raw_shape, g1)
+                    p = g1.CentreOfMass()
+                    masses[i] = g1.Mass()
+                    m = g1.MatrixOfInertia()
+                    inertias[i] = [[m.Value(row, col) for col in (1, 2, 3)]
+                                   for row in (1, 2, 3)]
+                centers[i] = p.X(), p.Y(), p.Z()
+            data[key] = (centers, masses, inertias)
+        centers, masses, inertias = data[key]
+        return centers.copy(), masses.copy(), inertias.copy()
+
     def check(self):
         """
         Performs a BRep check.  Returns 1 if its okay.  Returns 0
@@ -2544,51 +5187,149 @@ class Shape(object):
                 if not flat:
                     s.dump(False, _level + 1)
 
-    def nearest(self, stype, positions, eps=1e-12):
+    def nearest(self, stype, positions, eps=1e-12, mode='center'):
         """
         Returns the index of the subshape nearest each position in
         positions.  If more than one shape tie for nearest, a 4th
         argument in positions selects which item to choose.
 
-        This algorithm could probably be improved ***
+        In 'center' mode, the subshape with the nearest center of mass
+        is chosen.  The centers are searched with a KD-tree (scipy's
+        cKDTree) when scipy is installed, otherwise with a vectorized
+        numpy scan.  Both are cached until the shape changes.
+
+        In 'distance' mode, the subshape with the smallest true
+        distance to the position is chosen.  That's the one you mean
+        on long or curved edges, whose center can be far from the edge
+        itself.  Subshape bounding boxes prune the candidates, so only
+        a few BRepExtrema_DistShapeShape evaluations run per position.
+        Positions where no distance can be computed fall back to the
+        'center' mode.
 
         Parameters
         ----------
         stype
         positions
         eps : float, optional (default is 1e-12)
-            A very small value
+            A very small value.  Compared to squared distances in
+            'center' mode and to distances in 'distance' mode.
+        mode : str, optional (default is 'center')
+            'center' or 'distance'
 
         """
-        shape_centers = self.subcenters(stype)
+        if mode == 'center':
+            candidates_function = self._nearest_centers
+        elif mode == 'distance':
+            candidates_function = self._nearest_distances
+        else:
+            msg = 'Error: Unknown nearest mode %s' % str(mode)
+            logger.error(msg)
+            raise ValueError(msg)
         shape_indices = []
         for pt in positions:
-            min_dsq = (pt[0] - shape_centers[0][0]) ** 2 + \
-                (pt[1] - shape_centers[0][1]) ** 2 + \
-                (pt[2] - shape_centers[0][2]) ** 2
-            arg_min = 0
-            arg_mins = []
-            for count in range(1, len(shape_centers)):
-                shape_center = shape_centers[count]
-                dsq = (pt[0] - shape_center[0]) ** 2 + \
-                    (pt[1] - shape_center[1]) ** 2 + \
-                    (pt[2] - shape_center[2]) ** 2
-                de = dsq - min_dsq
-                if de < 0.0:
-                    if -de < eps:
-                        arg_mins.append(arg_min)
-                    else:
-                        arg_mins = []
-                    min_dsq = dsq
-                    arg_min = count
-                elif de < eps:
-                    arg_mins.append(count)
-            if len(pt) == 4 and len(arg_mins) > 0:
-                shape_indices.append(arg_mins[pt[3] - 2])
-            else:
-                shape_indices.append(arg_min)
+            candidates, values = candidates_function(stype, pt, eps)
+            if len(candidates) == 0 and mode == 'distance':
+                logger.warning('Warning: No distance computed to %s; '
+                               'using the nearest center' % str(pt))
+                candidates, values = self._nearest_centers(stype, pt, eps)
+            shape_indices.append(_nearest_choice(candidates, values, pt))
         return shape_indices
 
+    def _nearest_centers(self, stype, pt, eps):
+        """
+        Returns the indices of the subshapes whose center squared
+        distance to pt is within eps of the minimum, in increasing
+        order, with their squared distances.
+
+        Parameters
+        ----------
+        stype
+        pt
+        eps : float
+
+        """
+        data = self._topology_index().data
+        key = ('center_tree', stype)
+        if key not in data:
+            centers = self.properties(stype)[0]
+            if _cKDTree is not None:
+                data[key] = (centers, _cKDTree(centers))
+            else:
+                data[key] = (centers, None)
+        centers, tree = data[key]
+        p = np.array(pt[:3], dtype=float)
+        if tree is not None:
+            d, i = tree.query(p)
+            candidates = set(tree.query_ball_point(p, _math.sqrt(d ** 2 + eps)))
+            candidates.add(int(i))
+            candidates = np.array(sorted(candidates), dtype=int)
+            dsqs = ((centers[candidates] - p) ** 2).sum(axis=1)
+            keep = dsqs - dsqs.min() < eps
+            candidates, dsqs = candidates[keep], dsqs[keep]
+        else:
+            dsqs = ((centers - p) ** 2).sum(axis=1)
+            candidates = np.nonzero(dsqs - dsqs.min() < eps)[0]
+            dsqs = dsqs[candidates]
+        return candidates, dsqs
+
+    def _nearest_distances(self, stype, pt, eps):
+        """
+        Returns the indices of the subshapes whose distance to pt is
+        within eps of the minimum, in increasing order, with their
+        distances.
+
+        Candidates are visited by increasing distance to their bounding
+        box, which is a lower bound of the distance to the subshape, and
+        the search stops as soon as that bound exceeds the best distance
+        found.
+
+        Parameters
+        ----------
+        stype
+        pt
+        eps : float
+
+        """
+        data = self._topology_index().data
+        key = ('bounds', stype)
+        raw_shapes = self._raw_index(stype)
+        if key not in data:
+            bounds = np.empty((len(raw_shapes), 6))
+            for i, raw_shape in enumerate(raw_shapes):
+                b1 = _Bnd_Box()
+                _brepbndlib_Add(raw_shape, b1)
+                if b1.IsVoid():  # e.g. degenerated edges; never nearest
+                    bounds[i] = (np.inf, np.inf, np.inf,
+                                 -np.inf, -np.inf, -np.inf)
+                else:
+                    bounds[i] = b1.Get()
+            data[key] = bounds
+        bounds = data[key]
+        p = np.array(pt[:3], dtype=float)
+        outside = np.maximum(np.maximum(bounds[:, :3] - p, p - bounds[:, 3:]),
+                             0.0)
+        lower_bounds = np.sqrt((outside ** 2).sum(axis=1))
+        v = _BRepBuilderAPI.BRepBuilderAPI_MakeVertex(
+            _gp.gp_Pnt(p[0], p[1], p[2])).Vertex()
+        best = np.inf
+        candidates = []
+        distances = []
+        for i in np.argsort(lower_bounds, kind='mergesort'):
+            if lower_bounds[i] > best + eps:
+                break
+            b = _BRepExtrema_DistShapeShape(v, raw_shapes[i])
+            if not b.IsDone():
+                continue
+            candidates.append(i)
+            distances.append(b.Value())
+            best = min(best, distances[-1])
+        candidates = np.array(candidates, dtype=int)
+        distances = np.array(distances)
+        keep = distances - best < eps
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.argsort(candidates)
+        return candidates[order], distances[order]
+
     def subtolerance(self, stype='all', ttype='all'):
         """
         Iterates through every vertex, edge, and face,
@@ -2895,18 +5636,9 @@ class Wire(Shape):
             Center coordinates
 
         """
-        subs = self.subshapes('Edge')
-        c = (0.0, 0.0, 0.0)
-        total_length = 0.0
-        for sub in subs:
-            sub_center = sub.center()
-            length = sub.length()
-            c = (c[0] + length * sub_center[0],
-                 c[1] + length * sub_center[1],
-                 c[2] + length * sub_center[2])
-            total_length = total_length + length
-        c = (c[0] / total_length, c[1] / total_length, c[2] / total_length)
-        return c
+        centers, lengths, _ = self.properties('Edge')
+        c = np.dot(lengths, centers) / lengths.sum()
+        return tuple(c.tolist())
 
     def length(self):
         """Length of the wire
@@ -2916,12 +5648,7 @@ class Wire(Shape):
         float : the length of the wire
 
         """
-        subs = self.subshapes('Edge')
-        total_length = 0.0
-        for sub in subs:
-            length = sub.length()
-            total_length = total_length + length
-        return total_length
+        return float(self.properties('Edge')[1].sum())
 
     def poly(self, deflection=1e-3):
         """
@@ -3034,7 +5761,7 @@ class Face(Shape):
     def plot(self, **kwargs):
         self.wire().plot(**kwargs)
 
-    def fillet(self, rad, vertex_indices=None):
+    def fillet(self, rad, vertex_indices=None, nearest_mode='center'):
         """
         Fillets the face at specified vertices with specified radii.
 
@@ -3054,6 +5781,8 @@ class Face(Shape):
         ----------
         rad : float or list[tuple[float, tuple[int]]
         vertex_indices : list[tuple[float]], optional (default is None)
+        nearest_mode : str, optional (default is 'center')
+            How coordinate positions select vertices (see nearest())
 
         """
 
@@ -3065,7 +5794,8 @@ class Face(Shape):
             if len(vertex_indices) <= 0:
                 return
             if not isinstance(vertex_indices[0], int):  # coordinate positions
-                vertex_indices = self.nearest('Vertex', vertex_indices)
+                vertex_indices = self.nearest('Vertex', vertex_indices,
+                                              mode=nearest_mode)
                 # print 'vertex_indices', vertex_indices
             fillet_rads = [(rad, vertex_indices)]
         else:
@@ -3256,19 +5986,12 @@ class Shell(Shape):
         For each Face calculate its area and center
 
         """
-        subs = self.subshapes('Face')
-        c = (0.0, 0.0, 0.0)
-        total_area = 0.0
-        for sub in subs:
-            sub_center = sub.center()
-            area = sub.area()
-            c = (c[0] + area * sub_center[0],
-                 c[1] + area * sub_center[1],
-                 c[2] + area * sub_center[2])
-            total_area = total_area + area
-        if total_area!=0:
-            c = (c[0] / total_area, c[1] / total_area, c[2] / total_area)
+        centers, areas, _ = self.properties('Face')
+        total_area = areas.sum()
+        if total_area != 0:
+            c = tuple((np.dot(areas, centers) / total_area).tolist())
         else:
+            c = (0.0, 0.0, 0.0)
             pdb.set_trace()
         return c
 
@@ -3281,7 +6004,7 @@ class Shell(Shape):
         float : the area of the shell
 
         """
-        return sum([sub.area() for sub in self.subshapes('Face')])
+        return float(self.properties('Face')[1].sum())
 
 
 class Solid(Shape):
@@ -3361,21 +6084,41 @@ class Solid(Shape):
             rel_deflection (0.001 Default): for relative_mode 1, deflection is
             multiplied by this
 
-        I found blender and gts had trouble with the output.  There
-        were many repeated vertices in ascii or binary mode.  Most
-        could be fixed by importing to blender, removing doubles, and
-        exporting to stl. ***
+            native:
+                0 (Default): write with StlAPI_Writer
+                1: write with Mesh.to_stl, which merges coincident
+                vertices, drops degenerate triangles and streams the
+                output.
+
+        Both writers read the mesh of the shared mesh cache (see mesh),
+        at the deflection set by relative_mode, abs_deflection and
+        rel_deflection.  The relative shape size is the bounding box
+        diagonal, so the default deflection is the one of mesh.
+
+        I found blender and gts had trouble with the output of
+        StlAPI_Writer.  There were many repeated vertices in ascii or
+        binary mode.  Most could be fixed by importing to blender,
+        removing doubles, and exporting to stl, or by using native. ***
         """
 
+        if options.get('relative_mode', 1):
+            deflection = _default_deflection(
+                self.shape, options.get('rel_deflection', 1e-3))
+        else:
+            deflection = options.get('abs_deflection', 0.01)
+        m1 = self.mesh(deflection)
+        if options.get('native', 0):
+            m1.to_stl(name, ascii=bool(options.get('ascii_mode', 1)))
+            return
+
         w = _StlAPI_Writer()
         if 'ascii_mode' in options:
             w.SetASCIIMode(options['ascii_mode'])
-        if 'relative_mode' in options:
-            w.SetRelativeMode(options['relative_mode'])
-        if 'abs_deflection' in options:
-            w.SetDeflection(options['abs_deflection'])
-        if 'rel_deflection' in options:
-            w.SetCoefficient(options['rel_deflection'])
+        # The faces hold the cached triangulation.  Writers meshing on
+        # their own (OCC < 7.2) keep it at the same deflection.
+        if hasattr(w, 'SetDeflection'):
+            w.SetRelativeMode(False)
+            w.SetDeflection(deflection)
         w.Write(self.shape, name)
 
     def center(self):
@@ -3392,7 +6135,7 @@ class Solid(Shape):
         p = g1.CentreOfMass()
         return p.X(), p.Y(), p.Z()
 
-    def fillet(self, rad, edge_indices=None):
+    def fillet(self, rad, edge_indices=None, nearest_mode='center'):
         """
         Fillets the solid at specified edges with specified radii.
 
@@ -3436,6 +6179,10 @@ class Solid(Shape):
             also be a list of [(x1, y1, z1), (x2, y2, z2), ...] where each
             (x1, y1, z1) specifies the edge with center nearest that
             point.
+        nearest_mode : str, optional (default is 'center')
+            How coordinate positions select edges.  'distance' selects
+            the edge nearest the point instead of the edge with the
+            nearest center (see nearest()).
 
         """
 
@@ -3447,7 +6194,8 @@ class Solid(Shape):
             if len(edge_indices) <= 0:
                 return
             if not isinstance(edge_indices[0], int):  # coordinate positions
-                edge_indices = self.nearest('Edge', edge_indices)
+                edge_indices = self.nearest('Edge', edge_indices,
+                                            mode=nearest_mode)
                 # print 'edge_indices', edge_indices
             fillet_rads = [(rad, edge_indices)]
         else:
@@ -3469,7 +6217,7 @@ class Solid(Shape):
         if changed:
             self.shape = b.Shape()
 
-    def chamfer(self, dist, edge_indices=None):
+    def chamfer(self, dist, edge_indices=None, nearest_mode='center'):
         """
         chamfers all edges in edge_indices the same distance at 45 degrees
 
@@ -3480,12 +6228,12 @@ class Solid(Shape):
         ----------
         dist : float
         edge_indices : list[int], optional (default is None)
+        nearest_mode : str, optional (default is 'center')
+            How coordinate positions select edges (see nearest())
 
         """
         if dist > 0.0:
-            edge_map = _TopTools.TopTools_IndexedDataMapOfShapeListOfShape()
-            _TopExp_MapShapesAndAncestors(self.shape, _TopAbs.TopAbs_EDGE,
-                                          _TopAbs.TopAbs_FACE, edge_map)
+            edge_map = self._topology_index().ancestors('Edge', 'Face')
             b = _BRepFilletAPI.BRepFilletAPI_MakeChamfer(self.shape)
             raw_edges = self._raw('Edge')
             if edge_indices is None:
@@ -3493,7 +6241,8 @@ class Solid(Shape):
             if len(edge_indices) <= 0:
                 return
             if not isinstance(edge_indices[0], int):  # coordinate positions
-                edge_indices = self.nearest('Edge', edge_indices)
+                edge_indices = self.nearest('Edge', edge_indices,
+                                            mode=nearest_mode)
 
             for edge_index in edge_indices:
                 e1 = raw_edges[edge_index]
@@ -3501,7 +6250,7 @@ class Solid(Shape):
                 b.Add(dist, dist, _TopoDS_edge(e1), _TopoDS_face(f1))
             self.shape = b.Shape()
 
-    def draft(self, angle, pdir, pt, face_indices):
+    def draft(self, angle, pdir, pt, face_indices, nearest_mode='center'):
         """
         Drafts faces in face_indices by angle from direction pdir and
         reference plane that passes through pt.
@@ -3516,13 +6265,16 @@ class Solid(Shape):
         pdir : tuple[float, float, float]
         pt : tuple[float, float, float]
         face_indices : list[int]
+        nearest_mode : str, optional (default is 'center')
+            How coordinate positions select faces (see nearest())
         """
         if angle != 0.0:
             d = _gp.gp_Dir(pdir[0], pdir[1], pdir[2])
             pln = _gp.gp_Pln(_gp.gp_Pnt(pt[0], pt[1], pt[2]), d)
             raw_faces = self._raw('Face')
             if not isinstance(face_indices[0], int):  # coordinate positions
-                face_indices = self.nearest('Face', face_indices)
+                face_indices = self.nearest('Face', face_indices,
+                                            mode=nearest_mode)
             b = _BRepOffsetAPI.BRepOffsetAPI_DraftAngle(self.shape)
             for face_index in face_indices:
                 b.Add(_TopoDS_face(raw_faces[face_index]), d, angle, pln)
@@ -3560,13 +6312,23 @@ class Solid(Shape):
         return bb
 
     def simplify(self, skip_edges=0, skip_faces=0, skip_fits=0,
-                 stopat=-1, tolerance=1e-3):
+                 stopat=-1, tolerance=1e-3, method='unify'):
         """
         Fuses edges that are C1 continuous and share a vertex.  Fuses
-        faces in the same domain that share an edge.  It's currently
-        slow, because FacesIntersector is slow.  (It's not the python
-        code.)  May want to remove internal edges and internal vertices
-        later. ***
+        faces in the same domain that share an edge.
+
+        The default 'unify' method groups adjacent faces by the identity
+        of their underlying surface (see _face_domain_key), joins the
+        groups with union-find and rebuilds the solid once with
+        ShapeUpgrade_UnifySameDomain, keeping the edges between groups
+        and from stopat on.  Other surfaces (splines, ...) are checked
+        pair by pair with FacesIntersector unless skip_fits.  OCC
+        versions without UnifySameDomain.KeepShape (< 7.3) fall back to
+        'pairwise'.
+
+        The 'pairwise' method checks every adjacent face pair with
+        FacesIntersector and re-sews after each merge.  It's slow,
+        because FacesIntersector is slow.  (It's not the python code.)
 
         Parameters
         ----------
@@ -3575,6 +6337,111 @@ class Solid(Shape):
         skip_fits : int, optional (default is 0)
         stopat : int, optional (default is -1)
         tolerance : float, optional (default is 1e-3)
+        method : str, optional (default is 'unify')
+            'unify' or 'pairwise'
+
+        """
+        if method == 'unify':
+            self._simplify_unify(skip_edges, skip_faces, skip_fits, stopat,
+                                 tolerance)
+        elif method == 'pairwise':
+            self._simplify_pairwise(skip_edges, skip_faces, skip_fits,
+                                    stopat, tolerance)
+        else:
+            msg = 'Error: Unknown simplify method %s' % str(method)
+            logger.error(msg)
+            raise ValueError(msg)
+
+    def _simplify_unify(self, skip_edges, skip_faces, skip_fits, stopat,
+                        tolerance):
+        """
+        Implements simplify(method='unify')
+
+        Parameters
+        ----------
+        skip_edges : int
+        skip_faces : int
+        skip_fits : int
+        stopat : int
+        tolerance : float
+
+        """
+        # Without KeepShape, UnifySameDomain would merge every group
+        if not hasattr(_ShapeUpgrade_UnifySameDomain, 'KeepShape'):
+            self._simplify_pairwise(skip_edges, skip_faces, skip_fits,
+                                    stopat, tolerance)
+            return
+
+        # Fuse Edges first
+        if not skip_edges:
+            b = _TopOpeBRepTool_FuseEdges(self.shape)
+            self.shape = b.Shape()
+        if skip_faces:
+            return
+
+        raw_faces = self._raw_index('Face')
+        keys = [_face_domain_key(f) for f in raw_faces]
+        parents = list(range(len(raw_faces)))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        edge_map = self._topology_index().ancestors('Edge', 'Face')
+        raw_edges = self._raw_index('Edge')
+        borders = []  # (edge, face index, face index)
+        kept = []  # edges from stopat on
+        for rec, raw_edge in enumerate(raw_edges):
+            if rec >= stopat >= 0:
+                kept.append(raw_edge)
+                continue
+            l1 = edge_map.FindFromKey(raw_edge)
+            i1 = raw_faces.index(l1.First())  # Assumes two faces per edge
+            i2 = raw_faces.index(l1.Last())
+            if i1 == i2:  # Avoid seam edges
+                continue
+            borders.append((raw_edge, i1, i2))
+            if find(i1) == find(i2):
+                continue
+            if keys[i1] is not None:
+                same = keys[i1] == keys[i2]
+            elif keys[i2] is None and not skip_fits:
+                same = _raw_faces_same_domain(raw_faces[i1], raw_faces[i2])
+            else:
+                same = False
+            if same:
+                parents[find(i1)] = find(i2)
+
+        if all(find(i) == i for i in range(len(raw_faces))):
+            return  # No common faces
+        b = _ShapeUpgrade_UnifySameDomain(self.shape, not skip_edges, True,
+                                          False)
+        # Only merge across the edges chosen above
+        for raw_edge, i1, i2 in borders:
+            if find(i1) != find(i2):
+                b.KeepShape(raw_edge)
+        for raw_edge in kept:
+            b.KeepShape(raw_edge)
+        b.Build()
+        new_shape = b.Shape()
+        if _raw_type(new_shape) == 'Solid':
+            new_shape = _TopoDS_solid(new_shape)
+        self.shape = new_shape
+
+    def _simplify_pairwise(self, skip_edges, skip_faces, skip_fits, stopat,
+                           tolerance):
+        """
+        Implements simplify(method='pairwise')
+
+        Parameters
+        ----------
+        skip_edges : int
+        skip_faces : int
+        skip_fits : int
+        stopat : int
+        tolerance : float
 
         """
         # # Seemed simple, but didn't work.  Glancing through the
@@ -3600,9 +6467,7 @@ class Solid(Shape):
 
         # Fuse Faces second (not easy)
         if not skip_faces:
-            edge_map = _TopTools.TopTools_IndexedDataMapOfShapeListOfShape()
-            _TopExp_MapShapesAndAncestors(self.shape, _TopAbs.TopAbs_EDGE,
-                                          _TopAbs.TopAbs_FACE, edge_map)
+            edge_map = self._topology_index().ancestors('Edge', 'Face')
             raw_edges = self._raw('Edge')
             common_faces = {}
             new_faces = []
@@ -4084,10 +6949,9 @@ def helix(rad, angle, turns, eps=1e-12):
     # Replicate the edge, spinning and translating, to make a helix
     retval = []
     for count in range(num_parts):
-        locale = e1.copy()
-        locale.rotatez(count * full_angle)
-        locale.translate((0.0, 0.0, count * z0))
-        retval.append(locale)
+        retval.append(transform_chained(e1, [('rotatez', count * full_angle),
+                                             ('translate',
+                                              (0.0, 0.0, count * z0))]))
     return Wire(retval)
 
 
@@ -4260,6 +7124,250 @@ def slice_(s1, x=None, y=None, z=None):
     return s2.subshapes('Face')
 
 
+_axes = {'x': 0, 'y': 1, 'z': 2}
+
+
+def _chain_polylines(segments, tolerance):
+    r"""
+    Joins polylines sharing end points (within tolerance) into the
+    longest possible polylines.  Closed polylines end with their first
+    point.
+
+    Parameters
+    ----------
+    segments : list[np.array]
+        (n, 3) polylines, in any order and direction
+    tolerance : float
+
+    Returns
+    -------
+    list[np.array]
+
+    """
+    def key(p):
+        return tuple(np.round(p / tolerance).astype(np.int64))
+
+    ends = {}
+    for i, segment in enumerate(segments):
+        for end in (0, -1):
+            ends.setdefault(key(segment[end]), []).append((i, end))
+    used = np.zeros(len(segments), dtype=bool)
+
+    def next_segment(p):
+        candidates = ends.get(key(p), [])
+        for i, end in candidates:
+            if not used[i]:
+                return i, end
+        # Rounding may have split coincident points between two keys
+        for i, segment in enumerate(segments):
+            if used[i]:
+                continue
+            for end in (0, -1):
+                if la.norm(segment[end] - p) <= tolerance:
+                    return i, end
+        return None
+
+    polylines = []
+    for i, segment in enumerate(segments):
+        if used[i]:
+            continue
+        used[i] = True
+        parts = [segment]
+        while la.norm(parts[-1][-1] - parts[0][0]) > tolerance:
+            found = next_segment(parts[-1][-1])
+            if found is None:
+                break
+            j, end = found
+            used[j] = True
+            parts.append(segments[j] if end == 0 else segments[j][::-1])
+        polyline = np.concatenate([parts[0]] + [part[1:] for part in
+                                                parts[1:]])
+        if len(polyline) > 2 and \
+                la.norm(polyline[-1] - polyline[0]) <= tolerance:
+            polyline[-1] = polyline[0]
+        polylines.append(polyline)
+    return polylines
+
+
+def _raw_slices(raw_shape, axis, levels, deflection, tolerance):
+    r"""
+    Returns, for each level, the polylines of the section of raw_shape
+    by the plane normal to axis at that level.
+
+    All the planes go through a single BOPAlgo_Section, so the
+    intersection data of raw_shape is prepared once and shared by the
+    levels; the section edges are then sorted by level.
+
+    Parameters
+    ----------
+    raw_shape : TopoDS_Shape
+    axis : int
+        0, 1 or 2
+    levels : iterable of float
+    deflection : float
+    tolerance : float
+
+    Returns
+    -------
+    list[list[np.array]]
+
+    """
+    b1 = _Bnd_Box()
+    _brepbndlib_Add(raw_shape, b1)
+    bounds = np.array(b1.Get())
+    levels = np.asarray(list(levels), dtype=float)
+    inside = np.nonzero((bounds[axis] <= levels) &
+                        (levels <= bounds[axis + 3]))[0]
+    segments = [[] for _ in levels]
+    if len(inside) == 0:
+        return segments
+    direction = [0.0, 0.0, 0.0]
+    direction[axis] = 1.0
+    # Plane faces reaching beyond the shape, whatever their u, v axes
+    size = la.norm(np.maximum(abs(bounds[:3]), abs(bounds[3:]))) + 1.0
+    b2 = _BOPAlgo.BOPAlgo_Section()
+    b2.AddArgument(raw_shape)
+    for index in inside:
+        origin = [0.0, 0.0, 0.0]
+        origin[axis] = levels[index]
+        b2.AddArgument(_BRepBuilderAPI.BRepBuilderAPI_MakeFace(
+            _gp.gp_Pln(_gp.gp_Pnt(*origin), _gp.gp_Dir(*direction)),
+            -size, size, -size, size).Face())
+    b2.Perform()
+    if b2.HasErrors():
+        msg = 'Section failed'
+        logger.error(msg)
+        raise ValueError(msg)
+    inside_levels = levels[inside]
+    ex = _TopExp_Explorer(b2.Shape(), _TopAbs.TopAbs_EDGE)
+    while ex.More():
+        polyline = np.array(Edge(ex.Current()).poly(deflection))
+        nearest = np.argmin(abs(inside_levels - polyline[:, axis].mean()))
+        segments[inside[nearest]].append(polyline)
+        ex.Next()
+    return [_chain_polylines(level_segments, tolerance)
+            for level_segments in segments]
+
+
+def _slices_worker(args):
+    r"""slices worker: sections the shape given as BREP bytes
+
+    Parameters
+    ----------
+    args : tuple(bytes, int, list[float], float, float)
+
+    """
+    data, axis, levels, deflection, tolerance = args
+    return _raw_slices(_raw_from_brep_bytes(data), axis, levels, deflection,
+                       tolerance)
+
+
+def _polyline_faces(polylines, axis):
+    r"""
+    Returns the planar faces bounded by the closed polylines of a
+    section, the polylines nested inside another one being its holes.
+
+    Parameters
+    ----------
+    polylines : list[np.array]
+    axis : int
+
+    Returns
+    -------
+    list[Face]
+
+    """
+    from matplotlib.path import Path
+    plane_axes = [k for k in range(3) if k != axis]
+    closed = [p for p in polylines if len(p) > 3 and (p[0] == p[-1]).all()]
+    paths = [Path(p[:, plane_axes]) for p in closed]
+    # Nesting depth: loops inside an even number of loops are outer
+    # boundaries, the others are holes of their innermost container
+    parents = []
+    for i, p in enumerate(closed):
+        containers = [j for j, path in enumerate(paths)
+                      if j != i and path.contains_point(p[0, plane_axes])]
+        parents.append(containers)
+    depths = [len(containers) for containers in parents]
+
+    def oriented(p, counterclockwise):
+        xy = p[:, plane_axes]
+        area = np.sum(xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1])
+        return p if (area > 0.0) == counterclockwise else p[::-1]
+
+    faces = []
+    for i, p in enumerate(closed):
+        if depths[i] % 2:
+            continue
+        holes = [polygon(oriented(closed[j], False))
+                 for j in range(len(closed))
+                 if depths[j] == depths[i] + 1 and i in parents[j]]
+        faces.append(plane(polygon(oriented(p, True)), holes))
+    return faces
+
+
+Slice = namedtuple('Slice', ['level', 'polylines', 'faces'])
+
+
+def slices(s1, axis='z', levels=None, workers=1, faces=False,
+           deflection=1e-3, tolerance=1e-6):
+    """
+    Returns the sections of solid s1 by the planes normal to axis at
+    each of levels, e.g. the layers of an additive manufacturing
+    build.
+
+    Unlike slice_, the layers are not booleans with a face per level:
+    all the levels (or each chunk of levels in a process pool) are
+    sectioned in one BOPAlgo_Section, so the intersection data of s1 is
+    prepared once and shared by the levels.
+
+    Parameters
+    ----------
+    s1 : Solid
+    axis : str, optional (default is 'z')
+        'x', 'y' or 'z'
+    levels : iterable of float
+    workers : int, optional (default is 1)
+        Number of processes.  None uses the number of CPUs; 1 slices in
+        this process.
+    faces : bool, optional (default is False)
+        Also builds the planar Faces bounded by the contours
+    deflection : float, optional (default is 1e-3)
+        Of the polyline approximation of the contours
+    tolerance : float, optional (default is 1e-6)
+        Under which contour end points are joined
+
+    Returns
+    -------
+    list[Slice] : in the order of levels.  Each slice holds the level,
+    the contours as (n, 3) np.array polylines, closed ones ending with
+    their first point, and the list of Faces (None unless faces is
+    True).
+
+    """
+    if axis not in _axes:
+        msg = 'axis must be x, y or z, not %s' % axis
+        logger.error(msg)
+        raise ValueError(msg)
+    axis = _axes[axis]
+    levels = [float(level) for level in levels]
+    if workers == 1 or len(levels) < 2:
+        layers = _raw_slices(s1.shape, axis, levels, deflection, tolerance)
+    else:
+        data = _raw_to_brep_bytes(s1.shape, binary=True)
+        n = min(len(levels), 4 * (workers or os.cpu_count() or 1))
+        chunks = [list(chunk) for chunk in np.array_split(levels, n)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            layers = [layer for chunk in executor.map(
+                          _slices_worker,
+                          [(data, axis, chunk, deflection, tolerance)
+                           for chunk in chunks])
+                      for layer in chunk]
+    return [Slice(level, polylines,
+                  _polyline_faces(polylines, axis) if faces else None)
+            for level, polylines in zip(levels, layers)]
+
+
 # Solid Primitives
 
 def box(dx, dy, dz):
@@ -4743,39 +7851,23 @@ def pipe(profile, spine, continuous=False, transition='sharp',
             return Solid(b.Shape())
 
 
-def helical_solid(profile, rad, angle, turns):
-    """
-    Returns a profile spun in a helix.  Why not use pipe?  Pipe
-    changed the orientation of the profile.  This routine fixes the
-    orientation correctly.
-
-    profile is in the xy plane.  The helix will pass through (0,0).
-
-    Turns must be an integer multiple of 0.25
-
-    This routine only generates a quarter helix solid, then replicates
-    and boolean merges to make the full solid.  Therefore, it is very
-    expensive.  There must be a better way.  I am also uncertain how
-    interpolation is done along the spine.  It may not be exact.
+def _quarter_helical_solid(profile, rad, angle):
+    r"""
+    Returns the solid of profile spun a quarter helix turn, starting at
+    (rad, 0, 0), with the profile oriented normal to the helix.
 
     Parameters
     ----------
-
     profile :
     rad : float
         Helix radius
     angle : float
-    turns : float
-        Number of turns of the helix
 
     Returns
     -------
-
     Solid
 
     """
-
-    # Create a quarter of the solid
     local_turns = 0.25
     spine = helix(rad, angle, local_turns)
     # Orient the profile normal to the helix
@@ -4793,15 +7885,103 @@ def helical_solid(profile, rad, angle, turns):
                                  (count * rad * _math.pi / 2 *
                                   _math.tan(angle))))
         profiles.append(local_profile)
-    quarter_thread = pipe(profiles, spine, continuous=False)
+    return pipe(profiles, spine, continuous=False)
+
+
+def _helical_quarters(quarter_thread, rad, angle, turns):
+    r"""
+    Returns the rotated and raised copies of quarter_thread which make
+    up turns helix turns.
+
+    Parameters
+    ----------
+    quarter_thread : Solid
+    rad : float
+    angle : float
+    turns : float
+
+    Returns
+    -------
+    list[Solid]
 
-    # Spin and translate the quarter into the full
-    retval = quarter_thread.copy()
+    """
+    quarters = [quarter_thread]
     for count in range(1, int(round(turns * 4))):
-        local_thread = quarter_thread.copy()
-        local_thread.rotatez((count % 4) * _math.pi / 2)
-        local_thread.translate((0.0, 0.0,
-                                count * rad * _math.pi / 2 * _math.tan(angle)))
+        # The copies share the quarter geometry, placed by location
+        quarters.append(transform_chained(
+            quarter_thread,
+            [('rotatez', (count % 4) * _math.pi / 2),
+             ('translate',
+              (0.0, 0.0, count * rad * _math.pi / 2 * _math.tan(angle)))],
+            lazy=True))
+    return quarters
+
+
+def helical_solid(profile, rad, angle, turns, parallel=True):
+    """
+    Returns a profile spun in a helix.  Why not use pipe?  Pipe
+    changed the orientation of the profile.  This routine fixes the
+    orientation correctly.
+
+    profile is in the xy plane.  The helix will pass through (0,0).
+
+    Turns must be an integer multiple of 0.25
+
+    This routine only generates a quarter helix solid, then replicates
+    it and fuses all the copies in a single multi-argument boolean
+    (see fuse_all), so the cost grows about linearly with turns.  I am
+    uncertain how interpolation is done along the spine.  It may not
+    be exact.
+
+    Parameters
+    ----------
+
+    profile :
+    rad : float
+        Helix radius
+    angle : float
+    turns : float
+        Number of turns of the helix
+    parallel : bool, optional (default is True)
+        Run the boolean intersections in parallel threads
+
+    Returns
+    -------
+
+    Solid
+
+    """
+    quarter_thread = _quarter_helical_solid(profile, rad, angle)
+    return fuse_all(_helical_quarters(quarter_thread, rad, angle, turns),
+                    parallel=parallel)
+
+
+def old_helical_solid(profile, rad, angle, turns):
+    """
+    Returns a profile spun in a helix.  Same as helical_solid, but fuses
+    the quarter copies one by one.  Each fuse re-intersects the growing
+    result, so it is very expensive for many turns.
+
+    Parameters
+    ----------
+
+    profile :
+    rad : float
+        Helix radius
+    angle : float
+    turns : float
+        Number of turns of the helix
+
+    Returns
+    -------
+
+    Solid
+
+    """
+    quarter_thread = _quarter_helical_solid(profile, rad, angle)
+    quarters = _helical_quarters(quarter_thread, rad, angle, turns)
+    retval = quarters[0]
+    for local_thread in quarters[1:]:
         retval = retval + local_thread
     return retval
 
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""
+Description
+-----------
+Toolpaths for additive manufacturing.  A solid is sliced into layers
+(see ccad.model.slices), each layer gets perimeters, made of 2D
+offsets of its contours, and a linear hatch infill.  Layers are
+generated one at a time and can be streamed to G-code or to a .npz
+file, so memory stays flat on tall parts.
+
+License
+-------
+Distributed under the GNU LESSER GENERAL PUBLIC LICENSE Version 3.
+View LICENSE for details.
+
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple
+import logging
+import math
+import zipfile
+
+import numpy as np
+
+try:
+    import ccad.model as cm
+except ImportError:
+    import model as cm
+
+logger = logging.getLogger(__name__)
+
+
+Layer = namedtuple('Layer', ['level', 'perimeters', 'infill'])
+
+
+def _plane_axes(axis):
+    r"""Returns the indices of the two in-plane coordinates and of the
+    slicing axis
+
+    Parameters
+    ----------
+    axis : str
+        'x', 'y' or 'z'
+
+    """
+    if axis not in cm._axes:
+        msg = 'axis must be x, y or z, not %s' % axis
+        logger.error(msg)
+        raise ValueError(msg)
+    k = cm._axes[axis]
+    i, j = [n for n in range(3) if n != k]
+    return i, j, k
+
+
+def hatch(polylines, spacing, angle=0.0, axis='z', offset=0.0,
+          chunk_size=1 << 20):
+    r"""Returns the hatch lines filling the region bounded by closed
+    polylines.
+
+    The region is the even-odd interior of the polylines, so holes are
+    given as more polylines.  Every scanline is intersected with every
+    polyline segment at once in numpy.  Consecutive lines run in
+    opposite directions.
+
+    Parameters
+    ----------
+    polylines : list[np.array]
+        Closed (n, 3) polylines in a plane normal to axis
+    spacing : float
+        Distance between hatch lines
+    angle : float, optional (default is 0.0)
+        Of the hatch lines from the first in-plane axis, in degrees
+    axis : str, optional (default is 'z')
+    offset : float, optional (default is 0.0)
+        Of the hatch lines from the origin
+    chunk_size : int, optional (default is 1 << 20)
+        Maximum number of segment-scanline pairs tested at once
+
+    Returns
+    -------
+    np.array (m x 2 x 3) : start and end point of each hatch line
+
+    """
+    i, j, k = _plane_axes(axis)
+    polylines = [np.asarray(p, dtype=float) for p in polylines
+                 if len(p) > 1]
+    if not polylines:
+        return np.empty((0, 2, 3))
+    level = polylines[0][0, k]
+    edges = np.concatenate([np.stack([p[:-1][:, [i, j]], p[1:][:, [i, j]]],
+                                     axis=1) for p in polylines])
+    # Rotates by -angle so the hatch lines are horizontal
+    c = math.cos(math.radians(angle))
+    s = math.sin(math.radians(angle))
+    edges = edges.dot(np.array([[c, -s], [s, c]]))
+    x0, y0 = edges[:, 0, 0], edges[:, 0, 1]
+    x1, y1 = edges[:, 1, 0], edges[:, 1, 1]
+    lo = np.minimum(y0, y1)
+    hi = np.maximum(y0, y1)
+    ys = offset + spacing * np.arange(math.ceil((lo.min() - offset) / spacing),
+                                      math.floor((hi.max() - offset) /
+                                                 spacing) + 1)
+    step = max(1, chunk_size // len(edges))
+    segments = []
+    for start in range(0, len(ys), step):
+        yc = ys[start:start + step]
+        # Half-open crossing test: a vertex is counted once
+        ei, li = np.nonzero((lo[:, None] <= yc) & (yc < hi[:, None]))
+        t = (yc[li] - y0[ei]) / (y1[ei] - y0[ei])
+        x = x0[ei] + t * (x1[ei] - x0[ei])
+        order = np.lexsort((x, li))
+        x = x[order]
+        li = li[order]
+        # Open polylines may leave a line with an odd number of crossings
+        even = (np.bincount(li, minlength=len(yc)) % 2 == 0)[li]
+        x = x[even].reshape(-1, 2)
+        li = li[even][::2] + start
+        # Every other line runs backward, its segments in reverse order
+        backward = li % 2 == 1
+        x[backward] = x[backward][:, ::-1]
+        order = np.lexsort((np.where(backward, -x[:, 0], x[:, 0]), li))
+        x = x[order]
+        y = ys[li[order]]
+        segments.append(np.stack([np.column_stack([x[:, 0], y]),
+                                  np.column_stack([x[:, 1], y])], axis=1))
+    segments = np.concatenate(segments) if segments else np.empty((0, 2, 2))
+    points = segments.dot(np.array([[c, s], [-s, c]]))
+    retval = np.empty((len(points), 2, 3))
+    retval[:, :, i] = points[:, :, 0]
+    retval[:, :, j] = points[:, :, 1]
+    retval[:, :, k] = level
+    return retval
+
+
+def _face_polylines(face, deflection):
+    r"""Returns the polylines of the wires of face
+
+    Parameters
+    ----------
+    face : Face
+    deflection : float
+
+    """
+    return [np.array(w.poly(deflection)) for w in face.subshapes('Wire')]
+
+
+def _offset_polylines(face, dist, deflection):
+    r"""Returns the polylines of the offset of face by dist, an empty
+    list when the offset vanishes or fails
+
+    Parameters
+    ----------
+    face : Face
+    dist : float
+    deflection : float
+
+    """
+    try:
+        faces = cm.offset(face, dist)
+    except Exception as e:  # OCC offsets fail on too many inputs
+        logger.warning('Warning: offset by %g failed (%s)' % (dist, e))
+        return []
+    return [p for f in faces for p in _face_polylines(f, deflection)]
+
+
+def layer_toolpath(faces, width, perimeters=2, spacing=None, angle=45.0,
+                   axis='z', level=None, deflection=1e-3):
+    r"""Returns the toolpath of one layer
+
+    Parameters
+    ----------
+    faces : list[Face]
+        Planar faces of the layer, normal to axis
+    width : float
+        Of the extruded line
+    perimeters : int, optional (default is 2)
+        Number of perimeters
+    spacing : float, optional (default is width)
+        Between infill lines
+    angle : float, optional (default is 45.0)
+        Of the infill lines, in degrees
+    axis : str, optional (default is 'z')
+    level : float, optional (default is None)
+    deflection : float, optional (default is 1e-3)
+
+    Returns
+    -------
+    Layer
+
+    """
+    if spacing is None:
+        spacing = width
+    perimeter_polylines = []
+    infill_polylines = []
+    for face in faces:
+        # Perimeters are centered half a width inside each other
+        for n in range(perimeters):
+            perimeter_polylines.extend(
+                _offset_polylines(face, -(n + 0.5) * width, deflection))
+        if perimeters:
+            infill_polylines.extend(
+                _offset_polylines(face, -perimeters * width, deflection))
+        else:
+            infill_polylines.extend(_face_polylines(face, deflection))
+    return Layer(level, perimeter_polylines,
+                 hatch(infill_polylines, spacing, angle, axis))
+
+
+def layers(s1, layer_height, width, perimeters=2, spacing=None, angle=45.0,
+           alternate=True, axis='z', deflection=1e-3, workers=1,
+           chunk_size=64):
+    r"""Generates the toolpath of solid s1 layer by layer
+
+    Parameters
+    ----------
+    s1 : Solid
+    layer_height : float
+    width : float
+        Of the extruded line
+    perimeters : int, optional (default is 2)
+    spacing : float, optional (default is width)
+        Between infill lines
+    angle : float, optional (default is 45.0)
+        Of the infill lines of the first layer, in degrees
+    alternate : bool, optional (default is True)
+        Turns the infill lines by 90 degrees on every layer
+    axis : str, optional (default is 'z')
+    deflection : float, optional (default is 1e-3)
+    workers : int, optional (default is 1)
+        Number of processes slicing (see ccad.model.slices)
+    chunk_size : int, optional (default is 64)
+        Number of layers sliced at once
+
+    Yields
+    ------
+    Layer : level, perimeters as a list of (n, 3) np.array polylines,
+    infill as an (m, 2, 3) np.array of lines
+
+    """
+    k = _plane_axes(axis)[2]
+    bounds = s1.bounds()
+    levels = np.arange(bounds[k] + 0.5 * layer_height, bounds[k + 3],
+                       layer_height)
+    for start in range(0, len(levels), chunk_size):
+        for n, layer in enumerate(cm.slices(
+                s1, axis, levels[start:start + chunk_size], workers=workers,
+                faces=True, deflection=deflection)):
+            index = start + n
+            yield layer_toolpath(
+                layer.faces, width, perimeters, spacing,
+                angle + 90.0 * (index % 2) if alternate else angle, axis,
+                layer.level, deflection)
+
+
+def write_gcode(layers, f, feed=1800.0, travel_feed=6000.0, extrusion=None):
+    r"""Writes layers as G-code, one layer at a time
+
+    Parameters
+    ----------
+    layers : iterable of Layer
+    f : str or binary file object
+    feed : float, optional (default is 1800.0)
+        Of the printing moves, in mm/min
+    travel_feed : float, optional (default is 6000.0)
+    extrusion : float, optional (default is None)
+        Filament length per mm of move (relative E).  None writes no E.
+
+    Returns
+    -------
+    int : the number of layers written
+
+    """
+    e = '' if extrusion is None else ' E%.5f'
+    count = 0
+    with cm._output_file(f) as fileobj:
+        fileobj.write(b'; ccad toolpath\nG21\nG90\nM83\n')
+        for layer in layers:
+            fileobj.write(b'; layer %d level %.4f\n' % (count, layer.level))
+            for polyline in layer.perimeters:
+                fileobj.write(b'G0 X%.4f Y%.4f Z%.4f F%.0f\n' %
+                              (tuple(polyline[0]) + (travel_feed,)))
+                fileobj.write(b'G1 F%.0f\n' % feed)
+                moves = polyline[1:]
+                if extrusion is not None:
+                    lengths = np.linalg.norm(np.diff(polyline, axis=0),
+                                             axis=1)
+                    moves = np.column_stack([moves, extrusion * lengths])
+                np.savetxt(fileobj, moves, fmt='G1 X%.4f Y%.4f Z%.4f' + e)
+            if len(layer.infill):
+                fileobj.write(b'G1 F%.0f\n' % feed)
+                moves = layer.infill.reshape(-1, 6)
+                if extrusion is not None:
+                    lengths = np.linalg.norm(layer.infill[:, 1] -
+                                             layer.infill[:, 0], axis=1)
+                    moves = np.column_stack([moves, extrusion * lengths])
+                np.savetxt(fileobj, moves,
+                           fmt='G0 X%.4f Y%.4f Z%.4f\nG1 X%.4f Y%.4f Z%.4f' + e)
+            count += 1
+    return count
+
+
+def _write_npy(zf, name, a):
+    r"""Writes the array a as the member name.npy of the zip file zf
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile
+    name : str
+    a : np.array
+
+    """
+    with zf.open(name + '.npy', 'w') as fileobj:
+        np.lib.format.write_array(fileobj, np.asanyarray(a))
+
+
+def write_npz(layers, f):
+    r"""Writes layers in a .npz file, one layer at a time
+
+    For each layer n, the file holds the arrays layerN_level,
+    layerN_perimeters (all perimeter points), layerN_offsets (the start
+    of each perimeter, then the number of points) and layerN_infill.
+    levels lists all the levels.
+
+    Parameters
+    ----------
+    layers : iterable of Layer
+    f : str or binary file object
+
+    Returns
+    -------
+    int : the number of layers written
+
+    """
+    levels = []
+    with cm._output_file(f) as fileobj:
+        with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for layer in layers:
+                prefix = 'layer%05d_' % len(levels)
+                lengths = [len(p) for p in layer.perimeters]
+                _write_npy(zf, prefix + 'level', np.float64(layer.level))
+                _write_npy(zf, prefix + 'perimeters',
+                           np.concatenate(layer.perimeters)
+                           if lengths else np.empty((0, 3)))
+                _write_npy(zf, prefix + 'offsets',
+                           np.concatenate([[0], np.cumsum(lengths)]))
+                _write_npy(zf, prefix + 'infill', layer.infill)
+                levels.append(layer.level)
+            _write_npy(zf, 'levels', np.array(levels, dtype=float))
+    return len(levels)
+
+
+def read_npz(f):
+    r"""Generates the layers written by write_npz, one at a time
+
+    Parameters
+    ----------
+    f : str or binary file object
+
+    Yields
+    ------
+    Layer
+
+    """
+    with np.load(f) as data:
+        for n in range(len(data['levels'])):
+            prefix = 'layer%05d_' % n
+            points = data[prefix + 'perimeters']
+            offsets = data[prefix + 'offsets']
+            yield Layer(float(data[prefix + 'level']),
+                        [points[a:b] for a, b in zip(offsets[:-1],
+                                                     offsets[1:])],
+                        data[prefix + 'infill'])
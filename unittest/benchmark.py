@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""
+Description
+-----------
+ccad benchmarks.  Times slow modelling routines against the routines
+they replace, and the importers and exporters on synthetic files of
+increasing size.  Prints (or saves as JSON) the results, and compares
+two saved runs to spot regressions between commits.
+
+Usage: python benchmark.py [--repeat N] [--only NAME] [--json results.json]
+       python benchmark.py --compare old.json new.json [--threshold 1.2]
+
+License
+-------
+Distributed under the GNU LESSER GENERAL PUBLIC LICENSE Version 3.
+View LICENSE for details.
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import ccad.model as cm
+except ImportError:
+    import model as cm
+
+
+def timeit(function, repeat=1):
+    r"""Returns the best wall time in seconds of repeat calls to function
+
+    Parameters
+    ----------
+    function : callable without arguments
+    repeat : int
+
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        best = min(best, time.time() - start)
+    return best
+
+
+def bench_helical_solid(repeat=1, turns_list=(1, 10, 50)):
+    r"""Times helical_solid against old_helical_solid
+
+    Parameters
+    ----------
+    repeat : int
+    turns_list : iterable of number of turns
+
+    Returns
+    -------
+    list[dict]
+
+    """
+    profile = cm.ngon(0.2, 3)
+    results = []
+    for turns in turns_list:
+        new = timeit(lambda: cm.helical_solid(profile, 2.0, 1.0 / math.pi,
+                                              turns), repeat)
+        old = timeit(lambda: cm.old_helical_solid(profile, 2.0,
+                                                  1.0 / math.pi, turns),
+                     repeat)
+        results.append({'name': 'helical_solid',
+                        'size': turns,
+                        'seconds': new,
+                        'baseline_seconds': old})
+    return results
+
+
+def box_with_holes(n):
+    r"""Returns a plate with n through holes
+
+    Parameters
+    ----------
+    n : int
+
+    """
+    side = int(math.ceil(math.sqrt(n)))
+    plate = cm.box(2.0 * side, 2.0 * side, 1.0)
+    holes = [cm.translated(cm.cylinder(0.5, 3.0),
+                           (2.0 * (i % side) + 1.0, 2.0 * (i // side) + 1.0,
+                            -1.0))
+             for i in range(n)]
+    return cm.cut_all(plate, holes)
+
+
+def cylinder_array(n):
+    r"""Returns a compound of n separate cylinders
+
+    Parameters
+    ----------
+    n : int
+
+    """
+    side = int(math.ceil(math.sqrt(n)))
+    return cm.fuse_all([cm.translated(cm.cylinder(0.5, 2.0),
+                                      (2.0 * (i % side), 2.0 * (i // side),
+                                       0.0))
+                        for i in range(n)])
+
+
+def write_svg(name, n):
+    r"""Writes an svg file with n square paths in a group, the inkscape
+    layout from_svg reads
+
+    Parameters
+    ----------
+    name : str
+    n : int
+
+    """
+    side = int(math.ceil(math.sqrt(n)))
+    with open(name, 'w') as f:
+        f.write('<svg\n   width="%d"\n   height="%d">\n' %
+                (20 * side, 20 * side))
+        # from_svg only reads paths inside a group
+        f.write('  <g\n     id="layer1">\n')
+        for i in range(n):
+            f.write('    <path\n'
+                    '       d="m %d,%d 10,0 0,10 -10,0 z"\n'
+                    '       id="path%d" />\n' %
+                    (20 * (i % side), 20 * (i // side), i))
+        f.write('  </g>\n')
+        f.write('</svg>\n')
+
+
+def bench_import_export(repeat=1, sizes=(1, 10, 100)):
+    r"""Times the exporters and importers of each format on the
+    synthetic parts
+
+    Parameters
+    ----------
+    repeat : int
+    sizes : iterable of the number of holes, cylinders or paths
+
+    Returns
+    -------
+    list[dict]
+
+    """
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for size in sizes:
+            for part_name, generator in (('box_with_holes', box_with_holes),
+                                         ('cylinder_array', cylinder_array)):
+                part = generator(size)
+                for extension in ('stp', 'igs', 'brep'):
+                    name = os.path.join(directory, '%s_%d.%s' %
+                                        (part_name, size, extension))
+                    exporter = {'stp': part.to_step,
+                                'igs': part.to_iges,
+                                'brep': part.to_brep}[extension]
+                    importer = {'stp': cm.from_step,
+                                'igs': cm.from_iges,
+                                'brep': cm.from_brep}[extension]
+                    for operation, function in (
+                            ('to_' + extension, lambda: exporter(name)),
+                            ('from_' + extension, lambda: importer(name))):
+                        results.append({
+                            'name': '%s %s' % (operation, part_name),
+                            'size': size,
+                            'seconds': timeit(function, repeat),
+                            'bytes': os.path.getsize(name)})
+            name = os.path.join(directory, 'paths_%d.svg' % size)
+            write_svg(name, size)
+            wires = len(cm.from_svg(name))
+            if wires != size:
+                raise AssertionError('from_svg read %d wires out of %d' %
+                                     (wires, size))
+            results.append({'name': 'from_svg paths',
+                            'size': size,
+                            'seconds': timeit(lambda: cm.from_svg(name),
+                                              repeat),
+                            'bytes': os.path.getsize(name)})
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def bench_slices(repeat=1, layers_list=(10, 100, 1000)):
+    r"""Times slices against repeated slice_ calls on a plate with holes
+
+    Parameters
+    ----------
+    repeat : int
+    layers_list : iterable of number of layers
+
+    Returns
+    -------
+    list[dict]
+
+    """
+    part = box_with_holes(16)
+    results = []
+    for layers in layers_list:
+        levels = [(i + 0.5) / layers for i in range(layers)]
+        new = timeit(lambda: cm.slices(part, 'z', levels), repeat)
+        old = timeit(lambda: [cm.slice_(part, z=level) for level in levels],
+                     repeat)
+        results.append({'name': 'slices',
+                        'size': layers,
+                        'seconds': new,
+                        'baseline_seconds': old})
+    return results
+
+
+benchmarks = [bench_helical_solid, bench_import_export, bench_slices]
+
+
+def run(repeat=1, only=None):
+    r"""Runs the benchmarks and returns the results with information
+    about the run
+
+    Parameters
+    ----------
+    repeat : int
+    only : str, optional (default is None)
+        Runs only the benchmark functions whose name contains only
+
+    Returns
+    -------
+    dict
+
+    """
+    results = []
+    for benchmark in benchmarks:
+        if only and only not in benchmark.__name__:
+            continue
+        for result in benchmark(repeat):
+            line = '%-32s %6s %10.3fs' % (result['name'], result['size'],
+                                          result['seconds'])
+            if 'baseline_seconds' in result:
+                line += ' (baseline %10.3fs, x%.1f)' % (
+                    result['baseline_seconds'],
+                    result['baseline_seconds'] / max(result['seconds'],
+                                                     1e-9))
+            print(line)
+            results.append(result)
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'results': results}
+
+
+def compare(old, new, threshold=1.2):
+    r"""Returns the benchmarks slower in new than in old by more than
+    threshold
+
+    Parameters
+    ----------
+    old : dict
+        As returned by run
+    new : dict
+    threshold : float, optional (default is 1.2)
+
+    Returns
+    -------
+    list[tuple(str, size, float, float)] : name, size, old and new
+    seconds
+
+    """
+    old_seconds = dict(((r['name'], r['size']), r['seconds'])
+                       for r in old['results'])
+    regressions = []
+    for r in new['results']:
+        key = (r['name'], r['size'])
+        if key in old_seconds and \
+                r['seconds'] > threshold * max(old_seconds[key], 1e-6):
+            regressions.append(key + (old_seconds[key], r['seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ccad benchmarks')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--only', help='run only matching benchmarks')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two saved results')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        for name, size, old_seconds, new_seconds in regressions:
+            print('%-32s %6s %10.3fs -> %10.3fs' % (name, size, old_seconds,
+                                                    new_seconds))
+        sys.exit(1 if regressions else 0)
+
+    results = run(args.repeat, args.only)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
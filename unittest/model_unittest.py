@@ -32,8 +32,21 @@ try:
 except ImportError:
     import model as cm
 
+import io
 import math
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
 import unittest
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
 import sys
 # from ast import literal_eval
 
@@ -67,6 +80,21 @@ def close(p1, p2, eps=1e-6):
 # Shape Functions
 class TestShapeFunctions(unittest.TestCase):
 
+    def test_transform_chained(self):
+        s1 = cm.sphere(1.0)
+        steps = [('translate', (1.0, 0.0, 0.0)),
+                 ('rotatez', math.pi / 2),
+                 ('translate', (0.0, 0.0, 2.0))]
+        s2 = cm.transform_chained(s1, steps)
+        s3 = cm.transform_chained(s1, steps, lazy=True)
+        self.assertTrue(close(s2.center(), (0.0, 1.0, 2.0)) and
+                        close(s3.center(), (0.0, 1.0, 2.0)) and
+                        close(s1.center(), (0.0, 0.0, 0.0)))
+        # mirrors can't be lazy, so they are always applied
+        s4 = cm.transform_chained(s3, [('mirror', (0.0, 0.0, 0.0),
+                                        (0.0, 1.0, 0.0))], lazy=True)
+        self.assertTrue(close(s4.center(), (0.0, -1.0, 2.0)))
+
     def test_translated(self):
         delta = (0.1, 0.2, 0.3)
         s1 = cm.sphere(1.0)
@@ -198,6 +226,84 @@ class TestSolidFunctions(unittest.TestCase):
                         close(v3old, value) and
                         close(v3op, value))
 
+    def test_fuse_all(self):
+        ss = [cm.translated(cm.box(1.0, 1.0, 1.0), (1.5 * i, 0.0, 0.0))
+              for i in range(4)]
+        ss.append(cm.box(6.0, 0.5, 0.5))
+        s1 = cm.fuse_all(ss, parallel=True)
+        s2 = ss[0] + ss[1] + ss[2] + ss[3] + ss[4]
+        self.assertTrue(close(s1.volume(), s2.volume()))
+        self.assertTrue(close(s1.volume(), 4.0 + 6.0 * 0.25 - 4 * 0.25))
+        self.assertRaises(ValueError, cm.fuse_all, [])
+
+    def test_cut_all(self):
+        s1 = cm.box(10.0, 10.0, 1.0)
+        tools = [cm.translated(cm.cylinder(0.5, 3.0), (2.0 * i + 1.0, 5.0, -1.0))
+                 for i in range(5)]
+        s2 = cm.cut_all(s1, tools)
+        value = 100.0 - 5 * math.pi * 0.5 ** 2
+        self.assertTrue(close(s2.volume(), value))
+        self.assertRaises(ValueError, cm.cut_all, s1, tools, 0, False,
+                          None, 'bogus')
+
+    def test_common_all(self):
+        s1 = cm.box(2.0, 2.0, 2.0)
+        s2 = cm.translated(s1, (1.0, 0.0, 0.0))
+        s3 = cm.translated(s1, (0.0, 1.0, 0.0))
+        s4 = cm.common_all([s1, s2, s3])
+        self.assertTrue(close(s4.volume(), 2.0))
+        s5 = cm.common_all([s1, s2, s3], refine=1)
+        self.assertTrue(close(s5.volume(), 2.0))
+        self.assertRaises(ValueError, cm.common_all, [])
+
+    def test_boolean_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            s1 = cm.box(2.0, 2.0, 2.0)
+            s2 = cm.translated(s1, (1.0, 0.0, 0.0))
+            reference = [e.center()
+                         for e in cm.fuse(s2, s1).subshapes('Edge')]
+            cache = cm.enable_boolean_cache(max_entries=2)
+            s3 = s1 - s2
+            s4 = s1 - s2
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertTrue(close(s3.volume(), s4.volume()) and
+                            close(s4.volume(), 4.0))
+            # Changing the returned solid doesn't change the cache
+            s4.translate((5.0, 0.0, 0.0))
+            self.assertTrue(close(s3.center(), (0.5, 1.0, 1.0)))
+            self.assertTrue(close((s1 - s2).center(), (0.5, 1.0, 1.0)))
+            s5 = s1 + s2
+            s6 = s1 + s2
+            self.assertEqual((cache.hits, cache.misses), (3, 2))
+            self.assertTrue(close(s5.volume(), 12.0) and
+                            close(s6.volume(), 12.0))
+            # Operand order is part of the key, so the subshape indices
+            # are the same with or without the cache
+            s7 = s2 + s1
+            s8 = s2 - s1
+            self.assertEqual((cache.hits, cache.misses), (3, 4))
+            self.assertTrue(close(s7.volume(), 12.0) and
+                            close(s8.volume(), 4.0))
+            edges = s7.subshapes('Edge')
+            self.assertEqual(len(edges), len(reference))
+            for edge, center in zip(edges, reference):
+                self.assertTrue(close(edge.center(), center))
+            self.assertEqual(len(cache), 2)
+            # Changed operands miss
+            s2.translate((0.5, 0.0, 0.0))
+            self.assertTrue(close((s1 - s2).volume(), 6.0))
+            self.assertEqual(cache.misses, 5)
+            # On disk, results survive the memory cache
+            cache = cm.enable_boolean_cache(directory=directory)
+            self.assertTrue(close(cm.common(s1, s2, 1).volume(), 2.0))
+            cache = cm.enable_boolean_cache(directory=directory)
+            self.assertTrue(close(cm.common(s1, s2, 1).volume(), 2.0))
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+        finally:
+            cm.disable_boolean_cache()
+            shutil.rmtree(directory)
+
     def test_fillet_fuse(self):
         s1 = cm.sphere(1.0)
         s2 = cm.box(4.0, 4.0, 4.0)
@@ -284,12 +390,106 @@ class TestSolidFunctions(unittest.TestCase):
         v3 = s3.volume()
         self.assertTrue(close(v3, 2 * 2.0 * 2.0 * 2.0))
 
+    def test_glue_auto(self):
+        s1 = cm.box(2.0, 2.0, 2.0)
+        s1.translate((-2.0, -1.0, -1.0))
+        s2 = cm.box(4.0, 4.0, 4.0)
+        s2.translate((0.0, -2.0, -2.0))
+        f1 = s1.nearest('Face', [(0.0, 0.0, 0.0)])[0]
+        f2 = s2.nearest('Face', [(0.0, 0.0, 0.0)])[0]
+        self.assertEqual(cm._coincident_face_pairs(s1, s2), [(f1, f2)])
+        s3 = cm.glue(s1, s2)
+        self.assertTrue(close(s3.volume(), 2.0 * 2.0 * 2.0 + 4.0 * 4.0 * 4.0))
+        # Overlapping faces facing the same way aren't glued
+        s4 = cm.box(1.0, 2.0, 2.0)
+        s4.translate((-1.0, -1.0, -1.0))
+        self.assertEqual(cm._coincident_face_pairs(s1, s4), [])
+
+    def test_glue_auto_large_face(self):
+        # The plate top face spans many more grid cells than the
+        # small box faces
+        s1 = cm.box(100.0, 100.0, 1.0)
+        s2 = cm.box(1.0, 1.0, 1.0)
+        s2.translate((50.0, 50.0, 1.0))
+        f1 = s1.nearest('Face', [(50.0, 50.0, 1.0)])[0]
+        f2 = s2.nearest('Face', [(50.5, 50.5, 1.0)])[0]
+        self.assertEqual(cm._coincident_face_pairs(s1, s2), [(f1, f2)])
+        self.assertEqual(cm._coincident_face_pairs(s2, s1), [(f2, f1)])
+        s3 = cm.glue(s2, s1)
+        self.assertTrue(close(s3.volume(), 100.0 * 100.0 + 1.0))
+
+    def test_glue_auto_holed_face(self):
+        # The middle of the parametric bounds of both contact faces is
+        # outside them: in the hole of the plate, in the notch of the L
+        s1 = cm.box(10.0, 10.0, 1.0)
+        s1.translate((0.0, 0.0, -1.0))
+        hole = cm.cylinder(2.0, 3.0)
+        hole.translate((5.0, 5.0, -2.0))
+        s1 = s1 - hole
+        notch = cm.box(2.0, 2.0, 1.0)
+        notch.translate((1.0, 1.0, 0.0))
+        s2 = cm.box(3.0, 3.0, 1.0) - notch
+        f1 = s1.nearest('Face', [(5.0, 5.0, 0.0)])[0]
+        f2 = s2.nearest('Face', [(1.1, 1.1, 0.0)])[0]
+        self.assertEqual(cm._coincident_face_pairs(s1, s2), [(f1, f2)])
+        self.assertEqual(cm._coincident_face_pairs(s2, s1), [(f2, f1)])
+        s3 = cm.glue(s2, s1)
+        self.assertTrue(close(s3.volume(), 100.0 - 4.0 * math.pi + 5.0))
+
+    def test_glue_auto_partial_overlap(self):
+        # The middle of neither face is on the other
+        s1 = cm.box(2.0, 2.0, 1.0)
+        s2 = cm.box(2.0, 2.0, 1.0)
+        s2.translate((1.5, 1.5, 1.0))
+        f1 = s1.nearest('Face', [(1.0, 1.0, 1.0)])[0]
+        f2 = s2.nearest('Face', [(2.5, 2.5, 1.0)])[0]
+        self.assertEqual(cm._coincident_face_pairs(s1, s2), [(f1, f2)])
+        self.assertEqual(cm._coincident_face_pairs(s2, s1), [(f2, f1)])
+        # Faces touching along an edge don't overlap
+        s3 = cm.box(2.0, 2.0, 1.0)
+        s3.translate((2.0, 0.0, 1.0))
+        self.assertEqual(cm._coincident_face_pairs(s1, s3), [])
+
+    def test_simple_glue_auto(self):
+        s1 = cm.box(2.0, 2.0, 2.0)
+        s1.translate((-2.0, -1.0, -1.0))
+        s2 = cm.box(2.0, 2.0, 2.0)
+        s2.translate((0.0, -1.0, -1.0))
+        s3 = cm.simple_glue(s1, s2)
+        self.assertEqual(len(s3.subshapes('Face')), 10)
+        self.assertTrue(close(s3.volume(), 2 * 2.0 * 2.0 * 2.0))
+
+    def test_sew_all(self):
+        panels = [cm.translated(cm.box(1.0, 2.0, 2.0), (float(i), 0.0, 0.0))
+                  for i in range(4)]
+        s1 = cm.sew_all(panels)
+        self.assertEqual(len(s1.subshapes('Face')), 4 * 6 - 2 * 3)
+        self.assertTrue(close(s1.volume(), 4 * 1.0 * 2.0 * 2.0))
+        # Explicit faces give the same result
+        removed = []
+        for i, p in enumerate(panels):
+            xs = [x for x in (float(i), i + 1.0) if 0.0 < x < 4.0]
+            removed.append(p.nearest('Face', [(x, 1.0, 1.0) for x in xs]))
+        s2 = cm.sew_all(panels, removed)
+        self.assertTrue(close(s2.volume(), s1.volume()))
+        self.assertRaises(ValueError, cm.sew_all, panels, removed[1:])
+
     def test_bounding_box(self):
         s1 = cm.box(2.0, 3.0, 4.0)
         # bbs1 = s1.bounding_box()
         _ = s1.bounding_box()
 
 
+_load_worker = cm._load_worker
+
+
+def _crashing_load_worker(name):
+    # load_many worker whose process dies on crash.stp
+    if name == 'crash.stp':
+        os._exit(1)
+    return _load_worker(name)
+
+
 # Import Functions
 class TestImportFunctions(unittest.TestCase):
 
@@ -307,6 +507,73 @@ class TestImportFunctions(unittest.TestCase):
         print('total_length', total_length)
         self.assertTrue(close(total_length, 2962.0, 1.0))
 
+    def test_load_many(self):
+        cm.box(1.0, 2.0, 3.0).to_step('tmp_load.stp')
+        cm.sphere(1.0).to_brep('tmp_load.brep')
+        names = ['tmp_load.stp', 'missing.stp', 'tmp_load.brep']
+        for workers in (1, 2):
+            reports = cm.load_many(names, workers=workers)
+            self.assertTrue([r.path for r in reports] == names)
+            self.assertTrue(close(reports[0].shape.volume(), 6.0) and
+                            reports[0].error is None)
+            self.assertTrue(reports[1].shape is None and
+                            reports[1].error.split(':')[0] in ('IOError',
+                                                               'OSError'))
+            self.assertTrue(close(reports[2].shape.volume(),
+                                  4.0 / 3.0 * math.pi, 1e-3))
+
+    def test_load_many_crash(self):
+        cm.box(1.0, 2.0, 3.0).to_step('tmp_load.stp')
+        names = ['tmp_load.stp', 'crash.stp', 'tmp_load.stp']
+        cm._load_worker = _crashing_load_worker
+        try:
+            reports = cm.load_many(names, workers=2)
+        finally:
+            cm._load_worker = _load_worker
+        self.assertTrue([r.path for r in reports] == names)
+        self.assertTrue(reports[1].shape is None and
+                        reports[1].error.startswith('BrokenProcessPool'))
+        for report in (reports[0], reports[2]):
+            self.assertTrue(report.error is None and
+                            close(report.shape.volume(), 6.0))
+
+    def test_iter_step(self):
+        with cm.StepWriterSession() as session:
+            session.add(cm.box(1.0, 2.0, 3.0), 'block')
+            session.add(cm.sphere(1.0), 'ball')
+            session.write('tmp_roots.stp')
+        roots = list(cm.iter_step('tmp_roots.stp'))
+        self.assertTrue([name for name, _ in roots] == ['block', 'ball'])
+        self.assertTrue(close(roots[0][1].volume(), 6.0) and
+                        close(roots[1][1].volume(), 4.0 / 3.0 * math.pi,
+                              1e-3))
+        roots = list(cm.iter_step('tmp_roots.stp', components=False))
+        self.assertTrue([name for name, _ in roots] == ['block', 'ball'])
+        roots = list(cm.iter_step('tmp_roots.stp', xcaf=True))
+        self.assertTrue([name for name, _ in roots] == ['block', 'ball'])
+        self.assertRaises(IOError, list, cm.iter_step('missing.stp'))
+
+    def test_iter_step_assembly(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        placements = []
+        for count in range(3):
+            m = np.identity(4)
+            m[0, 3] = 2.0 * count
+            placements.append(m)
+        cm.InstancedPart(s1, 'test', placements).to_step('tmp_assembly.stp')
+        # The assembly is a single root
+        self.assertEqual(
+            len(list(cm.iter_step('tmp_assembly.stp', components=False))), 1)
+        for xcaf in (False, True):
+            parts = list(cm.iter_step('tmp_assembly.stp', xcaf=xcaf))
+            self.assertEqual(len(parts), 3)
+            self.assertEqual(len(set(name for name, _ in parts)), 1)
+            for _, part in parts:
+                self.assertTrue(close(part.volume(), 6.0))
+            self.assertTrue(close(sorted(part.center()[0]
+                                         for _, part in parts),
+                                  [0.5, 2.5, 4.5]))
+
 # Classes
 # Philosophy:
 
@@ -314,6 +581,175 @@ class TestImportFunctions(unittest.TestCase):
 #    one-liners which are mostly tested by TestShapeFunctions
 
 
+class TestPart(unittest.TestCase):
+
+    generator = """
+try:
+    import ccad.model as cm
+except ImportError:
+    import model as cm
+
+with open(%r, 'a') as f:
+    f.write('run\\n')
+part = cm.box(1.0, 2.0, %s)
+"""
+
+    def test_from_py_cache(self):
+        directory = tempfile.mkdtemp()
+        runs = join(directory, 'runs.txt')
+        py_filename = join(directory, 'generator.py')
+        cache = cm.DiskCache(join(directory, 'cache'))
+        with open(py_filename, 'w') as f:
+            f.write(self.generator % (runs, '3.0'))
+        p1 = cm.Part.from_py(py_filename, cache=cache)
+        p2 = cm.Part.from_py(py_filename, cache=cache)
+        with open(runs) as f:
+            self.assertTrue(f.read().count('run') == 1)
+        self.assertTrue(close(p1.geometry.volume(), 6.0) and
+                        close(p2.geometry.volume(), 6.0) and
+                        isinstance(p2.geometry, cm.Solid))
+        # A changed source is a new entry
+        with open(py_filename, 'w') as f:
+            f.write(self.generator % (runs, '4.0'))
+        p3 = cm.Part.from_py(py_filename, cache=cache)
+        self.assertTrue(close(p3.geometry.volume(), 8.0) and len(cache) == 2)
+        cache.max_bytes = 1
+        cache.evict()
+        self.assertTrue(len(cache) == 0)
+        shutil.rmtree(directory)
+
+    library_part = """
+try:
+    import ccad.model as cm
+except ImportError:
+    import model as cm
+
+part = cm.box(%s, 1.0, 1.0)
+anchors = {'top': {'p': (0.0, 0.0, 1.0), 'u': (0.0, 0.0, 1.0)}}
+"""
+
+    def test_from_library_file(self):
+        directory = tempfile.mkdtemp()
+        mirror = tempfile.mkdtemp()
+        for name, size in (('a', '1.0'), ('b', '2.0')):
+            with open(join(directory, name + '.py'), 'w') as f:
+                f.write(self.library_part % size)
+        with open(join(mirror, 'b.py'), 'w') as f:
+            f.write(self.library_part % '3.0')
+        url = 'file://' + directory
+        parts = cm.Part.from_library_many(url, ['a', 'b', 'a'], workers=3)
+        self.assertTrue(all([close(p.geometry.volume(), v) for (p, _), v in
+                             zip(parts, (1.0, 2.0, 1.0))]))
+        self.assertTrue(parts[0][1]['top']['p'] == (0.0, 0.0, 1.0))
+        p1, _ = cm.Part.from_library(url, 'b', mirror=mirror)
+        self.assertTrue(close(p1.geometry.volume(), 3.0))
+        # The mirror entry is cached apart from the library one
+        p2, _ = cm.Part.from_library(url, 'b')
+        self.assertTrue(close(p2.geometry.volume(), 2.0) and
+                        p2.geometry.shape.IsSame(parts[1][0].geometry.shape))
+        self.assertTrue(not os.path.exists('tmp.py'))
+        shutil.rmtree(directory)
+        shutil.rmtree(mirror)
+
+    def test_from_library_http(self):
+        source = (self.library_part % '2.0').encode('utf-8')
+        etag = '"%s"' % hashlib.sha256(source).hexdigest()
+        served = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/lib/c.py':
+                    self.send_error(404)
+                elif self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    served.append(self.path)
+                    self.send_response(200)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', str(len(source)))
+                    self.end_headers()
+                    self.wfile.write(source)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/lib' % server.server_address[1]
+            p1, anchors = cm.Part.from_library(url, 'c')
+            p2, _ = cm.Part.from_library(url, 'c')
+            self.assertTrue(close(p1.geometry.volume(), 2.0) and
+                            close(p2.geometry.volume(), 2.0))
+            # The second call was revalidated, not downloaded and rebuilt
+            self.assertTrue(len(served) == 1 and
+                            p2.geometry is not p1.geometry and
+                            p2.geometry.shape.IsSame(p1.geometry.shape))
+            self.assertRaises(IOError, cm.Part.from_library, url, 'missing')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestInstancedPart(unittest.TestCase):
+
+    def test_instances(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        placements = []
+        for count in range(5):
+            m = np.identity(4)
+            m[0, 3] = 2.0 * count
+            placements.append(m)
+        p1 = cm.InstancedPart(s1, 'test', placements)
+        self.assertTrue(len(p1) == 5)
+        instances = p1.instances()
+        self.assertTrue(all([i.IsPartner(instances[0]) for i in instances]))
+        c1 = p1.compound()
+        self.assertTrue(close(c1.volume(), 5 * 6.0))
+        self.assertTrue(close(c1.center(), (4.5, 1.0, 1.5)))
+        p1.to_step('tmp.stp')
+        # One geometry, referenced by each instance
+        with open('tmp.stp') as f:
+            self.assertEqual(f.read().count('MANIFOLD_SOLID_BREP'), 1)
+        parts = [part for _, part in cm.iter_step('tmp.stp')]
+        self.assertEqual(len(parts), 5)
+        self.assertTrue(all(p.shape.IsPartner(parts[0].shape)
+                            for p in parts))
+        self.assertRaises(ValueError, p1.add_placement, 2.0 * np.identity(4))
+        sheared = np.identity(4)
+        sheared[0, 1] = 0.5
+        self.assertRaises(ValueError, p1.add_placement, sheared)
+        mirrored = np.identity(4)
+        mirrored[2, 2] = -1.0
+        self.assertRaises(ValueError, p1.add_placement, mirrored)
+        self.assertTrue(len(p1) == 5)
+
+
+class TestStepWriterSession(unittest.TestCase):
+
+    def test_session(self):
+        assembly = cm._get_static('write.step.assembly', 'I')
+        s1 = cm.box(1.0, 2.0, 3.0)
+        s2 = cm.sphere(1.0)
+        with cm.StepWriterSession(assembly=1, schema=3) as session:
+            self.assertTrue(cm._get_static('write.step.assembly', 'I') == 1)
+            self.assertTrue(session.write_shape(s1, 'tmp1.stp', 'block'))
+            self.assertTrue(session.add(s1, 'block') and
+                            session.add(s2, 'ball'))
+            self.assertTrue(session.count == 2)
+            self.assertTrue(session.write('tmp2.stp'))
+        self.assertTrue(cm._get_static('write.step.assembly', 'I') ==
+                        assembly)
+        with open('tmp1.stp') as f:
+            self.assertTrue("'block'" in f.read())
+        self.assertTrue(close(cm.from_step('tmp1.stp').volume(), 6.0))
+        self.assertTrue(close(cm.from_step('tmp2.stp').volume(),
+                              6.0 + 4.0 / 3.0 * math.pi, 1e-3))
+
+
 class TestVertex(unittest.TestCase):
 
     # inherited from shape
@@ -326,6 +762,16 @@ class TestVertex(unittest.TestCase):
         self.assertTrue(close(r1, (1.0, 2.0, 3.0)) and
                         close(r2, (1.0, 2.0, 3.0)))
 
+    def test_pickle(self):
+        s1 = cm.Vertex((1.0, 2.0, 3.0))
+        s2 = pickle.loads(pickle.dumps(s1))
+        s3 = type(s1).from_brep_bytes(s1.to_brep_bytes())
+        s4 = cm.Shape.from_brep_bytes(s1.to_brep_bytes(binary=True))
+        self.assertTrue(type(s2) is type(s1) and type(s4) is type(s1))
+        self.assertTrue(close(s2.center(), s1.center()) and
+                        close(s3.center(), s1.center()) and
+                        close(s4.center(), s1.center()))
+
     def test_to_iges(self):
         s1 = cm.Vertex((1.0, 2.0, 3.0))
         r1 = s1.center()
@@ -403,6 +849,16 @@ class TestEdge(unittest.TestCase):
         self.assertTrue(close(r1, 2 * math.pi) and
                         close(r2, 2 * math.pi))
 
+    def test_pickle(self):
+        s1 = cm.circle(1.0)
+        s2 = pickle.loads(pickle.dumps(s1))
+        s3 = type(s1).from_brep_bytes(s1.to_brep_bytes())
+        s4 = cm.Shape.from_brep_bytes(s1.to_brep_bytes(binary=True))
+        self.assertTrue(type(s2) is type(s1) and type(s4) is type(s1))
+        self.assertTrue(close(s2.length(), s1.length()) and
+                        close(s3.length(), s1.length()) and
+                        close(s4.length(), s1.length()))
+
     def test_to_iges(self):
         s1 = cm.circle(1.0)
         r1 = s1.length()
@@ -510,6 +966,16 @@ class TestWire(unittest.TestCase):
         self.assertTrue(close(r1, 5.196, eps=1e-3) and
                         close(r2, 5.196, eps=1e-3))
 
+    def test_pickle(self):
+        s1 = cm.ngon(1.0, 3)
+        s2 = pickle.loads(pickle.dumps(s1))
+        s3 = type(s1).from_brep_bytes(s1.to_brep_bytes())
+        s4 = cm.Shape.from_brep_bytes(s1.to_brep_bytes(binary=True))
+        self.assertTrue(type(s2) is type(s1) and type(s4) is type(s1))
+        self.assertTrue(close(s2.length(), s1.length()) and
+                        close(s3.length(), s1.length()) and
+                        close(s4.length(), s1.length()))
+
     def test_to_iges(self):
         s1 = cm.ngon(1.0, 3)
         r1 = s1.length()
@@ -619,6 +1085,16 @@ class TestFace(unittest.TestCase):
         r2 = s2.area()
         self.assertTrue(close(r1, r2))
 
+    def test_pickle(self):
+        s1 = cm.plane(cm.ngon(1.0, 3))
+        s2 = pickle.loads(pickle.dumps(s1))
+        s3 = type(s1).from_brep_bytes(s1.to_brep_bytes())
+        s4 = cm.Shape.from_brep_bytes(s1.to_brep_bytes(binary=True))
+        self.assertTrue(type(s2) is type(s1) and type(s4) is type(s1))
+        self.assertTrue(close(s2.area(), s1.area()) and
+                        close(s3.area(), s1.area()) and
+                        close(s4.area(), s1.area()))
+
     def test_to_iges(self):
         s1 = cm.plane(cm.ngon(1.0, 3))
         r1 = s1.area()
@@ -760,6 +1236,16 @@ class TestShell(unittest.TestCase):
         self.assertTrue(close(r1, 22.0) and
                         close(r2, 22.0))
 
+    def test_pickle(self):
+        s1 = cm.box(1.0, 2.0, 3.0).subshapes('Shell')[0]
+        s2 = pickle.loads(pickle.dumps(s1))
+        s3 = type(s1).from_brep_bytes(s1.to_brep_bytes())
+        s4 = cm.Shape.from_brep_bytes(s1.to_brep_bytes(binary=True))
+        self.assertTrue(type(s2) is type(s1) and type(s4) is type(s1))
+        self.assertTrue(close(s2.area(), s1.area()) and
+                        close(s3.area(), s1.area()) and
+                        close(s4.area(), s1.area()))
+
     def test_to_iges(self):
         s1 = cm.box(1.0, 2.0, 3.0).subshapes('Shell')[0]
         r1 = s1.area()
@@ -857,6 +1343,16 @@ class TestSolid(unittest.TestCase):
         self.assertTrue(close(r1, 6.0) and
                         close(r2, 6.0))
 
+    def test_pickle(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        s2 = pickle.loads(pickle.dumps(s1))
+        s3 = type(s1).from_brep_bytes(s1.to_brep_bytes())
+        s4 = cm.Shape.from_brep_bytes(s1.to_brep_bytes(binary=True))
+        self.assertTrue(type(s2) is type(s1) and type(s4) is type(s1))
+        self.assertTrue(close(s2.volume(), s1.volume()) and
+                        close(s3.volume(), s1.volume()) and
+                        close(s4.volume(), s1.volume()))
+
     def test_to_iges(self):
         s1 = cm.box(1.0, 2.0, 3.0)
         r1 = s1.volume()
@@ -875,6 +1371,59 @@ class TestSolid(unittest.TestCase):
         self.assertTrue(close(r1, 6.0) and
                         close(r2, 6.0))
 
+    def test_mesh(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        m1 = s1.mesh(0.1)
+        self.assertTrue(m1.vertices.shape == (8, 3) and
+                        m1.triangles.shape == (12, 3) and
+                        m1.triangles.dtype == np.int32 and
+                        m1.face_ranges.shape == (6, 2))
+        # Outward normals give a positive enclosed volume
+        p = m1.vertices[m1.triangles]
+        volume = (p[:, 0] * np.cross(p[:, 1], p[:, 2])).sum() / 6.0
+        self.assertTrue(close(float(volume), 6.0))
+        self.assertTrue(close(float(abs(m1.normals).sum()), 12.0))
+        s2 = cm.sphere(1.0)
+        m2 = s2.mesh(0.01)
+        p = m2.vertices[m2.triangles]
+        volume = (p[:, 0] * np.cross(p[:, 1], p[:, 2])).sum() / 6.0
+        self.assertTrue(close(float(volume), 4.0 / 3.0 * math.pi, 0.1))
+
+    def test_mesh_cache(self):
+        cache = cm.MeshCache(max_triangles=30)
+        s1 = cm.box(1.0, 2.0, 3.0)
+        m1 = cache.mesh(s1, 0.1)
+        m2 = cache.mesh(s1, 0.1)
+        self.assertTrue(m1 is m2 and cache.hits == 1 and cache.misses == 1)
+        s1.translate((1.0, 0.0, 0.0))
+        m3 = cache.mesh(s1, 0.1)
+        self.assertTrue(m3 is not m1 and
+                        close(float(m3.vertices[:, 0].min()), 1.0))
+        # The third box exceeds the budget and evicts the first
+        cache.mesh(cm.box(1.0, 1.0, 1.0), 0.1)
+        self.assertTrue(len(cache) == 2 and cache.triangles == 24)
+
+    def test_to_html(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        s1.to_html('tmp.html')
+        self.assertTrue(os.path.exists('tmp.html'))
+        # The faces were triangulated for the renderer
+        self.assertTrue(all(cm._face_triangulation(f)[0] is not None
+                            for f in s1._raw('Face')))
+
+    def test_mesh_once(self):
+        s1 = cm.sphere(1.0)
+        misses = cm.mesh_cache.misses
+        hits = cm.mesh_cache.hits
+        s1.to_stl('tmp.stl')
+        s1.to_stl('tmp.stl', native=1)
+        s1.to_html('tmp.html')
+        # What display does with the raw shape
+        cm._warm_triangulation(s1.shape)
+        s1.mesh()
+        self.assertTrue(cm.mesh_cache.misses == misses + 1 and
+                        cm.mesh_cache.hits == hits + 4)
+
     def test_subshapes(self):
         s1 = cm.box(1.0, 2.0, 3.0)
         ss = s1.subshapes('Shell')
@@ -885,6 +1434,25 @@ class TestSolid(unittest.TestCase):
         self.assertTrue(len(vs) == 8 and len(es) == 12 and len(ws) == 6 and
                         len(fs) == 6 and len(ss) == 1)
 
+    def test_subshape_index(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        es = s1.subshapes('Edge')
+        indices = [s1.subshape_index(e) for e in es]
+        self.assertTrue(indices == list(range(12)))
+        self.assertRaises(ValueError, s1.subshape_index,
+                          cm.box(1.0, 1.0, 1.0).subshapes('Edge')[0])
+
+    def test_topology_cache(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        t1 = s1._topology_index()
+        c1 = s1.subcenters('Face')
+        self.assertTrue(s1._topology_index() is t1)
+        s1.translate((1.0, 0.0, 0.0))
+        self.assertTrue(s1._topology_index() is not t1)
+        c2 = s1.subcenters('Face')
+        self.assertTrue(all([close(dp(p2, p1), (1.0, 0.0, 0.0))
+                             for p1, p2 in zip(c1, c2)]))
+
     def test_copy(self):
         s1 = cm.box(1.0, 2.0, 3.0)
         s2 = s1.copy()
@@ -892,6 +1460,17 @@ class TestSolid(unittest.TestCase):
         self.assertTrue(close(s2.center(), (0.5, 1.0, 1.5)) and
                         close(s1.center(), (1.5, 2.0, 2.5)))
 
+    def test_materialize(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        s1.translate((1.0, 1.0, 1.0), lazy=True)
+        s1.rotatez(math.pi, lazy=True)
+        self.assertTrue(not s1.shape.Location().IsIdentity())
+        self.assertTrue(close(s1.center(), (-1.5, -2.0, 2.5)))
+        s1.materialize()
+        self.assertTrue(s1.shape.Location().IsIdentity())
+        self.assertTrue(close(s1.center(), (-1.5, -2.0, 2.5)) and
+                        close(s1.volume(), 6.0))
+
     def test_bounds(self):
         s1 = cm.box(1.0, 2.0, 3.0)
         self.assertTrue(close(s1.bounds(),
@@ -911,6 +1490,15 @@ class TestSolid(unittest.TestCase):
             center[2] = center[2] + c[2]
         self.assertTrue(close(center, (6.0 * 0.5, 6.0 * 1.0, 6.0 * 1.5)))
 
+    def test_properties(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        centers, areas, inertias = s1.properties('Face')
+        _, lengths, _ = s1.properties('Edge')
+        self.assertTrue(centers.shape == (6, 3) and inertias.shape == (6, 3, 3))
+        self.assertTrue(close(float(areas.sum()), 22.0) and
+                        close(float(lengths.sum()), 24.0))
+        self.assertTrue(close(list(centers.mean(axis=0)), (0.5, 1.0, 1.5)))
+
     def test_check(self):
         s1 = cm.box(1.0, 2.0, 3.0)
         self.assertTrue(s1.check())
@@ -931,6 +1519,29 @@ class TestSolid(unittest.TestCase):
         self.assertTrue(close(
                    s1.subshapes('Vertex')[i1].center(), (1.0, 2.0, 3.0)))
 
+    def test_nearest_ties(self):
+        s1 = cm.box(1.0, 1.0, 1.0)
+        # All 8 vertices tie; the 4th coordinate picks among the others
+        indices = s1.nearest('Vertex', [(0.5, 0.5, 0.5),
+                                        (0.5, 0.5, 0.5, 2),
+                                        (0.5, 0.5, 0.5, 3)])
+        self.assertTrue(indices == [0, 1, 2])
+
+    def test_nearest_distance(self):
+        s1 = cm.box(10.0, 1.0, 1.0)
+        # Close to the end of a long edge, but nearer a short edge center
+        pt = (9.0, -0.1, 0.95)
+        center_index = s1.nearest('Edge', [pt])[0]
+        distance_index = s1.nearest('Edge', [pt], mode='distance')[0]
+        self.assertTrue(close(s1.subcenters('Edge')[center_index],
+                              (10.0, 0.0, 0.5)))
+        self.assertTrue(close(s1.subcenters('Edge')[distance_index],
+                              (5.0, 0.0, 1.0)))
+        self.assertRaises(ValueError, s1.nearest, 'Edge', [pt], 1e-12,
+                          'bogus')
+        self.assertRaises(ValueError, cm._nearest_choice,
+                          np.array([], dtype=int), np.array([]), pt)
+
     def test_subtolerance(self):
         s1 = cm.box(1.0, 2.0, 3.0)
         subtols = s1.subtolerance()
@@ -949,6 +1560,47 @@ class TestSolid(unittest.TestCase):
         s1.to_stl('tmp.stl')
         self.assertTrue(True)
 
+    def test_to_stl_native(self):
+        s1 = cm.box(1.0, 2.0, 3.0)
+        s1.to_stl('tmp.stl', native=1, ascii_mode=0)
+        with open('tmp.stl', 'rb') as f:
+            data = f.read()
+        self.assertTrue(len(data) == 84 + 50 * 12)
+        records = np.frombuffer(data[84:], cm._stl_dtype)
+        self.assertTrue(close(float(records['vertices'].max()), 3.0))
+
+    def test_to_stl_native_deflection(self):
+        s1 = cm.sphere(1.0)
+        sizes = []
+        for options in ({'relative_mode': 0, 'abs_deflection': 0.2},
+                        {'relative_mode': 0, 'abs_deflection': 0.001},
+                        {'rel_deflection': 0.01},
+                        {'relative_mode': 0, 'abs_deflection':
+                         cm._default_deflection(s1.shape, 0.01)}):
+            s1.to_stl('tmp.stl', native=1, ascii_mode=0, **options)
+            sizes.append(os.path.getsize('tmp.stl'))
+        self.assertTrue(sizes[0] < sizes[1])
+        # A relative deflection is the absolute one for the shape size
+        self.assertTrue(sizes[2] == sizes[3])
+
+    def test_mesh_files(self):
+        m1 = cm.box(1.0, 2.0, 3.0).mesh(0.1)
+        f = io.BytesIO()
+        m1.to_ply(f)
+        data = f.getvalue()
+        self.assertTrue(b'element vertex 8\n' in data and
+                        b'element face 12\n' in data)
+        self.assertTrue(len(data.split(b'end_header\n')[1]) ==
+                        8 * 3 * 8 + 12 * 13)
+        f = io.BytesIO()
+        m1.to_obj(f)
+        lines = f.getvalue().splitlines()
+        self.assertTrue(len([l for l in lines if l.startswith(b'v ')]) == 8 and
+                        len([l for l in lines if l.startswith(b'f ')]) == 12)
+        f = io.BytesIO()
+        m1.to_stl(f, ascii=True)
+        self.assertTrue(f.getvalue().count(b'facet normal') == 12)
+
     # center skipped since verified above
 
     def test_fillet(self):
@@ -1022,6 +1674,39 @@ class TestSolid(unittest.TestCase):
         count2 = len(s3.subshapes('Face'))
         self.assertTrue(count1 == 7 and count2 == 6)
 
+    def test_simplify_pairwise(self):
+        s1 = cm.box(1.0, 1.0, 1.0)
+        s2 = s1.copy()
+        s2.translate((1.0, 0.5, 0.5))
+        s3 = s1 - s2
+        s3.simplify(method='pairwise')
+        self.assertTrue(len(s3.subshapes('Face')) == 6)
+
+    def test_simplify_groups(self):
+        ss = [cm.translated(cm.box(1.0, 1.0, 1.0), (float(i), 0.0, 0.0))
+              for i in range(3)]
+        s1 = cm.fuse_all(ss)
+        v1 = s1.volume()
+        self.assertTrue(len(s1.subshapes('Face')) == 14)
+        s1.simplify()
+        self.assertTrue(len(s1.subshapes('Face')) == 6)
+        self.assertTrue(close(s1.volume(), v1))
+
+    def test_simplify_stopat(self):
+        ss = [cm.translated(cm.box(1.0, 1.0, 1.0), (float(i), 0.0, 0.0))
+              for i in range(3)]
+        s1 = cm.fuse_all(ss)
+        s1.simplify(skip_edges=1, stopat=0)
+        self.assertTrue(len(s1.subshapes('Face')) == 14)
+        # Edges from stopat on are kept, as with pairwise
+        for stopat in range(0, 28, 3):
+            s2 = s1.copy()
+            s2.simplify(skip_edges=1, stopat=stopat)
+            s3 = s1.copy()
+            s3.simplify(skip_edges=1, stopat=stopat, method='pairwise')
+            self.assertEqual(len(s2.subshapes('Face')),
+                             len(s3.subshapes('Face')))
+
 
 # Edge Primitives
 class TestEdgePrimitives(unittest.TestCase):
@@ -1148,6 +1833,32 @@ class TestFacePrimitives(unittest.TestCase):
         f1 = cm.slice_(s1, z=1.0)[0]
         self.assertTrue(close(100.0 - math.pi * 2.5 ** 2, f1.area(), 0.001))
 
+    def test_slices(self):
+        b1 = cm.box(10.0, 10.0, 10.0)
+        b1.translate((-5.0, -5.0, 0.0))
+        c1 = cm.cylinder(2.5, 20.0)
+        c1.translate((0.0, 0.0, -5.0))
+        s1 = b1 - c1
+        layers = cm.slices(s1, 'z', np.linspace(1.0, 9.0, 5), faces=True)
+        self.assertEqual(len(layers), 5)
+        for layer in layers:
+            self.assertEqual(len(layer.polylines), 2)
+            for polyline in layer.polylines:
+                self.assertTrue((polyline[0] == polyline[-1]).all())
+                self.assertTrue(np.allclose(polyline[:, 2], layer.level))
+            self.assertEqual(len(layer.faces), 1)
+            self.assertTrue(close(100.0 - math.pi * 2.5 ** 2,
+                                  layer.faces[0].area(), 0.01))
+        # Outside the solid
+        self.assertEqual(cm.slices(s1, 'x', [6.0])[0].polylines, [])
+        # In a process pool
+        pooled = cm.slices(s1, 'z', np.linspace(1.0, 9.0, 5), workers=2)
+        for layer, pooled_layer in zip(layers, pooled):
+            self.assertEqual(len(layer.polylines),
+                             len(pooled_layer.polylines))
+            self.assertTrue(pooled_layer.faces is None)
+        self.assertRaises(ValueError, cm.slices, s1, 'w', [1.0])
+
 
 # Solid Primitives
 class TestSolidPrimitives(unittest.TestCase):
@@ -1242,6 +1953,8 @@ class TestSolidPrimitives(unittest.TestCase):
         s1 = cm.helical_solid(profile, 2.0, 1.0 / math.pi, 2)
         # empirical
         self.assertTrue(close(1.346, s1.volume(), 0.001))
+        s2 = cm.old_helical_solid(profile, 2.0, 1.0 / math.pi, 2)
+        self.assertTrue(close(s2.volume(), s1.volume(), 0.001))
 
 
 # Useful functions that return arbitrary shapes
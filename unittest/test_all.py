@@ -22,9 +22,10 @@ import sys
 import unittest
 
 import model_unittest
+import toolpath_unittest
 
 suite = unittest.TestSuite()
-suite.addTests([model_unittest.suite()])
+suite.addTests([model_unittest.suite(), toolpath_unittest.suite()])
 runner = unittest.TextTestRunner(verbosity=2)
 result = runner.run(suite)
 # Return a non zero exit code if any test fails
@@ -0,0 +1,123 @@
+# coding: utf-8
+
+"""
+Description
+-----------
+ccad unittest for toolpath.py.
+
+Test suite progresses exactly in the same order as toolpath.py code.
+
+License
+-------
+Distributed under the GNU LESSER GENERAL PUBLIC LICENSE Version 3.
+View LICENSE for details.
+
+Notes
+-----
+1. Make every Test class begin with the word Test to make suite work
+"""
+
+try:
+    import ccad.model as cm
+    import ccad.toolpath as ct
+except ImportError:
+    import model as cm
+    import toolpath as ct
+
+import io
+import sys
+import unittest
+
+import numpy as np
+
+
+def square(side, level=0.0, x=0.0, y=0.0):
+    return np.array([(x, y, level), (x + side, y, level),
+                     (x + side, y + side, level), (x, y + side, level),
+                     (x, y, level)])
+
+
+class TestHatch(unittest.TestCase):
+
+    def test_hatch(self):
+        lines = ct.hatch([square(10.0, 1.0)], 1.0, offset=0.5)
+        self.assertEqual(lines.shape, (10, 2, 3))
+        self.assertTrue(np.allclose(lines[:, :, 2], 1.0))
+        self.assertTrue(np.allclose(abs(lines[:, 1, 0] - lines[:, 0, 0]),
+                                    10.0))
+        # Consecutive lines run in opposite directions
+        self.assertTrue(lines[0, 1, 0] > lines[0, 0, 0])
+        self.assertTrue(lines[1, 1, 0] < lines[1, 0, 0])
+
+    def test_hatch_hole(self):
+        polylines = [square(10.0), square(2.0, x=4.0, y=4.0)]
+        lines = ct.hatch(polylines, 1.0, offset=0.5)
+        lengths = np.linalg.norm(lines[:, 1] - lines[:, 0], axis=1)
+        self.assertTrue(np.isclose(lengths.sum(), 100.0 - 4.0))
+        # Small chunks give the same lines
+        self.assertTrue(np.allclose(
+            ct.hatch(polylines, 1.0, offset=0.5, chunk_size=8), lines))
+
+    def test_hatch_angle(self):
+        lines = ct.hatch([square(10.0)], 0.5, angle=45.0, axis='z')
+        lengths = np.linalg.norm(lines[:, 1] - lines[:, 0], axis=1)
+        # Area covered by the lines
+        self.assertTrue(abs(0.5 * lengths.sum() - 100.0) < 2.0)
+        d = lines[:, 1] - lines[:, 0]
+        self.assertTrue(np.allclose(abs(d[:, 0]), abs(d[:, 1])))
+        self.assertRaises(ValueError, ct.hatch, [square(1.0)], 0.1, 0.0, 'w')
+
+
+class TestLayers(unittest.TestCase):
+
+    def test_layers(self):
+        s1 = cm.box(10.0, 10.0, 1.0)
+        layers = list(ct.layers(s1, 0.25, 0.5, perimeters=2, chunk_size=3))
+        self.assertEqual(len(layers), 4)
+        for layer in layers:
+            self.assertEqual(len(layer.perimeters), 2)
+            self.assertTrue(np.allclose(layer.perimeters[0][:, 2],
+                                        layer.level))
+            self.assertTrue(len(layer.infill) > 0)
+            # The infill stays inside the perimeters
+            self.assertTrue((layer.infill[:, :, :2] > 0.99).all() and
+                            (layer.infill[:, :, :2] < 9.01).all())
+
+    def test_write_gcode(self):
+        layers = [ct.Layer(0.5, [square(10.0, 0.5)],
+                           ct.hatch([square(10.0, 0.5)], 1.0, offset=0.5))]
+        f = io.BytesIO()
+        self.assertEqual(ct.write_gcode(layers, f, extrusion=0.1), 1)
+        gcode = f.getvalue().decode()
+        self.assertTrue(gcode.startswith('; ccad toolpath'))
+        self.assertEqual(gcode.count('\nG0 X'), 1 + 10)
+        self.assertTrue('G1 X10.0000 Y0.0000 Z0.5000 E1.00000' in gcode)
+
+    def test_write_npz(self):
+        layers = [ct.Layer(float(n), [square(10.0, n), square(2.0, n)],
+                           ct.hatch([square(10.0, n)], 1.0, offset=0.5))
+                  for n in range(3)]
+        f = io.BytesIO()
+        self.assertEqual(ct.write_npz(iter(layers), f), 3)
+        f.seek(0)
+        read = list(ct.read_npz(f))
+        self.assertEqual(len(read), 3)
+        for layer, read_layer in zip(layers, read):
+            self.assertEqual(layer.level, read_layer.level)
+            self.assertEqual(len(read_layer.perimeters), 2)
+            for p1, p2 in zip(layer.perimeters, read_layer.perimeters):
+                self.assertTrue(np.allclose(p1, p2))
+            self.assertTrue(np.allclose(layer.infill, read_layer.infill))
+
+
+def suite(tests=[]):
+    suite = unittest.TestSuite()
+    if len(tests) == 0:  # Do all
+        tests = filter(lambda x: x.startswith('Test'), globals())
+    for test in tests:
+        suite.addTest(unittest.makeSuite(globals()[test]))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite(sys.argv[1:]))